@@ -0,0 +1,110 @@
+from constants import AggregateConsts
+from collections import Counter
+import heapq
+
+try:
+    import numpy
+except ImportError:  # NumPy is optional, the histogram is counted by collections.Counter without it
+    numpy = None
+
+
+class TopRuns:
+    """This class keeps the K longest runs of a scan in a fixed size heap, so its memory depends only on K.
+    Runs of the same length are kept by their order in the file (the earlier ones win)."""
+
+    def __init__(self, k):
+        self.k = k
+        self.heap = []  # (length, -start, byte_value), the shortest kept run is at the top
+
+    def update(self, runs):
+        """This method adds the (start, length, byte_value) runs of the RunLengthEngine"""
+        heap, k = self.heap, self.k
+        for start, length, byte_value in runs:
+            entry = (length, -start, byte_value)
+            if len(heap) < k:
+                heapq.heappush(heap, entry)
+            elif entry > heap[0]:
+                heapq.heapreplace(heap, entry)
+
+    def runs(self):
+        """This method returns the kept runs from the longest to the shortest"""
+        return [(-negative_start, length, byte_value)
+                for length, negative_start, byte_value in sorted(self.heap, reverse=True)]
+
+
+class PayloadCounter:
+    """This class counts the payloads of the regex mode's matches with a bounded number of distinct payloads.
+    The counts are exact as long as there are at most `max_payloads` distinct payloads. Once there are more, it
+    turns into the Space-Saving algorithm: A new payload replaces the payload with the lowest count and inherits
+    its count (as its overcount), so every payload that appears more than total / max_payloads times is kept and
+    its count is at most its overcount too high."""
+
+    def __init__(self, max_payloads=AggregateConsts.DEFAULT_MAX_PAYLOADS):
+        self.max_payloads = max_payloads
+        self.counts = dict()
+        self.overcounts = dict()
+        self.heap = None  # (count, payload) of every kept payload, built once the counts become approximate
+
+    @property
+    def approximate(self):
+        """Whether there were more distinct payloads than max_payloads"""
+        return self.heap is not None
+
+    def update(self, matches):
+        """This method counts the payloads of the (offset, payload) matches"""
+        counts = self.counts
+        for _, payload in matches:
+            count = counts.get(payload)
+            if count is not None:
+                counts[payload] = count + 1
+            elif len(counts) < self.max_payloads:
+                counts[payload] = 1
+            else:
+                self._replace_minimum(payload)
+
+    def most_common(self):
+        """This method returns the (payload, count, overcount) of the kept payloads from the most common one"""
+        return [(payload, count, self.overcounts.get(payload, 0))
+                for payload, count in sorted(self.counts.items(), key=lambda item: -item[1])]
+
+    def _replace_minimum(self, payload):
+        """This method replaces the payload with the lowest count by the new payload. The counts in the heap
+        may be older than the real ones (they only grow), so they are refreshed until the top is real"""
+        if self.heap is None:
+            self.heap = [(count, kept_payload) for kept_payload, count in self.counts.items()]
+            heapq.heapify(self.heap)
+        while True:
+            count, kept_payload = self.heap[0]
+            current_count = self.counts[kept_payload]
+            if current_count == count:
+                break
+            heapq.heapreplace(self.heap, (current_count, kept_payload))
+        del self.counts[kept_payload]
+        self.overcounts.pop(kept_payload, None)
+        self.counts[payload] = count + 1
+        self.overcounts[payload] = count
+        heapq.heapreplace(self.heap, (count + 1, payload))
+
+
+class ByteHistogram:
+    """This class counts the values of all of the bytes of a file (256 bins) while it's being read"""
+
+    def __init__(self):
+        self.counts = [0] * AggregateConsts.HISTOGRAM_BINS
+        self.total = 0
+
+    def add(self, chunk):
+        """This method counts the bytes of the next chunk of the file"""
+        if numpy is not None:
+            chunk_counts = numpy.bincount(numpy.frombuffer(chunk, dtype=numpy.uint8),
+                                          minlength=AggregateConsts.HISTOGRAM_BINS).tolist()
+            self.counts = [count + chunk_count for count, chunk_count in zip(self.counts, chunk_counts)]
+        else:
+            for byte_value, chunk_count in Counter(chunk).items():
+                self.counts[byte_value] += chunk_count
+        self.total += len(chunk)
+
+    def reset(self):
+        """This method clears the counts"""
+        self.counts = [0] * AggregateConsts.HISTOGRAM_BINS
+        self.total = 0
@@ -0,0 +1,286 @@
+from constants import AutomatonConsts, EngineConsts
+from collections import deque
+from array import array
+import hashlib
+import tempfile
+import json
+import re
+import os
+
+
+class AhoCorasickAutomaton:
+    """This class counts the appearances of many bytes patterns in a single pass over the data.
+    It's a classic Aho-Corasick automaton compiled into a dense transitions table, so every byte of
+    the data costs a single table lookup no matter how many patterns there are.
+    Overlapping appearances are counted, E.g: b'AA' appears twice in b'AAA'.
+    A small patterns set is counted faster by a `find` loop per pattern (in C) than by a table lookup per byte (in
+    python), so its scanners use the table only for the bytes around the blocks' boundaries.
+    The automaton can be saved to a file and loaded again, so a big signature set is compiled once."""
+
+    def __init__(self, patterns, transitions=None, outputs=None, first_terminal_state=None):
+        """
+        :param patterns: An iterable of bytes patterns to count. Empty and duplicated patterns are ignored.
+        The rest of the arguments are used by `load` in order to restore a compiled automaton.
+        """
+        self.patterns = list(dict.fromkeys(pattern for pattern in patterns if pattern))
+        self.max_pattern_length = max((len(pattern) for pattern in self.patterns), default=0)
+        if transitions is None:
+            transitions, outputs, first_terminal_state = self._compile(self.patterns)
+        self.transitions = transitions
+        self.outputs = outputs
+        self.first_terminal_state = first_terminal_state
+        self.start_bytes_regex = self._compile_start_bytes_regex(self.patterns)
+        self.state_prefixes = None
+        if 0 < len(self.patterns) <= AutomatonConsts.MAX_FIND_PATTERNS:
+            self.state_prefixes = self._map_state_prefixes()
+
+    @classmethod
+    def from_mapper(cls, mapper, cache_dir=None):
+        """This method creates an automaton for the hex keys of the custom mode's mapper. In case a
+        cache directory is provided, the compiled automaton is loaded from it (or saved into it) by
+        a digest of the patterns set"""
+        patterns = [bytes.fromhex(hex_string) for hex_string in mapper]
+        if cache_dir is None:
+            return cls(patterns)
+        cache_path = os.path.join(cache_dir, cls.patterns_digest(patterns) + AutomatonConsts.FILE_EXTENSION)
+        if os.path.isfile(cache_path):
+            try:
+                return cls.load(cache_path)
+            except (ValueError, OSError):  # A corrupted or old cache file, we'll compile it again
+                pass
+        automaton = cls(patterns)
+        os.makedirs(cache_dir, exist_ok=True)
+        automaton.save(cache_path)
+        return automaton
+
+    @staticmethod
+    def patterns_digest(patterns):
+        """This method returns a digest that identifies a patterns set regardless of its order"""
+        digest = hashlib.sha256()
+        for pattern in sorted(set(patterns)):
+            digest.update(pattern.hex().encode() + b'\n')
+        return digest.hexdigest()
+
+    def scanner(self):
+        """This method returns a new scanner that counts the patterns in a stream of blocks"""
+        return AutomatonScanner(self)
+
+    def save(self, path):
+        """This method writes the compiled automaton into a file. The file contains a short json header
+        and the raw transitions table, so loading it doesn't execute any code. Every writer writes a temporary
+        file of its own, so processes that compile the same automaton at the same time don't collide, and a
+        reader never sees a partly written file"""
+        header = json.dumps({AutomatonConsts.STATES_COUNT: len(self.transitions) // AutomatonConsts.ALPHABET_SIZE,
+                             AutomatonConsts.PATTERNS: [pattern.hex() for pattern in self.patterns],
+                             AutomatonConsts.OUTPUTS: {str(state): pattern_ids
+                                                       for state, pattern_ids in self.outputs.items()},
+                             AutomatonConsts.FIRST_TERMINAL_STATE: self.first_terminal_state,
+                             AutomatonConsts.ITEM_SIZE: self.transitions.itemsize}).encode()
+        file_descriptor, temp_path = tempfile.mkstemp(suffix=AutomatonConsts.TEMP_SUFFIX,
+                                                      dir=os.path.dirname(path) or None)
+        try:
+            with open(file_descriptor, mode='wb') as f:
+                f.write(AutomatonConsts.MAGIC)
+                f.write(len(header).to_bytes(AutomatonConsts.HEADER_LENGTH_SIZE, 'little'))
+                f.write(header)
+                self.transitions.tofile(f)
+            os.replace(temp_path, path)  # The cache file is replaced atomically
+        except OSError:
+            self._remove(temp_path)
+            if not os.path.isfile(path):
+                raise
+            # Otherwise another process saved the same automaton at the same time, which is as good as ours
+        except BaseException:
+            self._remove(temp_path)
+            raise
+
+    @classmethod
+    def load(cls, path):
+        """This method loads an automaton that was written by `save`"""
+        with open(path, mode='rb') as f:
+            if f.read(len(AutomatonConsts.MAGIC)) != AutomatonConsts.MAGIC:
+                raise ValueError("{} is not a compiled automaton file".format(path))
+            header_length = int.from_bytes(f.read(AutomatonConsts.HEADER_LENGTH_SIZE), 'little')
+            header = json.loads(f.read(header_length))
+            transitions = array(AutomatonConsts.TRANSITIONS_TYPE)
+            if transitions.itemsize != header[AutomatonConsts.ITEM_SIZE]:
+                raise ValueError("{} was compiled on an incompatible platform".format(path))
+            transitions.frombytes(f.read())
+        states_count = header.get(AutomatonConsts.STATES_COUNT)
+        if not isinstance(states_count, int) or len(transitions) != states_count * AutomatonConsts.ALPHABET_SIZE:
+            raise ValueError("{} is truncated or corrupted".format(path))
+        outputs = {int(state): pattern_ids for state, pattern_ids in header[AutomatonConsts.OUTPUTS].items()}
+        return cls([bytes.fromhex(pattern) for pattern in header[AutomatonConsts.PATTERNS]],
+                   transitions, outputs, header[AutomatonConsts.FIRST_TERMINAL_STATE])
+
+    def _map_state_prefixes(self):
+        """This method returns a dictionary that maps every state to the patterns' prefix that it stands for (the
+        longest suffix of the data so far that can start a match)"""
+        state_prefixes = {0: b''}
+        for pattern in self.patterns:
+            state = 0
+            for length, byte in enumerate(pattern, 1):
+                state = self.transitions[state + byte]
+                state_prefixes[state] = pattern[:length]
+        return state_prefixes
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _compile_start_bytes_regex(patterns):
+        """This method returns a regex that finds the next byte that can start a pattern, or None in case
+        almost every byte can start a pattern. A scanner in the initial state uses it in order to skip (in C)
+        the bytes that can't be a part of any match"""
+        start_bytes = set(pattern[0] for pattern in patterns)
+        if not start_bytes or len(start_bytes) > AutomatonConsts.MAX_SKIPPABLE_START_BYTES:
+            return None
+        return re.compile(b'[' + b''.join(re.escape(bytes([byte])) for byte in sorted(start_bytes)) + b']')
+
+    @staticmethod
+    def _compile(patterns):
+        """This method compiles the patterns into the automaton tables.
+        The states are numbered so that all of the states that end a pattern (terminal states) come last,
+        and every state number is multiplied by 256. This way a scan step is `table[state + byte]` and
+        finding a match is a single comparison against the first terminal state.
+        :return: A tuple with the transitions table, a dictionary that maps every terminal state to
+        the patterns that end in it and the first terminal state"""
+        children, own_patterns = [dict()], [[]]
+        for pattern_id, pattern in enumerate(patterns):
+            state = 0
+            for byte in pattern:
+                if byte not in children[state]:
+                    children[state][byte] = len(children)
+                    children.append(dict())
+                    own_patterns.append([])
+                state = children[state][byte]
+            own_patterns[state].append(pattern_id)
+
+        # Breadth first order, every state's fail state is handled before the state itself
+        fail, order, matched_patterns = [0] * len(children), [0], [[] for _ in children]
+        queue = deque(children[0].values())
+        while queue:
+            state = queue.popleft()
+            order.append(state)
+            matched_patterns[state] = own_patterns[state] + matched_patterns[fail[state]]
+            for byte, child in children[state].items():
+                fail_state = fail[state]
+                while byte not in children[fail_state] and fail_state:
+                    fail_state = fail[fail_state]
+                fail[child] = children[fail_state].get(byte, 0)
+                queue.append(child)
+
+        non_terminal = [state for state in order if not matched_patterns[state]]
+        terminal = [state for state in order if matched_patterns[state]]
+        new_state = dict()
+        for index, state in enumerate(non_terminal + terminal):
+            new_state[state] = index * AutomatonConsts.ALPHABET_SIZE
+
+        transitions = array(AutomatonConsts.TRANSITIONS_TYPE, bytes(
+            len(children) * AutomatonConsts.ALPHABET_SIZE * array(AutomatonConsts.TRANSITIONS_TYPE).itemsize))
+        for state in order:
+            row = new_state[state]
+            if state:  # Missing transitions are taken from the fail state's (complete) row
+                fail_row = new_state[fail[state]]
+                transitions[row: row + AutomatonConsts.ALPHABET_SIZE] = \
+                    transitions[fail_row: fail_row + AutomatonConsts.ALPHABET_SIZE]
+            for byte, child in children[state].items():
+                transitions[row + byte] = new_state[child]
+        outputs = {new_state[state]: matched_patterns[state] for state in terminal}
+        first_terminal_state = len(non_terminal) * AutomatonConsts.ALPHABET_SIZE
+        return transitions, outputs, first_terminal_state
+
+
+class AutomatonScanner:
+    """This class runs an AhoCorasickAutomaton over a stream of blocks. It keeps the current state between
+    the blocks, so patterns that cross a block boundary are counted as well"""
+
+    def __init__(self, automaton, state=0, counts=None):
+        """
+        :param counts: The number of appearances of every pattern so far, by the patterns' order
+        """
+        self.automaton = automaton
+        self.state = state
+        self.counts = list(counts) if counts else [0] * len(automaton.patterns)
+
+    def feed(self, data):
+        """This method scans the next block of the stream. The data can be any bytes-like object that
+        yields integers (use a memoryview for mmap objects)"""
+        if self.automaton.state_prefixes is not None:
+            if isinstance(data, bytes):
+                self._feed_with_find(data)
+                return
+            for start in range(0, len(data), EngineConsts.BLOCK_SIZE):  # Copied in bounded parts, for `find`
+                self._feed_with_find(bytes(data[start: start + EngineConsts.BLOCK_SIZE]))
+            return
+        if self.automaton.start_bytes_regex is not None:
+            self._feed_with_skips(data)
+            return
+        transitions, first_terminal_state = self.automaton.transitions, self.automaton.first_terminal_state
+        visits, state = dict(), self.state
+        for byte in data:
+            state = transitions[state + byte]
+            if state >= first_terminal_state:
+                visits[state] = visits.get(state, 0) + 1
+        self.state = state
+        self._add_visits(visits)
+
+    def _feed_with_skips(self, data):
+        """This method is the same as `feed`, but whenever the automaton is back in its initial state it
+        jumps straight to the next byte that can start a pattern"""
+        transitions, first_terminal_state = self.automaton.transitions, self.automaton.first_terminal_state
+        search = self.automaton.start_bytes_regex.search
+        visits, state, position, data_length = dict(), self.state, 0, len(data)
+        while position < data_length:
+            if not state:
+                match = search(data, position)
+                if match is None:
+                    break
+                position = match.start()
+            state = transitions[state + data[position]]
+            position += 1
+            if state >= first_terminal_state:
+                visits[state] = visits.get(state, 0) + 1
+        self.state = state
+        self._add_visits(visits)
+
+    def _feed_with_find(self, data):
+        """This method is the same as `feed` for a small patterns set: every pattern is counted by a `find` loop.
+        A match that crosses the boundary starts in the prefix that the current state stands for, so only the
+        prefix and the first bytes of the data are searched for them. The new state is found by running the
+        table over the stream's last bytes (as many as the longest pattern)"""
+        automaton = self.automaton
+        prefix = automaton.state_prefixes[self.state]
+        boundary = prefix + data[:automaton.max_pattern_length - 1]
+        for pattern_id, pattern in enumerate(automaton.patterns):
+            count, location = 0, boundary.find(pattern)
+            while location != -1 and location < len(prefix):
+                count += location + len(pattern) > len(prefix)  # The matches inside the prefix were counted
+                location = boundary.find(pattern, location + 1)
+            location = data.find(pattern)
+            while location != -1:
+                count += 1
+                location = data.find(pattern, location + 1)
+            self.counts[pattern_id] += count
+        state, transitions = 0, automaton.transitions
+        for byte in (prefix + data[-automaton.max_pattern_length:])[-automaton.max_pattern_length:]:
+            state = transitions[state + byte]
+        self.state = state
+
+    def _add_visits(self, visits):
+        """This method adds the visits of the terminal states to the counts of the patterns that end in them"""
+        for state, state_visits in visits.items():
+            for pattern_id in self.automaton.outputs[state]:
+                self.counts[pattern_id] += state_visits
+
+    def reset_counts(self):
+        """This method forgets the matches that were counted so far but keeps the current state"""
+        self.counts = [0] * len(self.automaton.patterns)
+
+    def pattern_counts(self):
+        """This method returns a dictionary with the number of appearances of every pattern so far"""
+        return dict(zip(self.automaton.patterns, self.counts))
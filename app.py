@@ -1,7 +1,9 @@
-from arguments_parser import ArgParser
+from arguments_parser import ArgParser, BatchArgParser
+from batch_runner import BatchRunner
 from file_parser import FileParser
 from utils import PrintUtils
-from constants import Logs
+from constants import Logs, ArgsConsts
+import sys
 
 
 def execute():
@@ -16,7 +18,21 @@ def execute():
         print(PrintUtils.error_format(Logs.EXECUTION_FAILED_ERROR.format(err)))
 
 
+def execute_batch(argv):
+    """This function runs the non-interactive mode. It returns the exit code of the program"""
+    arguments, paths, jobs, output_path = BatchArgParser().parse_args(argv)
+    try:
+        batch_runner = BatchRunner(arguments, jobs, output_path)
+        if arguments[ArgsConsts.FOLLOW]:
+            batch_runner.follow(paths)  # Runs until it's interrupted
+        return 1 if batch_runner.run_and_report(paths) else 0
+    except KeyboardInterrupt:
+        return 130
+
+
 if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        sys.exit(execute_batch(sys.argv[1:]))
     results = execute()
     if results:
         print('\n')
@@ -1,5 +1,6 @@
-from constants import UIConsts, Logs, ArgsConsts
+from constants import UIConsts, Logs, ArgsConsts, BatchConsts, IncrementalConsts
 from utils import PrintUtils, ValidationUtil
+import argparse
 import json
 import os
 
@@ -75,8 +76,8 @@ class ArgParser:
     def _parse_regex_mode_arguments(self):
         """
         This method parses the relevant arguments for the regex mode.
-        The regex pattern must be in the following structure: 'relevant-byte-prefixXXXX'. E.g: \x01XX
-        (Requested bytes prefix and than X symbols in order to get the required structure and length)
+        The regex pattern is a sequence of bytes and X symbols (any byte). E.g: \x01XX or AB\x00XCX
+        (Requested bytes and X symbols in order to get the required structure and length)
         """
         regex_pattern = self._present_option_to_choose(ArgsConsts.REGEX_PATTERN)
         if not ValidationUtil.validate_regex_pattern(regex_pattern):  # Invalid regex pattern
@@ -147,3 +148,137 @@ class ArgParser:
         if ValidationUtil.validate_numeric_input(user_input, option_list):
             return option_list[int(user_input) - 1] if user_input.lower().strip() != UIConsts.HELP else user_input
         return None
+
+
+class BatchArgParser:
+    """This class parses the arguments of the non-interactive (batch) mode from the command line flags.
+    The arguments are validated with the same ValidationUtil rules as in the interactive mode, but without
+    any screen clears or pauses: an invalid argument stops the program with a non-zero exit code."""
+
+    def __init__(self):
+        self.parser = self._create_parser()
+
+    def parse_args(self, argv=None):
+        """
+        This method parses and validates the command line arguments.
+        :return: A tuple of (the FileParser arguments without the file path, the input paths, the number of jobs,
+        the output file path or None for the stdout)
+        """
+        namespace = self.parser.parse_args(argv)
+        ValidationUtil.interactive = False
+        mode = BatchConsts.MODES[namespace.mode]
+        arguments = {ArgsConsts.MODE: mode,
+                     ArgsConsts.WORKERS: namespace.workers,
+                     ArgsConsts.SHARD_SIZE: namespace.shard_size,
+                     ArgsConsts.CHUNK_SIZE: namespace.chunk_size,
+                     ArgsConsts.AUTOMATON_CACHE_DIR: namespace.automaton_cache_dir,
+                     ArgsConsts.USE_INDEX: namespace.index,
+                     ArgsConsts.INDEX_CACHE_DIR: namespace.index_cache_dir,
+                     ArgsConsts.INDEX_CACHE_SIZE: namespace.index_cache_size,
+                     ArgsConsts.INCREMENTAL: namespace.incremental or namespace.follow,
+                     ArgsConsts.CHECKPOINT_DIR: namespace.checkpoint_dir,
+                     ArgsConsts.FINAL: namespace.final,
+                     ArgsConsts.FOLLOW: namespace.follow,
+                     ArgsConsts.POLL_INTERVAL: namespace.poll_interval,
+                     ArgsConsts.METRICS_PATH: namespace.metrics,
+                     ArgsConsts.PROFILE_PATH: namespace.profile,
+                     ArgsConsts.TRACE_MEMORY: namespace.trace_memory,
+                     ArgsConsts.TOP_RUNS: namespace.top_runs,
+                     ArgsConsts.PAYLOAD_COUNTS: namespace.payload_counts,
+                     ArgsConsts.BYTE_HISTOGRAM: namespace.byte_histogram}
+        if mode == UIConsts.BASIC_MODE:
+            threshold = self._get_mode_argument(namespace.threshold, BatchConsts.THRESHOLD_FLAG, mode)
+            self._validate(ValidationUtil.validate_threshold(threshold))
+            arguments[ArgsConsts.THRESHOLD] = int(threshold)
+        elif mode == UIConsts.REGEX_MODE:
+            regex_pattern = self._get_mode_argument(namespace.pattern, BatchConsts.PATTERN_FLAG, mode)
+            self._validate(ValidationUtil.validate_regex_pattern(regex_pattern))
+            arguments[ArgsConsts.REGEX_PATTERN] = regex_pattern
+        else:  # Custom Mode
+            mapper = self._get_mapper(namespace)
+            self._validate(ValidationUtil.validate_mapper(mapper))
+            arguments[ArgsConsts.MAPPER] = json.loads(mapper.replace("\'", "\""))
+        self._reject_mode_argument(namespace.top_runs, BatchConsts.TOP_RUNS_FLAG, mode, UIConsts.BASIC_MODE)
+        self._reject_mode_argument(namespace.payload_counts, BatchConsts.PAYLOAD_COUNTS_FLAG, mode, UIConsts.REGEX_MODE)
+        if namespace.incremental or namespace.follow:  # An incremental scan outputs only the new records
+            for is_given, flag in ((namespace.top_runs is not None, BatchConsts.TOP_RUNS_FLAG),
+                                   (namespace.payload_counts is not None, BatchConsts.PAYLOAD_COUNTS_FLAG),
+                                   (namespace.byte_histogram, BatchConsts.BYTE_HISTOGRAM_FLAG)):
+                if is_given:
+                    self.parser.error(Logs.UNSUPPORTED_INCREMENTAL_ARGUMENT_LOG.format(flag))
+        if namespace.jobs < 1:
+            self.parser.error(Logs.INVALID_JOBS_LOG)
+        if any(value is not None and value < 1
+               for value in (namespace.workers, namespace.shard_size, namespace.chunk_size)):
+            self.parser.error(Logs.INVALID_SIZES_LOG)
+        if any(value is not None and value < 1 for value in (namespace.top_runs, namespace.payload_counts)):
+            self.parser.error(Logs.INVALID_AGGREGATE_LOG)
+        return arguments, namespace.paths, namespace.jobs, namespace.output
+
+    def _get_mode_argument(self, value, flag, mode):
+        """This method returns a mode specific argument or stops the program in case it's missing"""
+        if value is None:
+            self.parser.error(Logs.MISSING_MODE_ARGUMENT_LOG.format(mode, flag))
+        return value
+
+    def _reject_mode_argument(self, value, flag, mode, supported_mode):
+        """This method stops the program in case an argument of another mode is given"""
+        if value is not None and mode != supported_mode:
+            self.parser.error(Logs.UNSUPPORTED_MODE_ARGUMENT_LOG.format(flag, supported_mode))
+
+    def _get_mapper(self, namespace):
+        """This method returns the raw mapper string, either from the command line or from a file"""
+        if namespace.mapper_file is not None:
+            with open(namespace.mapper_file) as f:
+                return f.read()
+        return self._get_mode_argument(namespace.mapper, BatchConsts.MAPPER_FLAG, UIConsts.CUSTOM_MODE)
+
+    def _validate(self, is_valid):
+        """This method stops the program with the validator's error in case the argument is invalid"""
+        if not is_valid:
+            self.parser.error(ValidationUtil.last_error.strip())
+
+    @staticmethod
+    def _create_parser():
+        parser = argparse.ArgumentParser(description=BatchConsts.DESCRIPTION)
+        parser.add_argument('paths', nargs='+', help="Files, directories (scanned recursively) or glob patterns")
+        parser.add_argument('--mode', required=True, choices=sorted(BatchConsts.MODES))
+        parser.add_argument(BatchConsts.THRESHOLD_FLAG, help="The basic mode's threshold")
+        parser.add_argument(BatchConsts.PATTERN_FLAG, help="The regex mode's pattern, E.g: \\x00XX")
+        parser.add_argument(BatchConsts.MAPPER_FLAG, help="The custom mode's dictionary mapper (json)")
+        parser.add_argument('--mapper-file', help="A file that contains the custom mode's dictionary mapper")
+        parser.add_argument('--output', help="A file to write the NDJSON results to (the stdout by default)")
+        parser.add_argument('--jobs', type=int, default=os.cpu_count(), help="Number of files to scan concurrently")
+        parser.add_argument('--workers', type=int, default=1,
+                            help="Number of processes per file (sharded scan, or the decompression of a gzip "
+                                 "file's members)")
+        parser.add_argument('--shard-size', type=int, help="Bytes per shard of the sharded scan")
+        parser.add_argument('--chunk-size', type=int,
+                            help="Bytes per chunk of the regex and custom modes' reader (4MB by default)")
+        parser.add_argument('--automaton-cache-dir', help="A directory to cache the custom mode's automaton in")
+        parser.add_argument('--index', action='store_true',
+                            help="Answer the query from the file's index (and build it on the first scan)")
+        parser.add_argument('--index-cache-dir', help="The indexes directory (~/.cache/bytes-pattern-finder/indexes)")
+        parser.add_argument('--index-cache-size', type=int, help="The maximal size of the indexes directory in bytes")
+        parser.add_argument('--incremental', action='store_true',
+                            help="Scan only the bytes that were appended since the previous incremental scan")
+        parser.add_argument('--checkpoint-dir', help="The incremental scans' checkpoints directory "
+                                                     "(~/.cache/bytes-pattern-finder/checkpoints)")
+        parser.add_argument('--final', action='store_true',
+                            help="Report the pending results at the end of the files (once they are complete)")
+        parser.add_argument('--follow', action='store_true', help="Keep scanning the files incrementally as they grow")
+        parser.add_argument('--poll-interval', type=float, default=IncrementalConsts.DEFAULT_POLL_INTERVAL,
+                            help="Seconds between the polls of the follow mode")
+        parser.add_argument('--metrics', help="A file to write the scans' phase timings and counters to "
+                                              "(a Prometheus textfile in case it ends with .prom, json otherwise)")
+        parser.add_argument('--profile', help="A file to write the scans' cProfile statistics to (pstats format)")
+        parser.add_argument('--trace-memory', action='store_true',
+                            help="Measure the peak memory of the python allocations (slows the scans down)")
+        parser.add_argument(BatchConsts.TOP_RUNS_FLAG, type=int,
+                            help="Report only this number of the longest runs (basic mode)")
+        parser.add_argument(BatchConsts.PAYLOAD_COUNTS_FLAG, type=int, metavar='CAP',
+                            help="Report the counts of the payloads instead of the matches (regex mode), up to CAP "
+                                 "distinct payloads are counted exactly and the most common ones approximately beyond")
+        parser.add_argument(BatchConsts.BYTE_HISTOGRAM_FLAG, action='store_true',
+                            help="Add the counts of the 256 byte values of every file as its last record")
+        return parser
@@ -0,0 +1,206 @@
+from constants import ArgsConsts, BatchConsts, OutputConsts, MetricsConsts, Logs
+from file_parser import FileParser
+from incremental_scanner import IncrementalScanner
+from instrumentation import ScanMetrics
+from result_writer import NDJSONWriter
+from utils import ValidationUtil, ProgressBarUtil
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED, ALL_COMPLETED
+import multiprocessing
+import tempfile
+import glob
+import json
+import time
+import sys
+import os
+
+_worker_state = dict()  # The NDJSON writer of the current worker process (see _init_batch_worker)
+
+
+class BatchRunner:
+    """This class scans many files concurrently with a bounded pool of worker processes.
+    It gets the same arguments as FileParser (without the file path) and a list of files, directories
+    and glob patterns. The workers stream the records of every file as NDJSON lines straight into the
+    output (the stdout or a file), and the failures are reported to the stderr.
+    In case metrics or a profile were requested, every file is scanned with its own ScanMetrics and they are
+    merged into `metrics` (the workers' profiles are collected by run_and_report)"""
+
+    def __init__(self, arguments, jobs, output_path=None):
+        self.arguments = arguments
+        self.jobs = jobs
+        self.output_path = output_path
+        self.metrics = ScanMetrics() if _is_measured(arguments) else ScanMetrics.DISABLED
+        self.profile_paths = []
+
+    def run(self, paths):
+        """
+        This method scans all of the files and yields their summaries in the order they are completed.
+        Only a few files per job are submitted at once, so the memory doesn't grow with the number of files.
+        :rtype: Tuples of (file path, number of records, error), where either the count or the error is None
+        """
+        if self.output_path is not None:
+            open(self.output_path, mode='w').close()  # The workers append to it
+        pending = dict()
+        with ProcessPoolExecutor(max_workers=self.jobs, initializer=_init_batch_worker,
+                                 initargs=(self.output_path, multiprocessing.Lock())) as executor:
+            for file_path in self.expand_paths(paths):
+                if not ValidationUtil.validate_file_path(file_path):
+                    yield file_path, None, ValidationUtil.last_error.strip()
+                    continue
+                pending[executor.submit(_scan_file, self.arguments, file_path)] = file_path
+                if len(pending) >= self.jobs * BatchConsts.MAX_PENDING_FILES_PER_JOB:
+                    yield from self._collect(pending, FIRST_COMPLETED)
+            yield from self._collect(pending, ALL_COMPLETED)
+
+    def run_and_report(self, paths):
+        """This method scans all of the files and reports every failure to the stderr as a json line.
+        The merged metrics and profiles of the scans are written in case they were requested.
+        :return: The number of files that failed"""
+        scanned, failed = 0, 0
+        try:
+            for file_path, _, error in self.run(paths):
+                scanned += 1
+                if error is not None:
+                    failed += 1
+                    _report_error(file_path, error)
+            self._write_metrics()
+        finally:
+            for profile_path in self.profile_paths:
+                if os.path.isfile(profile_path):
+                    os.remove(profile_path)
+        print(Logs.BATCH_SUMMARY_LOG.format(scanned, failed), file=sys.stderr)
+        return failed
+
+    def follow(self, paths):
+        """This method keeps scanning the files incrementally as they grow, until it's interrupted. Every poll
+        expands the paths again (so new files in the directories are picked up as well) and scans only the bytes
+        that were appended to every file since the previous poll"""
+        ProgressBarUtil.enabled = False
+        stream = sys.stdout if self.output_path is None else open(self.output_path, mode='w')
+        writer, scanners = NDJSONWriter(stream), dict()
+        try:
+            while True:
+                for file_path in self.expand_paths(paths):
+                    if not os.path.isfile(file_path):
+                        continue
+                    if file_path not in scanners:
+                        scanners[file_path] = IncrementalScanner(**dict(self.arguments,
+                                                                        **{ArgsConsts.FILE_PATH: file_path}))
+                    try:
+                        writer.write_file_records(file_path, self.arguments[ArgsConsts.MODE],
+                                                  scanners[file_path].poll())
+                    except Exception as err:
+                        _report_error(file_path, str(err))
+                    if scanners[file_path].restarted:
+                        _report_error(file_path, Logs.FILE_RESTARTED_LOG)
+                time.sleep(self.arguments[ArgsConsts.POLL_INTERVAL])
+        finally:
+            writer.flush()
+            if stream is not sys.stdout:
+                stream.close()
+
+    @classmethod
+    def expand_paths(cls, paths):
+        """This method yields the files of the input paths: Files as is, directories recursively (in a sorted
+        order) and glob patterns (`**` is supported) by their matches"""
+        for path in paths:
+            if glob.escape(path) != path and not os.path.exists(path):
+                for match in sorted(glob.glob(path, recursive=True)):
+                    yield from cls._expand_path(match)
+            else:
+                yield from cls._expand_path(path)
+
+    @staticmethod
+    def _expand_path(path):
+        """This method yields the path itself or all of the files under it in case it's a directory"""
+        if not os.path.isdir(path):
+            yield path
+            return
+        for root, directories, files in os.walk(path):
+            directories.sort()
+            for file_name in sorted(files):
+                yield os.path.join(root, file_name)
+
+    def _collect(self, pending, return_when):
+        """This method waits for the submitted files and yields the results of the completed ones. The metrics
+        of the files are merged and the paths of their profiles are kept for run_and_report"""
+        done, _ = wait(pending, return_when=return_when)
+        for future in done:
+            file_path = pending.pop(future)
+            try:
+                count, metrics = future.result()
+            except Exception as err:
+                yield file_path, None, str(err)
+                continue
+            if metrics is not None:
+                self.metrics.merge(metrics)
+                self.metrics.add(MetricsConsts.FILES)
+                if metrics.get(MetricsConsts.PROFILE_PATH):
+                    self.profile_paths.append(metrics[MetricsConsts.PROFILE_PATH])
+            yield file_path, count, None
+
+    def _write_metrics(self):
+        """This method writes the merged metrics and profiles into the requested paths"""
+        if self.arguments.get(ArgsConsts.METRICS_PATH):
+            self.metrics.write(self.arguments[ArgsConsts.METRICS_PATH])
+        if self.arguments.get(ArgsConsts.PROFILE_PATH):
+            self.metrics.dump_profile(self.arguments[ArgsConsts.PROFILE_PATH], self.profile_paths)
+
+
+def _init_batch_worker(output_path, lock):
+    """This function prepares a worker process: It opens the shared output and turns the progress bar off,
+    since it would only garble the batch output"""
+    ProgressBarUtil.enabled = False
+    stream = sys.stdout if output_path is None else open(output_path, mode='a')
+    _worker_state[BatchConsts.WRITER] = NDJSONWriter(stream, lock)
+
+
+def _scan_file(arguments, file_path):
+    """This function scans a single file in a worker process and streams its records to the output.
+    An incremental scan reads only the bytes that were appended since the file's previous incremental scan.
+    :return: A pair of (the number of records, the scan's metrics as a dictionary or None in case they weren't
+    requested). The profile of the scan is saved into a temporary file whose path is in the metrics"""
+    metrics = None
+    if _is_measured(arguments):
+        metrics = ScanMetrics(trace_memory=arguments.get(ArgsConsts.TRACE_MEMORY),
+                              profile=bool(arguments.get(ArgsConsts.PROFILE_PATH)))
+    arguments = dict(arguments, **{ArgsConsts.FILE_PATH: file_path, ArgsConsts.METRICS: metrics})
+    writer = _worker_state[BatchConsts.WRITER]
+    writer.metrics = metrics or ScanMetrics.DISABLED
+    try:
+        count = _write_file_records(writer, arguments, file_path)
+    finally:
+        writer.metrics = ScanMetrics.DISABLED
+    if metrics is None:
+        return count, None
+    metrics_dict = metrics.to_dict()
+    if metrics.profile:
+        file_descriptor, metrics_dict[MetricsConsts.PROFILE_PATH] = tempfile.mkstemp(MetricsConsts.PROFILE_EXTENSION)
+        os.close(file_descriptor)
+        metrics.dump_profile(metrics_dict[MetricsConsts.PROFILE_PATH])
+    return count, metrics_dict
+
+
+def _write_file_records(writer, arguments, file_path):
+    """This function scans the file (incrementally or fully) and writes its records.
+    :return: The number of records"""
+    if not arguments.get(ArgsConsts.INCREMENTAL):
+        file_parser = FileParser(**arguments)
+        return writer.write_file_records(file_path, file_parser.mode, file_parser.iter_records())
+    scanner = IncrementalScanner(**arguments)
+    with scanner.file_parser.metrics.session():
+        count = writer.write_file_records(file_path, scanner.file_parser.mode,
+                                          scanner.scan(arguments.get(ArgsConsts.FINAL)))
+    scanner.file_parser.metrics.add(MetricsConsts.RESULTS, count)
+    if scanner.restarted:
+        _report_error(file_path, Logs.FILE_RESTARTED_LOG)
+    return count
+
+
+def _is_measured(arguments):
+    """This function returns whether the batch arguments request metrics or a profile of the scans"""
+    return bool(arguments.get(ArgsConsts.METRICS_PATH) or arguments.get(ArgsConsts.PROFILE_PATH))
+
+
+def _report_error(file_path, error):
+    """This function reports a file's failure (or warning) to the stderr as a json line"""
+    print(json.dumps({OutputConsts.FILE: file_path, OutputConsts.ERROR: error}), file=sys.stderr)
@@ -0,0 +1,208 @@
+from constants import ArgsConsts, UIConsts, BenchmarkConsts, Logs
+from file_parser import FileParser
+from utils import ProgressBarUtil
+import tracemalloc
+import argparse
+import platform
+import tempfile
+import random
+import shutil
+import json
+import time
+import sys
+import os
+
+
+class CorpusGenerator:
+    """This class generates reproducible synthetic binary files (the same seed and size always give the same
+    bytes) that stress the different paths of the modes:
+    - random: uniformly random bytes (almost no runs or matches, the raw scanning speed)
+    - runs: runs of random bytes with random lengths (many basic mode results)
+    - prefix: random bytes with the regex pattern's prefix every ~64 bytes (many regex mode matches)
+    - signatures: random bytes with the custom mode's keys every ~256 bytes (many custom mode matches)"""
+
+    def __init__(self, size, seed=BenchmarkConsts.DEFAULT_SEED):
+        self.size = size
+        self.seed = seed
+
+    def generate(self, corpus, path):
+        """This method writes the corpus of the given kind into the path"""
+        rng = random.Random("{}-{}".format(self.seed, corpus))
+        if corpus == BenchmarkConsts.RUNS_CORPUS:
+            data = self._runs(rng)
+        elif corpus == BenchmarkConsts.PREFIX_CORPUS:
+            data = self._scatter(rng, [BenchmarkConsts.PREFIX], BenchmarkConsts.PREFIX_SPACING)
+        elif corpus == BenchmarkConsts.SIGNATURE_CORPUS:
+            data = self._scatter(rng, [bytes.fromhex(key) for key in BenchmarkConsts.MAPPER],
+                                 BenchmarkConsts.SIGNATURE_SPACING)
+        else:  # Random corpus
+            data = self._random_bytes(rng, self.size)
+        with open(path, mode='wb') as f:
+            f.write(data)
+        return path
+
+    @staticmethod
+    def _random_bytes(rng, size):
+        return rng.getrandbits(8 * size).to_bytes(size, 'little') if size else b''
+
+    def _runs(self, rng):
+        """This method returns runs of random bytes, the lengths are log-uniform up to MAX_RUN_LENGTH"""
+        data, size = bytearray(), 0
+        while size < self.size:
+            run_length = int(BenchmarkConsts.MAX_RUN_LENGTH ** rng.random())
+            data += bytes((rng.getrandbits(8),)) * run_length
+            size += run_length
+        return bytes(data[:self.size])
+
+    def _scatter(self, rng, needles, spacing):
+        """This method returns random bytes with a random needle at a random position in every spacing bytes"""
+        data = bytearray(self._random_bytes(rng, self.size))
+        for start in range(0, self.size - spacing, spacing):
+            needle = rng.choice(needles)
+            position = start + rng.randrange(spacing - len(needle))
+            data[position: position + len(needle)] = needle
+        return bytes(data)
+
+
+class Benchmark:
+    """This class measures FileParser on the synthetic corpus. Every case is a (mode, corpus, variant) triplet,
+    where the variant is the engine: a serial scan, a sharded scan on all of the cores or an indexed query (the
+    index is built by a warm-up run that isn't measured). A case runs `repeat` times and reports its throughput
+    (by the median run), the latency percentiles and the peak memory of the python allocations (measured by an
+    extra run under tracemalloc, which is too slow to be timed)"""
+    MODES = {'basic': {ArgsConsts.MODE: UIConsts.BASIC_MODE, ArgsConsts.THRESHOLD: BenchmarkConsts.THRESHOLD},
+             'regex': {ArgsConsts.MODE: UIConsts.REGEX_MODE, ArgsConsts.REGEX_PATTERN: BenchmarkConsts.REGEX_PATTERN},
+             'custom': {ArgsConsts.MODE: UIConsts.CUSTOM_MODE, ArgsConsts.MAPPER: BenchmarkConsts.MAPPER}}
+
+    def __init__(self, size, repeat=BenchmarkConsts.DEFAULT_REPEAT, seed=BenchmarkConsts.DEFAULT_SEED,
+                 corpus_dir=None):
+        self.size = size
+        self.repeat = repeat
+        self.seed = seed
+        self.corpus_dir = corpus_dir
+
+    def run(self, modes=None, corpora=None, variants=None):
+        """This method runs all of the cases and returns the report (a json serializable dictionary)"""
+        ProgressBarUtil.enabled = False
+        work_dir = tempfile.mkdtemp()
+        corpus_dir = self.corpus_dir or work_dir
+        os.makedirs(corpus_dir, exist_ok=True)
+        results = dict()
+        try:
+            generator = CorpusGenerator(self.size, self.seed)
+            for corpus in corpora or BenchmarkConsts.CORPORA:
+                path = os.path.join(corpus_dir, "{}-{}-{}.bin".format(corpus, self.size, self.seed))
+                if not os.path.isfile(path):
+                    generator.generate(corpus, path)
+                for mode in modes or self.MODES:
+                    for variant in variants or BenchmarkConsts.VARIANTS:
+                        if variant == BenchmarkConsts.INDEXED_VARIANT and mode == 'custom':
+                            continue  # There is no index for the custom mode
+                        arguments = self._arguments(mode, variant, path, os.path.join(work_dir, 'indexes'))
+                        results['/'.join((mode, corpus, variant))] = self._measure(arguments)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        return {BenchmarkConsts.META: self._meta(), BenchmarkConsts.RESULTS: results}
+
+    @staticmethod
+    def compare(report, baseline, max_regression=BenchmarkConsts.DEFAULT_MAX_REGRESSION):
+        """This method returns the list of the regressions of the report: the cases whose throughput is lower than
+        the baseline's by more than max_regression (a fraction). Cases that are missing in either are skipped"""
+        regressions = []
+        for case, result in sorted(report[BenchmarkConsts.RESULTS].items()):
+            baseline_result = baseline[BenchmarkConsts.RESULTS].get(case)
+            if baseline_result is None:
+                continue
+            speed = result[BenchmarkConsts.MB_PER_SECOND]
+            baseline_speed = baseline_result[BenchmarkConsts.MB_PER_SECOND]
+            if speed < baseline_speed * (1 - max_regression):
+                regressions.append(Logs.BENCHMARK_REGRESSION_LOG.format(case, speed, baseline_speed))
+        return regressions
+
+    def _arguments(self, mode, variant, path, index_cache_dir):
+        arguments = dict(self.MODES[mode], **{ArgsConsts.FILE_PATH: path})
+        if variant == BenchmarkConsts.SHARDED_VARIANT:
+            arguments[ArgsConsts.WORKERS] = os.cpu_count()
+            arguments[ArgsConsts.SHARD_SIZE] = max(1, self.size // os.cpu_count())
+        elif variant == BenchmarkConsts.INDEXED_VARIANT:
+            arguments[ArgsConsts.USE_INDEX] = True
+            arguments[ArgsConsts.INDEX_CACHE_DIR] = index_cache_dir
+        return arguments
+
+    def _measure(self, arguments):
+        """This method runs a single case and returns its measurements"""
+        FileParser(**arguments).parse_file_and_calculate()  # Warm up (the OS cache, the index)
+        latencies = []
+        for _ in range(self.repeat):
+            start_time = time.perf_counter()
+            FileParser(**arguments).parse_file_and_calculate()
+            latencies.append(time.perf_counter() - start_time)
+        tracemalloc.start()
+        try:
+            FileParser(**arguments).parse_file_and_calculate()
+            peak_memory = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        latencies.sort()
+        result = {BenchmarkConsts.MB_PER_SECOND: self.size / BenchmarkConsts.BYTES_PER_MB /
+                  self._percentile(latencies, 50), BenchmarkConsts.PEAK_MEMORY: peak_memory}
+        for percentile in BenchmarkConsts.PERCENTILES:
+            result[BenchmarkConsts.LATENCY.format(percentile)] = self._percentile(latencies, percentile)
+        return result
+
+    @staticmethod
+    def _percentile(sorted_values, percentile):
+        """This method returns the nearest-rank percentile of the sorted values"""
+        rank = max(1, -(-percentile * len(sorted_values) // 100))
+        return sorted_values[rank - 1]
+
+    def _meta(self):
+        try:
+            import numpy
+            numpy_version = numpy.__version__
+        except ImportError:
+            numpy_version = None
+        return {'size': self.size, 'repeat': self.repeat, 'seed': self.seed, 'python': platform.python_version(),
+                'numpy': numpy_version, 'cpu_count': os.cpu_count(), 'platform': platform.platform()}
+
+
+def main(argv=None):
+    """This function runs the benchmark from the command line. It returns the exit code: 1 in case of regressions
+    compared to the baseline"""
+    parser = argparse.ArgumentParser(description=BenchmarkConsts.DESCRIPTION)
+    parser.add_argument('--size-mb', type=float, default=BenchmarkConsts.DEFAULT_SIZE_MB, help="The size of every file")
+    parser.add_argument('--repeat', type=int, default=BenchmarkConsts.DEFAULT_REPEAT, help="Measured runs per case")
+    parser.add_argument('--seed', type=int, default=BenchmarkConsts.DEFAULT_SEED, help="The corpus' random seed")
+    parser.add_argument('--modes', nargs='+', choices=sorted(Benchmark.MODES))
+    parser.add_argument('--corpora', nargs='+', choices=BenchmarkConsts.CORPORA)
+    parser.add_argument('--variants', nargs='+', choices=BenchmarkConsts.VARIANTS)
+    parser.add_argument('--corpus-dir', help="Keep the generated files in this directory and reuse them")
+    parser.add_argument('--output', help="A file to save the json report to")
+    parser.add_argument('--baseline', help="A saved json report to compare against")
+    parser.add_argument('--max-regression', type=float, default=BenchmarkConsts.DEFAULT_MAX_REGRESSION,
+                        help="The allowed throughput drop compared to the baseline (a fraction, 0.1 by default)")
+    namespace = parser.parse_args(argv)
+    if namespace.repeat < 1 or namespace.size_mb <= 0:
+        parser.error("The size and the number of repeats must be positive")
+    benchmark = Benchmark(int(namespace.size_mb * BenchmarkConsts.BYTES_PER_MB), namespace.repeat, namespace.seed,
+                          namespace.corpus_dir)
+    report = benchmark.run(namespace.modes, namespace.corpora, namespace.variants)
+    for case, result in report[BenchmarkConsts.RESULTS].items():
+        print("{:<32} {:>9.1f} MB/s  p50 {:.4f}s  p99 {:.4f}s  peak {:.1f} MB".format(
+            case, result[BenchmarkConsts.MB_PER_SECOND], result[BenchmarkConsts.LATENCY.format(50)],
+            result[BenchmarkConsts.LATENCY.format(99)],
+            result[BenchmarkConsts.PEAK_MEMORY] / BenchmarkConsts.BYTES_PER_MB))
+    if namespace.output:
+        with open(namespace.output, mode='w') as f:
+            json.dump(report, f, indent=2)
+    if namespace.baseline:
+        with open(namespace.baseline) as f:
+            regressions = Benchmark.compare(report, json.load(f), namespace.max_regression)
+        for regression in regressions:
+            print(regression, file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
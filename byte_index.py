@@ -0,0 +1,195 @@
+from constants import IndexConsts, EngineConsts, AutomatonConsts
+from collections import Counter
+from functools import partial
+from array import array
+import mmap
+
+try:
+    import numpy
+except ImportError:  # NumPy is optional, the pure python build is slower
+    numpy = None
+
+
+class BytePositionIndex:
+    """This class is a persistent positional index of a file for the regex mode.
+    For every one of the 256 byte values it holds a compact sorted array of the offsets where it appears, plus
+    the offsets of the most common 2-bytes sequences (the n-grams table). It's built in two passes over the file
+    that write the offsets to the index block by block, stored in an IndexCache and memory-mapped on reuse.
+    A regex query jumps straight to the offsets of the pattern's first literal bytes (an n-gram if it has one)
+    and reads only the candidates' bytes, instead of scanning the whole file.
+    Please note that the index is about 4 times the size of the file (8 times for files over 4GB), so a file whose
+    index is larger than the whole cache isn't indexed."""
+    KIND = 'bytes'
+
+    def __init__(self, index_path, header, payload_offset):
+        self.position_type = header[IndexConsts.POSITION_TYPE]
+        self.ngrams = {bytes.fromhex(ngram): count for ngram, count in header[IndexConsts.NGRAMS]}
+        with open(index_path, mode='rb') as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self.buffer)
+        counts_end = payload_offset + IndexConsts.OFFSET_SIZE * AutomatonConsts.ALPHABET_SIZE
+        self.counts = view[payload_offset: counts_end].cast(IndexConsts.OFFSET_TYPE)
+        positions = view[counts_end:].cast(self.position_type)
+        self.views = [self.counts, positions]
+        self.byte_positions, start = [], 0
+        for count in self.counts:
+            self.byte_positions.append(positions[start: start + count])
+            start += count
+        self.ngram_positions = dict()
+        for ngram, count in self.ngrams.items():
+            self.ngram_positions[ngram] = positions[start: start + count]
+            start += count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @classmethod
+    def load(cls, file_path, cache):
+        """This method returns the valid index of the file from the cache or None in case there isn't any"""
+        found = cache.lookup(file_path, cls.KIND)
+        return cls(*found) if found is not None else None
+
+    @classmethod
+    def load_or_build(cls, file_path, cache):
+        """This method returns the file's index, it scans the file and stores the index in case it's missing"""
+        index = cls.load(file_path, cache)
+        if index is None:
+            cls.build(file_path, cache)
+            index = cls.load(file_path, cache)
+        return index
+
+    def candidates(self, literal_prefix):
+        """This method returns the sorted offsets where the literal prefix may start: the offsets of its first
+        2 bytes in case they are in the n-grams table, otherwise the offsets of its first byte"""
+        return self.ngram_positions.get(literal_prefix[:2], self.byte_positions[literal_prefix[0]])
+
+    def iter_matches(self, bytes_pattern, buffer):
+        """
+        This method yields the matches of the pattern in the indexed file.
+        :param bytes_pattern: The compiled BytesPattern
+        :param buffer: The file's content (an mmap), only the candidates' bytes are read from it
+        :rtype: Tuples of (offset, length) in the file's order
+        """
+        match_at, limit = bytes_pattern.match_at, len(buffer)
+        for literal_position in self.candidates(bytes_pattern.literal_prefix):
+            match = match_at(buffer, literal_position, limit)
+            if match is not None:
+                yield match
+
+    def close(self):
+        """This method releases the index's memory map"""
+        for view in self.byte_positions + list(self.ngram_positions.values()) + self.views:
+            view.release()
+        self.buffer.close()
+
+    @classmethod
+    def build(cls, file_path, cache):
+        """This method scans the file twice and stores its index in the cache: the first pass counts the byte
+        values and the 2-bytes sequences, so the place of every value's positions in the index is known, and the
+        second pass writes the positions of every block straight to their places. So only a single block's
+        positions are in memory at a time. An index that is larger than the whole cache isn't built, and in case its
+        positions alone are too large the file isn't read at all"""
+        signature = cache.file_signature(file_path)
+        position_type = IndexConsts.POSITION_TYPE_32 \
+            if signature[IndexConsts.SIZE] <= IndexConsts.MAX_32_BIT_POSITION else IndexConsts.OFFSET_TYPE
+        position_size = array(position_type).itemsize
+        if IndexConsts.OFFSET_SIZE * AutomatonConsts.ALPHABET_SIZE + signature[IndexConsts.SIZE] * position_size > \
+                cache.max_size:  # It can't fit in the cache, so the file isn't even read
+            return
+        with open(file_path, mode='rb') as f:
+            blocks = iter(partial(f.read, EngineConsts.BLOCK_SIZE), b'')
+            counts, ngram_counts = cls._count_numpy(blocks) if numpy is not None else cls._count(blocks)
+        ngrams = [(ngram, count) for ngram, count in ngram_counts.most_common(IndexConsts.NGRAMS_COUNT) if count > 1]
+        region_sizes = [count * position_size for count in counts + [count for _, count in ngrams]]
+
+        def write_payload(f):
+            f.write(array(IndexConsts.OFFSET_TYPE, counts))
+            region_offsets = [f.tell()]
+            for size in region_sizes[:-1]:
+                region_offsets.append(region_offsets[-1] + size)
+            with open(file_path, mode='rb') as indexed_file:
+                blocks = iter(partial(indexed_file.read, EngineConsts.BLOCK_SIZE), b'')
+                iter_positions = cls._iter_positions_numpy if numpy is not None else cls._iter_positions
+                for region, positions in iter_positions(blocks, position_type, [ngram for ngram, _ in ngrams]):
+                    f.seek(region_offsets[region])
+                    region_offsets[region] += f.write(positions)
+            return cache.file_signature(file_path) == signature  # The file didn't change during the scan
+
+        cache.store_streamed(file_path, cls.KIND, signature,
+                             {IndexConsts.POSITION_TYPE: position_type,
+                              IndexConsts.NGRAMS: [[ngram.hex(), count] for ngram, count in ngrams]},
+                             IndexConsts.OFFSET_SIZE * AutomatonConsts.ALPHABET_SIZE + sum(region_sizes), write_payload)
+
+    @staticmethod
+    def _count(blocks):
+        """This method counts the byte values and the 2-bytes sequences without NumPy"""
+        counts, ngram_counts, previous_block = Counter(), Counter(), b''
+        for block in blocks:
+            counts.update(block)
+            pairs = previous_block[-1:] + block
+            ngram_counts.update(pairs[index: index + 2] for index in range(len(pairs) - 1))
+            previous_block = block
+        return [counts[byte_value] for byte_value in range(AutomatonConsts.ALPHABET_SIZE)], ngram_counts
+
+    @staticmethod
+    def _count_numpy(blocks):
+        """This method counts the byte values and the 2-bytes sequences with NumPy"""
+        counts = numpy.zeros(AutomatonConsts.ALPHABET_SIZE, dtype=numpy.int64)
+        ngram_counts = numpy.zeros(AutomatonConsts.ALPHABET_SIZE ** 2, dtype=numpy.int64)
+        previous_byte = None
+        for block in blocks:
+            values = numpy.frombuffer(block, dtype=numpy.uint8)
+            counts += numpy.bincount(values, minlength=AutomatonConsts.ALPHABET_SIZE)
+            pairs = values.astype(numpy.uint16)
+            if previous_byte is not None:
+                pairs = numpy.concatenate(([previous_byte], pairs))
+            ngram_counts += numpy.bincount((pairs[:-1] << 8) | pairs[1:], minlength=AutomatonConsts.ALPHABET_SIZE ** 2)
+            previous_byte = values[-1]
+        return counts.tolist(), Counter({bytes(divmod(ngram, AutomatonConsts.ALPHABET_SIZE)): int(ngram_counts[ngram])
+                                         for ngram in numpy.flatnonzero(ngram_counts).tolist()})
+
+    @staticmethod
+    def _iter_positions(blocks, position_type, ngrams):
+        """This method yields the (region, positions) of every block without NumPy: the region of a byte value is
+        the value itself, and the region of an n-gram is the number of byte values plus its index in the table"""
+        base, previous_block = 0, b''
+        for block in blocks:
+            for byte_value in sorted(set(block)):
+                positions, byte = array(position_type), EngineConsts.SINGLE_BYTES[byte_value]
+                location = block.find(byte)
+                while location != -1:
+                    positions.append(base + location)
+                    location = block.find(byte, location + 1)
+                yield byte_value, positions
+            pairs, pairs_base = previous_block[-1:] + block, base - len(previous_block[-1:])
+            for ngram_index, ngram in enumerate(ngrams):
+                positions, location = array(position_type), pairs.find(ngram)
+                while location != -1:
+                    positions.append(pairs_base + location)
+                    location = pairs.find(ngram, location + 1)
+                yield AutomatonConsts.ALPHABET_SIZE + ngram_index, positions
+            base, previous_block = base + len(block), block
+
+    @staticmethod
+    def _iter_positions_numpy(blocks, position_type, ngrams):
+        """This method yields the (region, positions) of every block (see _iter_positions) with a stable sort of
+        the block by the byte values"""
+        dtype = numpy.uint32 if position_type == IndexConsts.POSITION_TYPE_32 else numpy.uint64
+        base, previous_byte = 0, None
+        for block in blocks:
+            values = numpy.frombuffer(block, dtype=numpy.uint8)
+            order = (numpy.argsort(values, kind='stable') + base).astype(dtype)
+            counts = numpy.bincount(values, minlength=AutomatonConsts.ALPHABET_SIZE)
+            bounds = numpy.concatenate(([0], numpy.cumsum(counts)))
+            for byte_value in numpy.flatnonzero(counts).tolist():
+                yield byte_value, order[bounds[byte_value]: bounds[byte_value + 1]]
+            pairs, pairs_base = values, base
+            if previous_byte is not None:
+                pairs, pairs_base = numpy.concatenate(([previous_byte], values)), base - 1
+            for ngram_index, ngram in enumerate(ngrams):
+                found = numpy.flatnonzero((pairs[:-1] == ngram[0]) & (pairs[1:] == ngram[1]))
+                yield AutomatonConsts.ALPHABET_SIZE + ngram_index, (found + pairs_base).astype(dtype)
+            base, previous_byte = base + len(block), values[-1]
@@ -0,0 +1,127 @@
+from constants import EngineConsts, MetricsConsts, Logs
+from instrumentation import ScanMetrics
+from compressed_input import CompressedInput
+
+
+class ScanCancelledError(Exception):
+    """This exception stops a scan whose cancel event was set (see ChunkedReader)"""
+
+    def __init__(self, message=Logs.SCAN_CANCELLED_LOG):
+        super().__init__(message)
+
+
+class ChunkedReader:
+    """This class reads a file in fixed size chunks into a single buffer that is reused for the whole file, so the
+    memory of a scan doesn't depend on the size of the file (about chunk_size + overlap bytes).
+    Every window that it yields starts with the last `overlap` bytes of the previous window, so a match of up to
+    overlap + 1 bytes that crosses a chunk boundary is fully contained in one of the windows. A consumer handles
+    the matches that start before the overlap of the window (the rest of them show up again in the next window),
+    and the last (final) window holds only the remaining overlap bytes, where all of the matches are handled.
+    In case the file's content is already in memory (E.g: a cached mmap), the windows are views of it instead.
+    The content can also be read from a binary stream instead of the file (E.g: a socket's file).
+    A compressed file (gzip, bz2 or xz) is decompressed while it's read (see CompressedInput), so the windows and
+    their offsets are of the uncompressed bytes."""
+
+    def __init__(self, file_path, chunk_size=None, overlap=0, progress=None, metrics=None, buffer=None,
+                 cancel_event=None, on_chunk=None, decompress_workers=1, stream=None):
+        """
+        :param progress: A ProgressReporter that is advanced by the bytes of the file that every chunk read (the
+        compressed bytes in case the file is compressed)
+        :param metrics: ScanMetrics that measure the read phase and count the bytes
+        :param buffer: The file's content (any object that supports the buffer protocol) to read instead of the file
+        :param cancel_event: An object with is_set() (E.g: threading.Event), the reader raises ScanCancelledError
+        before the next window once it's set
+        :param on_chunk: A function that gets every chunk once it's read (only its new bytes, without the overlap),
+        E.g: ByteHistogram.add
+        :param decompress_workers: The number of processes that decompress the members of a gzip file
+        :param stream: A readable binary stream (an object with readinto or read) to read instead of the file, it's
+        read until it ends
+        """
+        self.file_path = file_path
+        self.chunk_size = chunk_size or EngineConsts.BLOCK_SIZE
+        self.overlap = overlap
+        self.progress = progress
+        self.metrics = metrics or ScanMetrics.DISABLED
+        self.buffer = buffer
+        self.cancel_event = cancel_event
+        self.on_chunk = on_chunk
+        self.decompress_workers = decompress_workers
+        self.stream = stream
+
+    def iter_windows(self):
+        """
+        This method reads the file and yields its windows one after the other.
+        Please note that the window is a view of the reused buffer, so it's valid only until the next window.
+        :rtype: Tuples of (the window's offset in the file, memoryview of the window, whether it's the final window)
+        """
+        if self.buffer is not None:
+            yield from self._iter_buffer_windows()
+        elif self.stream is not None:
+            yield from self._iter_input_windows(_StreamInput(self.stream))
+        else:
+            with CompressedInput(self.file_path, self.decompress_workers) as f:
+                yield from self._iter_input_windows(f)
+
+    def _iter_input_windows(self, f):
+        """This method reads the windows from the input (a CompressedInput or a _StreamInput) into the reused buffer.
+        The progress is advanced by the input's position"""
+        buffer = bytearray(self.overlap + self.chunk_size)
+        view = memoryview(buffer)
+        offset, carried, position = 0, 0, 0
+        while True:
+            self._check_cancelled()
+            with self.metrics.phase(MetricsConsts.READ_PHASE):
+                read_size = f.readinto(view[carried: carried + self.chunk_size])
+            if not read_size:
+                break
+            self.metrics.add(MetricsConsts.BYTES_READ, read_size)
+            if self.progress is not None:
+                self.progress.advance(f.position - position)
+                position = f.position
+            if self.on_chunk is not None:
+                self.on_chunk(view[carried: carried + read_size])
+            window_size = carried + read_size
+            yield offset, view[:window_size], False
+            kept = min(self.overlap, window_size)
+            view[:kept] = view[window_size - kept: window_size]
+            offset += window_size - kept
+            carried = kept
+        yield offset, view[:carried], True
+
+    def _iter_buffer_windows(self):
+        """This method yields the same windows as iter_windows, as views of the buffer (without copying it)"""
+        view = memoryview(self.buffer).cast('B')
+        offset, position = 0, 0
+        while position < len(view):
+            self._check_cancelled()
+            end = min(position + self.chunk_size, len(view))
+            self.metrics.add(MetricsConsts.BYTES_READ, end - position)
+            if self.progress is not None:
+                self.progress.advance(end - position)
+            if self.on_chunk is not None:
+                self.on_chunk(view[position: end])
+            yield offset, view[offset: end], False
+            offset, position = end - min(self.overlap, end - offset), end
+        yield offset, view[offset: position], True
+
+    def _check_cancelled(self):
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise ScanCancelledError()
+
+
+class _StreamInput:
+    """This class reads a binary stream for the ChunkedReader, its position is the number of bytes that were read"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.position = 0
+
+    def readinto(self, buffer):
+        if hasattr(self.stream, 'readinto'):
+            read_size = self.stream.readinto(buffer) or 0
+        else:
+            data = self.stream.read(len(buffer))
+            read_size = len(data)
+            buffer[:read_size] = data
+        self.position += read_size
+        return read_size
@@ -0,0 +1,202 @@
+from constants import CompressionConsts, Logs
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+import gzip
+import lzma
+import zlib
+import bz2
+import io
+import os
+
+
+class CompressedInput:
+    """This class opens a file for a streaming scan (see ChunkedReader). A file that is compressed by gzip, bz2 or
+    xz (lzma) is detected by its magic bytes and decompressed on the fly, so it's scanned without a temporary file
+    and the offsets of the results are in the uncompressed bytes. Any other file is read as is.
+    The members of a gzip file (E.g: bgzip or concatenated gzip files) can be decompressed on several cores."""
+    ERRORS = (OSError, EOFError, zlib.error, lzma.LZMAError)  # A corrupted or truncated compressed file
+
+    def __init__(self, file_path, workers=1):
+        """
+        :param workers: The number of processes that decompress the members of a gzip file
+        """
+        self.file_path = file_path
+        self.workers = workers or 1
+        self.compression = self.detect(file_path)
+        self.raw = None
+        self.stream = None
+
+    @staticmethod
+    def detect(file_path):
+        """This method returns the compression of the file by its magic bytes (CompressionConsts.GZIP, BZ2 or XZ),
+        or None in case it isn't compressed"""
+        with open(file_path, mode='rb') as f:
+            header = f.read(CompressionConsts.HEADER_SIZE)
+        if header.startswith(CompressionConsts.GZIP_MAGIC) and len(header) == CompressionConsts.HEADER_SIZE and \
+                not header[3] & CompressionConsts.GZIP_RESERVED_FLAGS:
+            return CompressionConsts.GZIP
+        if CompressionConsts.BZ2_MAGIC.match(header):
+            return CompressionConsts.BZ2
+        if header.startswith(CompressionConsts.XZ_MAGIC):
+            return CompressionConsts.XZ
+        return None
+
+    @property
+    def position(self):
+        """The number of bytes of the file itself (compressed) that were read so far"""
+        if isinstance(self.stream, ParallelGzipReader):
+            return self.stream.position
+        return self.raw.tell()
+
+    def readinto(self, buffer):
+        """This method reads the next (uncompressed) bytes into the buffer.
+        :return: The number of bytes that were read, 0 at the end of the file"""
+        return self.stream.readinto(buffer)
+
+    def __enter__(self):
+        self.raw = open(self.file_path, mode='rb')
+        try:
+            if self.compression == CompressionConsts.GZIP and self.workers > 1:
+                self.stream = ParallelGzipReader(self.file_path, self.workers)
+            elif self.compression == CompressionConsts.GZIP:
+                self.stream = gzip.GzipFile(fileobj=self.raw, mode='rb')
+            elif self.compression == CompressionConsts.BZ2:
+                self.stream = bz2.BZ2File(self.raw)
+            elif self.compression == CompressionConsts.XZ:
+                self.stream = lzma.LZMAFile(self.raw)
+            else:
+                self.stream = self.raw
+        except BaseException:
+            self.raw.close()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            if self.stream is not self.raw:
+                self.stream.close()
+        finally:
+            self.raw.close()
+
+
+class ParallelGzipReader(io.RawIOBase):
+    """This class decompresses the members of a gzip file in a pool of worker processes and reads them in order.
+    A member's end is known only once it's decompressed, so every offset of a member header's bytes is a
+    candidate start, and the bytes between every two candidates are decompressed as a single member. In case
+    a candidate is a false one (the header's bytes appear inside the compressed data), the member before it
+    isn't complete, so it's decompressed serially instead and the false candidates inside it are skipped.
+    A worker decompresses a member in memory only up to MAX_PARALLEL_MEMBER_SIZE bytes (compressed or not), and
+    only a few members per worker are decompressed ahead, so the memory doesn't depend on the file's size. A
+    larger member, and a file of a single member, is streamed serially in bounded parts instead."""
+
+    def __init__(self, file_path, workers):
+        super().__init__()
+        self.file_path = file_path
+        self.workers = workers
+        self.position = 0  # The end of the last member that was read
+        self._members = self._iter_members()
+        self._pending = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        """This method fills the buffer with the next decompressed bytes (less than its size only at the end)"""
+        view = memoryview(buffer).cast('B')
+        size = 0
+        while size < len(view):
+            if not self._pending:
+                data = next(self._members, None)
+                if data is None:
+                    break
+                self._pending = memoryview(data)
+            read_size = min(len(view) - size, len(self._pending))
+            view[size: size + read_size] = self._pending[:read_size]
+            self._pending = self._pending[read_size:]
+            size += read_size
+        return size
+
+    def close(self):
+        self._members.close()
+        super().close()
+
+    def _iter_members(self):
+        """This method yields the decompressed data of the file's members (in parts, for the serial ones)"""
+        starts = self._find_member_starts()
+        segments = list(zip(starts, starts[1:] + [os.stat(self.file_path).st_size]))
+        if len(segments) < 2:  # A single member, there is nothing to decompress in parallel
+            yield from self._decompress_serially()
+            return
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(segments)) or 1) as executor:
+            for (start, end), data in zip(segments, self._decompress_segments(executor, segments)):
+                if start < self.position:  # A false candidate inside a member that was decompressed serially
+                    continue
+                if start == self.position and data is not None:
+                    self.position = end
+                    yield data
+                else:
+                    yield from self._decompress_serially()
+
+    def _find_member_starts(self):
+        """This method returns the offsets of all of the member headers' bytes in the file. The file is read in
+        parts that overlap by the header's length (the magic bytes and the flags), so its memory is bounded"""
+        starts, overlap = [], len(CompressionConsts.GZIP_MAGIC)
+        with open(self.file_path, mode='rb') as f:
+            offset, data = 0, f.read(CompressionConsts.READ_SIZE)
+            while len(data) > overlap:
+                location = data.find(CompressionConsts.GZIP_MAGIC)
+                while location != -1 and location + overlap < len(data):
+                    if not data[location + overlap] & CompressionConsts.GZIP_RESERVED_FLAGS:
+                        starts.append(offset + location)
+                    location = data.find(CompressionConsts.GZIP_MAGIC, location + 1)
+                next_data = f.read(CompressionConsts.READ_SIZE)
+                if not next_data:
+                    break
+                offset += len(data) - overlap
+                data = data[-overlap:] + next_data
+        return starts
+
+    def _decompress_segments(self, executor, segments):
+        """This method yields the decompressed members of the segments in order (see _decompress_member), with
+        only a few of them submitted ahead. A segment that is too large isn't submitted, its member is None"""
+        futures = deque()
+        for start, end in segments:
+            if end - start <= CompressionConsts.MAX_PARALLEL_MEMBER_SIZE:
+                futures.append(executor.submit(_decompress_member, self.file_path, start, end))
+            else:
+                futures.append(None)
+            if len(futures) >= self.workers * CompressionConsts.MEMBERS_AHEAD_PER_WORKER:
+                future = futures.popleft()
+                yield future.result() if future is not None else None
+        while futures:
+            future = futures.popleft()
+            yield future.result() if future is not None else None
+
+    def _decompress_serially(self):
+        """This method decompresses the member that starts at the current position in parts, until its end"""
+        decompressor = zlib.decompressobj(CompressionConsts.GZIP_WBITS)
+        with open(self.file_path, mode='rb') as f:
+            f.seek(self.position)
+            while not decompressor.eof:
+                data = decompressor.unconsumed_tail or f.read(CompressionConsts.READ_SIZE)
+                if not data:
+                    raise EOFError(Logs.TRUNCATED_GZIP_LOG)
+                yield decompressor.decompress(data, CompressionConsts.READ_SIZE)
+            self.position = f.tell() - len(decompressor.unused_data)
+
+
+def _decompress_member(file_path, start, end):
+    """This function decompresses the bytes between the offsets in a worker process. It returns None in case
+    they aren't exactly one complete gzip member (one of the offsets isn't a real member's start) or in case the
+    member is larger than MAX_PARALLEL_MEMBER_SIZE once it's decompressed"""
+    with open(file_path, mode='rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    decompressor = zlib.decompressobj(CompressionConsts.GZIP_WBITS)
+    try:
+        decompressed = decompressor.decompress(data, CompressionConsts.MAX_PARALLEL_MEMBER_SIZE)
+    except zlib.error:
+        return None
+    if not decompressor.eof or decompressor.unused_data:
+        return None
+    return decompressed
@@ -1,3 +1,4 @@
+import re
 import os
 
 
@@ -6,6 +7,31 @@ class ArgsConsts:
     FILE_PATH = 'file_path'
     THRESHOLD = 'threshold'
     MAPPER = 'mapper'
+    AUTOMATON_CACHE_DIR = 'automaton_cache_dir'
+    WORKERS = 'workers'
+    SHARD_SIZE = 'shard_size'
+    USE_INDEX = 'use_index'
+    INDEX_CACHE_DIR = 'index_cache_dir'
+    INDEX_CACHE_SIZE = 'index_cache_size'
+    CHECKPOINT_DIR = 'checkpoint_dir'
+    INCREMENTAL = 'incremental'
+    FINAL = 'final'
+    FOLLOW = 'follow'
+    POLL_INTERVAL = 'poll_interval'
+    QUERIES = 'queries'
+    CHUNK_SIZE = 'chunk_size'
+    METRICS = 'metrics'
+    METRICS_PATH = 'metrics_path'
+    PROFILE_PATH = 'profile_path'
+    TRACE_MEMORY = 'trace_memory'
+    SCAN_CACHE = 'scan_cache'
+    CANCEL_EVENT = 'cancel_event'
+    BUFFER = 'buffer'
+    STREAM = 'stream'
+    PAYLOADS = 'payloads'
+    TOP_RUNS = 'top_runs'
+    PAYLOAD_COUNTS = 'payload_counts'
+    BYTE_HISTOGRAM = 'byte_histogram'
     REGEX_SYMBOL = 'X'
     REGEX_PATTERN = 'bytes regex pattern'
     DICTIONARY_MAPPER = 'dictionary mapper (without new line between records)'
@@ -48,9 +74,8 @@ class Logs:
     EMPTY_FILE_LOG = "This file is empty! Please provide a valid file.\n"
     EXIT_HELP_SCREEN_MESSAGE = "\nPlease press ENTER in order to continue\n"
     SHORT_REGEX_PATTERN_ERROR = "The regex pattern's length must be at least 2!"
-    REGEX_INVALID_SUFFIX_ERROR = "Invalid suffix for the regex pattern! It must end with '{}'".format(
+    INVALID_REGEX_STRUCTURE_ERROR = "The regex pattern must contain some bytes besides the '{}' symbols".format(
         ArgsConsts.REGEX_SYMBOL)
-    INVALID_REGEX_STRUCTURE_ERROR = "The regex pattern must contain some bytes prefix"
     INVALID_THRESHOLD_LOG = "Invalid threshold! It must be a valid number"
     INVALID_MAPPER_LOG = "Invalid dictionary mapper! Please note that although the input is being\n" \
                          "retrieved as a string, the dictionary have to be in the expected structure."
@@ -58,6 +83,32 @@ class Logs:
     EXECUTION_FAILED_ERROR = "The execution failed due to the following error: {}\n"
     SEE_YOU_LATER_LOG = "\nSee you later!"
     INVALID_JSON_KEYS_LOG = "The following keys are invalid hex expressions: {}\n"
+    MISSING_MODE_ARGUMENT_LOG = "The {} requires the {} argument"
+    UNSUPPORTED_MODE_ARGUMENT_LOG = "The {} argument is supported only by the {}"
+    UNSUPPORTED_INCREMENTAL_ARGUMENT_LOG = "The {} argument isn't supported by the incremental scans (--incremental " \
+                                           "and --follow)"
+    INVALID_JOBS_LOG = "The number of jobs must be at least 1"
+    INVALID_SIZES_LOG = "The number of workers, the shard size and the chunk size must be at least 1"
+    ARGUMENT_OUT_OF_RANGE_LOG = "The {} must be an integer between 1 and {}"
+    BATCH_SUMMARY_LOG = "Scanned {} files, {} failed"
+    BENCHMARK_REGRESSION_LOG = "Regression in {}: {:.1f} MB/s instead of {:.1f} MB/s"
+    FILE_RESTARTED_LOG = "The file was truncated or replaced, it's scanned again from the beginning"
+    SCAN_CANCELLED_LOG = "The scan was cancelled"
+    SERVICE_LISTENING_LOG = "Listening on {}"
+    UNKNOWN_JOB_LOG = "There is no job {}"
+    UNKNOWN_ARGUMENTS_LOG = "Unknown arguments: {}"
+    INVALID_MODE_LOG = "The mode must be one of {}"
+    TOO_MANY_JOBS_LOG = "There are too many queued jobs, please try again later"
+    JOB_FINISHED_LOG = "The job {} already finished"
+    PATH_OUTSIDE_ROOT_LOG = "The path {} is outside of the service's root directory"
+    UNAUTHORIZED_LOG = "The request doesn't have the service's token"
+    TOO_MANY_RECORDS_LOG = "The job's records are larger than {} bytes, please use a higher threshold or an " \
+                           "aggregate (top_runs or payload_counts)"
+    BROWSER_REQUEST_LOG = "Requests from web pages (with an Origin header) aren't accepted"
+    INVALID_AGGREGATE_LOG = "The number of top runs and the payloads' cap must be at least 1"
+    TRUNCATED_GZIP_LOG = "The gzip file ended before the end of its last member"
+    INVALID_COMPRESSED_FILE_LOG = "Could not decompress the following file: {} ({}).\n"
+    COMPRESSED_INCREMENTAL_LOG = "A compressed file can't be scanned incrementally"
 
 
 class OutputConsts:
@@ -65,3 +116,239 @@ class OutputConsts:
     RANGE = 'range'
     SIZE = 'size'
     REP_BYTE = 'repeating_byte'
+    OFFSET = 'offset'
+    LENGTH = 'length'
+    PAYLOAD = 'payload'
+    NAME = 'name'
+    KEY = 'key'
+    COUNT = 'count'
+    FILE = 'file'
+    ERROR = 'error'
+    QUERY = 'query'
+    OVERCOUNT = 'overcount'
+    APPROXIMATE = 'approximate'
+    BYTE_HISTOGRAM = 'byte_histogram'
+    JSON_SEPARATORS = (',', ':')
+    WRITE_BUFFER_SIZE = 64 * 1024
+    FLUSH_INTERVAL = 1.0
+
+
+class EngineConsts:
+    BLOCK_SIZE = 4 * 1024 * 1024
+    TAIL_WINDOW = 64
+    ZERO_BYTE = b'\x00'
+    SINGLE_BYTES = [bytes([value]) for value in range(256)]
+
+
+class AutomatonConsts:
+    ALPHABET_SIZE = 256
+    MAX_SKIPPABLE_START_BYTES = 16
+    MAX_FIND_PATTERNS = 32
+    TRANSITIONS_TYPE = 'i'
+    MAGIC = b'ACA1'
+    HEADER_LENGTH_SIZE = 4
+    FILE_EXTENSION = '.aca'
+    TEMP_SUFFIX = '.tmp'
+    PATTERNS = 'patterns'
+    OUTPUTS = 'outputs'
+    FIRST_TERMINAL_STATE = 'first_terminal_state'
+    ITEM_SIZE = 'item_size'
+    STATES_COUNT = 'states_count'
+
+
+class RegexConsts:
+    HEX_ESCAPE_REGEX = re.compile(r'\\x([0-9a-fA-F]{2})')
+
+
+class ShardConsts:
+    DEFAULT_SHARD_SIZE = 64 * 1024 * 1024
+    SHARDS_AHEAD_PER_WORKER = 2
+    BUFFER = 'buffer'
+    ENGINE_ARGUMENT = 'engine_argument'
+
+
+class BatchConsts:
+    DESCRIPTION = "Scan binary files for bytes patterns without the interactive screens"
+    MODES = {'basic': UIConsts.BASIC_MODE, 'regex': UIConsts.REGEX_MODE, 'custom': UIConsts.CUSTOM_MODE}
+    THRESHOLD_FLAG = '--threshold'
+    PATTERN_FLAG = '--pattern'
+    MAPPER_FLAG = '--mapper'
+    TOP_RUNS_FLAG = '--top-runs'
+    PAYLOAD_COUNTS_FLAG = '--payload-counts'
+    BYTE_HISTOGRAM_FLAG = '--byte-histogram'
+    MAX_PENDING_FILES_PER_JOB = 2
+    WRITER = 'writer'
+
+
+class IndexConsts:
+    DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'bytes-pattern-finder', 'indexes')
+    DEFAULT_CACHE_SIZE = 1024 * 1024 * 1024
+    FILE_EXTENSION = '.idx'
+    TEMP_SUFFIX = '.tmp'
+    MAGIC = b'BPI1'
+    FORMAT_VERSION = 1
+    HEADER_LENGTH_SIZE = 4
+    PAYLOAD_ALIGNMENT = 8
+    FINGERPRINT_BLOCK_SIZE = 64 * 1024
+    KIND = 'kind'
+    VERSION = 'version'
+    SIGNATURE = 'signature'
+    PATH = 'path'
+    SIZE = 'size'
+    MTIME = 'mtime_ns'
+    FINGERPRINT = 'fingerprint'
+    RUNS_COUNT = 'runs_count'
+    MIN_INDEXED_RUN_LENGTH = 2
+    OFFSET_TYPE = 'Q'
+    OFFSET_SIZE = 8
+    POSITION_TYPE = 'position_type'
+    POSITION_TYPE_32 = 'I'
+    MAX_32_BIT_POSITION = 2 ** 32
+    NGRAMS = 'ngrams'
+    NGRAMS_COUNT = 16
+    QUERY_BATCH_SIZE = 64 * 1024
+
+
+class IncrementalConsts:
+    DEFAULT_CHECKPOINT_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'bytes-pattern-finder', 'checkpoints')
+    FILE_EXTENSION = '.checkpoint.json'
+    TEMP_SUFFIX = '.tmp'
+    DEFAULT_POLL_INTERVAL = 1.0
+    FINGERPRINT_SIZE = 64 * 1024
+    QUERY = 'query'
+    OFFSET = 'offset'
+    FINGERPRINT = 'fingerprint'
+    OPEN_RUN = 'open_run'
+    TAIL = 'tail'
+    STATE = 'state'
+    COUNTS = 'counts'
+    PATTERNS_DIGEST = 'patterns_digest'
+
+
+class BenchmarkConsts:
+    DESCRIPTION = "Measure the scan speed of every mode on a reproducible synthetic corpus"
+    DEFAULT_SIZE_MB = 16
+    DEFAULT_REPEAT = 5
+    DEFAULT_SEED = 1
+    DEFAULT_MAX_REGRESSION = 0.1
+    BYTES_PER_MB = 1024 * 1024
+    RANDOM_CORPUS = 'random'
+    RUNS_CORPUS = 'runs'
+    PREFIX_CORPUS = 'prefix'
+    SIGNATURE_CORPUS = 'signatures'
+    CORPORA = (RANDOM_CORPUS, RUNS_CORPUS, PREFIX_CORPUS, SIGNATURE_CORPUS)
+    SERIAL_VARIANT = 'serial'
+    SHARDED_VARIANT = 'sharded'
+    INDEXED_VARIANT = 'indexed'
+    VARIANTS = (SERIAL_VARIANT, SHARDED_VARIANT, INDEXED_VARIANT)
+    MAX_RUN_LENGTH = 4096
+    PREFIX_SPACING = 64
+    SIGNATURE_SPACING = 256
+    THRESHOLD = 16
+    REGEX_PATTERN = '\\x13\\x37XXXX'
+    PREFIX = b'\x13\x37'
+    MAPPER = {'4d5a': 'MZ header', '7f454c46': 'ELF header', '504b0304': 'zip entry', 'cafebabe': 'java class',
+              'deadbeef': 'dead beef', '1f8b08': 'gzip stream'}
+    PERCENTILES = (50, 90, 99)
+    META = 'meta'
+    RESULTS = 'results'
+    MB_PER_SECOND = 'mb_per_second'
+    PEAK_MEMORY = 'peak_memory_bytes'
+    LATENCY = 'latency_p{}_seconds'
+
+
+class MetricsConsts:
+    SETUP_PHASE = 'setup'
+    READ_PHASE = 'read'
+    SCAN_PHASE = 'scan'
+    RESULTS_PHASE = 'results'
+    OUTPUT_PHASE = 'output'
+    TOTAL_PHASE = 'total'
+    BYTES_READ = 'bytes_read'
+    RESULTS = 'results'
+    FILES = 'files'
+    PHASES = 'phases'
+    COUNTERS = 'counters'
+    PEAK_MEMORY = 'peak_memory_bytes'
+    PROFILE_PATH = 'profile_path'
+    WALL_TIME = 'wall_seconds'
+    CPU_TIME = 'cpu_seconds'
+    CALLS = 'calls'
+    PHASE_FIELDS = (WALL_TIME, CPU_TIME, CALLS)
+    PROMETHEUS_PREFIX = 'bytes_pattern_finder_'
+    PROMETHEUS_PHASE_NAME = 'phase_{}'
+    PROMETHEUS_COUNTER_SUFFIX = '_total'
+    PROMETHEUS_PHASE_METRICS = ((WALL_TIME, 'counter', "Wall time spent in every phase of the scans"),
+                                (CPU_TIME, 'counter', "CPU time spent in every phase of the scans"),
+                                (CALLS, 'counter', "Number of times every phase was entered"))
+    PROMETHEUS_EXTENSION = '.prom'
+    PROFILE_EXTENSION = '.prof'
+    TEMP_SUFFIX = '.tmp'
+
+
+class AggregateConsts:
+    DEFAULT_MAX_PAYLOADS = 10000
+    HISTOGRAM_BINS = 256
+
+
+class CompressionConsts:
+    GZIP = 'gzip'
+    BZ2 = 'bz2'
+    XZ = 'xz'
+    HEADER_SIZE = 10
+    GZIP_MAGIC = b'\x1f\x8b\x08'  # Including the deflate compression method
+    GZIP_RESERVED_FLAGS = 0xe0
+    GZIP_WBITS = 16 + 15  # A gzip header and the largest window (see zlib.decompressobj)
+    BZ2_MAGIC = re.compile(rb'BZh[1-9](\x31\x41\x59\x26\x53\x59|\x17\x72\x45\x38\x50\x90)')
+    XZ_MAGIC = b'\xfd7zXZ\x00'
+    READ_SIZE = 1024 * 1024
+    MEMBERS_AHEAD_PER_WORKER = 2
+    MAX_PARALLEL_MEMBER_SIZE = 16 * 1024 * 1024
+
+
+class ServiceConsts:
+    DESCRIPTION = "Serve scan jobs over a Unix socket or a localhost HTTP port with warm caches"
+    DEFAULT_HOST = '127.0.0.1'
+    DEFAULT_PORT = 8765
+    SOCKET_PERMISSIONS = 0o600
+    TOKEN_ENVIRONMENT_VARIABLE = 'SCAN_SERVICE_TOKEN'
+    TOKEN_SCHEME = 'Bearer '
+    POOL_ATTEMPTS = 2
+    WORKERS_START_METHOD = 'forkserver'
+    MAX_WORKERS = os.cpu_count() or 1
+    MAX_SHARD_SIZE = 1024 * 1024 * 1024
+    MAX_CHUNK_SIZE = 256 * 1024 * 1024
+    DEFAULT_QUEUED_JOBS = 1024
+    MAX_FINISHED_JOBS = 1024
+    MAX_JOB_RECORDS_SIZE = 64 * 1024 * 1024
+    MAX_FINISHED_RECORDS_SIZE = 256 * 1024 * 1024
+    MAX_REQUEST_SIZE = 16 * 1024 * 1024
+    MAPPINGS_CACHE_SIZE = 64
+    PATTERNS_CACHE_SIZE = 256
+    JOBS_PATH = '/jobs'
+    WAIT = 'wait'
+    CACHE = 'cache'
+    FLAGS = 'flags'
+    ID = 'id'
+    STATUS = 'status'
+    RECORDS = 'records'
+    ERROR = 'error'
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+    FINISHED_STATUSES = (DONE, FAILED, CANCELLED)
+    JOB_ARGUMENTS = (ArgsConsts.MODE, ArgsConsts.FILE_PATH, ArgsConsts.THRESHOLD, ArgsConsts.REGEX_PATTERN,
+                     ArgsConsts.MAPPER, ArgsConsts.QUERIES, ArgsConsts.AUTOMATON_CACHE_DIR, ArgsConsts.WORKERS,
+                     ArgsConsts.SHARD_SIZE, ArgsConsts.USE_INDEX, ArgsConsts.INDEX_CACHE_DIR,
+                     ArgsConsts.INDEX_CACHE_SIZE, ArgsConsts.CHUNK_SIZE, ArgsConsts.TOP_RUNS,
+                     ArgsConsts.PAYLOAD_COUNTS, ArgsConsts.BYTE_HISTOGRAM)
+    PATH_ARGUMENTS = (ArgsConsts.FILE_PATH, ArgsConsts.AUTOMATON_CACHE_DIR, ArgsConsts.INDEX_CACHE_DIR)
+    QUERY_ARGUMENTS = (ArgsConsts.MODE, ArgsConsts.THRESHOLD, ArgsConsts.REGEX_PATTERN, ArgsConsts.MAPPER,
+                       ArgsConsts.TOP_RUNS, ArgsConsts.PAYLOAD_COUNTS)
+    BOUNDED_ARGUMENTS = {ArgsConsts.WORKERS: MAX_WORKERS, ArgsConsts.SHARD_SIZE: MAX_SHARD_SIZE,
+                         ArgsConsts.CHUNK_SIZE: MAX_CHUNK_SIZE}
+    HTTP_REASONS = {200: 'OK', 202: 'Accepted', 400: 'Bad Request', 401: 'Unauthorized', 403: 'Forbidden',
+                    404: 'Not Found', 405: 'Method Not Allowed', 409: 'Conflict', 413: 'Payload Too Large',
+                    503: 'Service Unavailable'}
@@ -1,13 +1,28 @@
 
-from constants import OutputConsts, ArgsConsts, UIConsts
+from constants import OutputConsts, ArgsConsts, UIConsts, EngineConsts, MetricsConsts
+from run_length_engine import RunLengthEngine
+from run_results import BasicRunResults
+from aggregates import TopRuns, PayloadCounter, ByteHistogram
+from aho_corasick import AhoCorasickAutomaton
+from regex_engine import BytesPattern, PatternStream
+from sharded_scanner import ShardedScanner
+from index_cache import IndexCache
+from run_index import RunLengthIndex
+from byte_index import BytePositionIndex
+from query_plan import QueryPlan
+from chunked_reader import ChunkedReader
+from compressed_input import CompressedInput
+from instrumentation import ScanMetrics
 from utils import ProgressBarUtil
+import mmap
 import os
 
 
 class FileParser:
     """This class is being used only after all of the arguments were validated, so this is
     an important prerequisite. It parses the binary file and calculates the results
-    according to the mode and other arguments that were given by the user"""
+    according to the mode and other arguments that were given by the user.
+    Instead of a file, it can scan a buffer or a binary stream that is already in memory (see from_memory)"""
 
     def __init__(self, **kwargs):
         self.mode = kwargs.get(ArgsConsts.MODE)
@@ -15,99 +30,426 @@ class FileParser:
         self.threshold = kwargs.get(ArgsConsts.THRESHOLD)
         self.mapper = kwargs.get(ArgsConsts.MAPPER)
         self.regex_pattern = kwargs.get(ArgsConsts.REGEX_PATTERN)
+        self.automaton_cache_dir = kwargs.get(ArgsConsts.AUTOMATON_CACHE_DIR)
+        self.workers = kwargs.get(ArgsConsts.WORKERS) or 1
+        self.shard_size = kwargs.get(ArgsConsts.SHARD_SIZE)
+        self.use_index = kwargs.get(ArgsConsts.USE_INDEX)
+        self.index_cache = IndexCache(kwargs.get(ArgsConsts.INDEX_CACHE_DIR), kwargs.get(ArgsConsts.INDEX_CACHE_SIZE))
+        self.queries = kwargs.get(ArgsConsts.QUERIES)
+        self.chunk_size = kwargs.get(ArgsConsts.CHUNK_SIZE)
+        self.metrics = kwargs.get(ArgsConsts.METRICS) or ScanMetrics.DISABLED
+        self.scan_cache = kwargs.get(ArgsConsts.SCAN_CACHE)
+        self.cancel_event = kwargs.get(ArgsConsts.CANCEL_EVENT)
+        self.top_runs = kwargs.get(ArgsConsts.TOP_RUNS)
+        self.payload_counts = kwargs.get(ArgsConsts.PAYLOAD_COUNTS)
+        self.byte_histogram = ByteHistogram() if kwargs.get(ArgsConsts.BYTE_HISTOGRAM) else None
+        self.buffer = kwargs.get(ArgsConsts.BUFFER)
+        self.stream = kwargs.get(ArgsConsts.STREAM)
+        self.payloads = kwargs.get(ArgsConsts.PAYLOADS, True)
+        self._compressed = None
+
+    @classmethod
+    def from_memory(cls, source, **kwargs):
+        """
+        This method creates a FileParser that scans an in-memory source instead of a file, without writing it to
+        the disk. A buffer is scanned through memoryview slices of it (without copying it) and a stream is read in
+        chunks into a single reused buffer, in all of the modes and queries. Please note that a stream is read once,
+        so it can be scanned only once.
+        :param source: Any object that supports the buffer protocol (bytes, bytearray, memoryview, mmap, ...) or a
+        readable binary stream (an object with readinto or read, E.g: io.BytesIO or socket.makefile('rb'))
+        :param kwargs: The rest of the FileParser arguments. In case `payloads` is False, the regex mode's results
+        are the (offset, length) of the matches instead of copies of their payloads
+        """
+        try:
+            memoryview(source).release()
+        except TypeError:  # Not a buffer
+            return cls(**dict(kwargs, **{ArgsConsts.STREAM: source}))
+        return cls(**dict(kwargs, **{ArgsConsts.BUFFER: source}))
 
     def parse_file_and_calculate(self):
-        """This method parses the binary file and calculates the results"""
+        """This method parses the binary file and calculates the results.
+        The aggregates replace the results in case they were requested: The `top_runs` longest runs in the basic
+        mode or the payloads' counts (up to `payload_counts` distinct payloads) in the regex mode. The histogram
+        of the file's bytes is added to the results in case `byte_histogram` was requested"""
+        with self.metrics.session():
+            if self.queries is not None:
+                results = self._handle_queries()
+            elif self.mode == UIConsts.BASIC_MODE:
+                results = self._handle_basic_mode()
+            elif self.mode == UIConsts.CUSTOM_MODE:
+                results = self._handle_custom_mode()
+            else:  # Regex Mode
+                results = self._handle_regex_mode(self._prepare_args_for_regex_mode())
+            if self.byte_histogram is not None:
+                results[OutputConsts.BYTE_HISTOGRAM] = self._complete_byte_histogram()
+            return results
+
+    def iter_records(self):
+        """This method yields the results one by one as json serializable records, while the file is being
+        scanned. Nothing is accumulated, so the memory doesn't depend on the number of results:
+        - Basic mode: {'range': [start, end], 'size': size, 'repeating_byte': hex} (same range and size as
+        the basic mode's records)
+        - Regex mode: {'offset': offset, 'length': length, 'payload': hex} (without the payload in case `payloads`
+        is False)
+        - Custom mode: {'name': mapped string, 'key': hex key, 'count': appearances}
+        - Payloads' counts: {'payload': hex, 'count': appearances, 'overcount': the maximal error of the count}
+        In case several queries were given, every record also has the mode and the index of its query.
+        The histogram of the file's bytes is the last record ({'byte_histogram': counts}) in case it was requested"""
+        with self.metrics.session():
+            yield from self.metrics.counted(MetricsConsts.RESULTS, self._iter_records())
+
+    def _iter_records(self):
+        if self.queries is not None:
+            query_parsers = self._create_query_parsers()
+            for query_index, item in self._create_query_plan(query_parsers).iter_items():
+                query_parser = query_parsers[query_index]
+                for record in query_parser.create_records(item):
+                    yield dict({OutputConsts.QUERY: query_index, ArgsConsts.MODE: query_parser.mode}, **record)
+        elif self.mode == UIConsts.CUSTOM_MODE:
+            yield from self.create_custom_records(self._count_custom_keys())
+        else:
+            items = self._iter_basic_runs() if self.mode == UIConsts.BASIC_MODE \
+                else self._iter_regex_matches(self._prepare_args_for_regex_mode())
+            if self.aggregated:
+                items = [self._aggregate(items)]
+            for item in items:
+                yield from self.create_records(item)
+        if self.byte_histogram is not None:
+            yield {OutputConsts.BYTE_HISTOGRAM: self._complete_byte_histogram()}
+
+    @staticmethod
+    def create_basic_record(run):
+        """This method converts a (start, length, byte_value) run into a json serializable basic mode record"""
+        start, length, byte_value = run
+        return {OutputConsts.RANGE: [start + 1, start + length], OutputConsts.SIZE: length - 1,
+                OutputConsts.REP_BYTE: EngineConsts.SINGLE_BYTES[byte_value].hex()}
+
+    @staticmethod
+    def create_regex_record(offset, payload):
+        """This method converts a match into a json serializable regex mode record"""
+        return {OutputConsts.OFFSET: offset, OutputConsts.LENGTH: len(payload), OutputConsts.PAYLOAD: payload.hex()}
+
+    def create_records(self, item):
+        """This method converts an item of the mode's consumer (see create_consumer) into json serializable
+        records"""
+        if isinstance(item, TopRuns):
+            for run in item.runs():
+                yield self.create_basic_record(run)
+        elif isinstance(item, PayloadCounter):
+            for payload, count, overcount in item.most_common():
+                yield {OutputConsts.PAYLOAD: payload.hex(), OutputConsts.COUNT: count,
+                       OutputConsts.OVERCOUNT: overcount}
+        elif self.mode == UIConsts.BASIC_MODE:
+            yield self.create_basic_record(item)
+        elif self.mode == UIConsts.CUSTOM_MODE:
+            yield from self.create_custom_records(item)
+        elif self.payloads:  # Regex Mode
+            yield self.create_regex_record(*item)
+        else:
+            yield {OutputConsts.OFFSET: item[0], OutputConsts.LENGTH: item[1]}
+
+    def create_custom_records(self, counts):
+        """This method converts the keys' counts (by the keys' bytes) into json serializable custom mode records"""
+        for hex_string, regular_expression in self.mapper.items():
+            yield {OutputConsts.NAME: regular_expression, OutputConsts.KEY: hex_string,
+                   OutputConsts.COUNT: counts[bytes.fromhex(hex_string)]}
+
+    def create_consumer(self):
+        """
+        This method creates the streaming engine of the mode for a QueryPlan, which feeds it with the blocks of
+        the file one after the other.
+        :return: A pair of (feed, finish) functions. feed(block) returns the items that were found in the block and
+        finish() returns the rest of the items at the end of the file. The items are the (start, length, byte_value)
+        runs in the basic mode, (offset, payload) matches in the regex mode ((offset, length) in case `payloads` is
+        False) and a single dictionary with the counts
+        of the keys (as bytes) in the custom mode. In case the mode's results are aggregated, the only item is the
+        TopRuns or the PayloadCounter
+        """
+        if self.aggregated:
+            return self._create_aggregate_consumer(*self._create_mode_consumer())
+        return self._create_mode_consumer()
+
+    def _create_mode_consumer(self):
         if self.mode == UIConsts.BASIC_MODE:
-            return self._handle_basic_mode()
+            engine = RunLengthEngine(self.threshold)
+            return engine.feed, engine.finish
         elif self.mode == UIConsts.CUSTOM_MODE:
-            return self._handle_custom_mode()
+            scanner = self._load_automaton().scanner()
+
+            def feed(block):
+                scanner.feed(block)
+                return ()
+            return feed, lambda: [scanner.pattern_counts()]
         else:  # Regex Mode
-            requested_prefix, additional_bytes_length, comparator_type = self._prepare_args_for_regex_mode()
-            return self._handle_regex_mode(requested_prefix, additional_bytes_length, comparator_type)
+            stream = PatternStream(self._prepare_args_for_regex_mode())
+            if self.payloads or self.aggregated:
+                return stream.feed, stream.finish
+            return (lambda block: [(offset, len(payload)) for offset, payload in stream.feed(block)],
+                    lambda: [(offset, len(payload)) for offset, payload in stream.finish()])
+
+    @property
+    def aggregated(self):
+        """Whether an aggregate replaces the mode's results (see parse_file_and_calculate)"""
+        return (self.mode == UIConsts.BASIC_MODE and self.top_runs is not None) or \
+            (self.mode == UIConsts.REGEX_MODE and self.payload_counts is not None)
+
+    def _aggregate(self, items):
+        """This method aggregates the runs or the matches of the mode. The memory of the aggregate depends only
+        on the number of the top runs or on the payloads' cap.
+        :return: A TopRuns in the basic mode or a PayloadCounter in the regex mode"""
+        aggregate = TopRuns(self.top_runs) if self.mode == UIConsts.BASIC_MODE else PayloadCounter(self.payload_counts)
+        aggregate.update(items)
+        return aggregate
+
+    def _create_aggregate_consumer(self, feed, finish):
+        """This method wraps the mode's consumer, so its items go into the aggregate"""
+        aggregate = self._aggregate(())
+
+        def aggregate_feed(block):
+            aggregate.update(feed(block))
+            return ()
+
+        def aggregate_finish():
+            aggregate.update(finish())
+            return [aggregate]
+        return aggregate_feed, aggregate_finish
+
+    def _handle_queries(self):
+        """This method answers all of the queries in a single read of the file.
+        :return: A dictionary with the results of every query, in the format of its mode"""
+        query_parsers = self._create_query_parsers()
+        with self.metrics.phase(MetricsConsts.SCAN_PHASE):
+            items = self._create_query_plan(query_parsers).run()
+        with self.metrics.phase(MetricsConsts.RESULTS_PHASE):
+            results = [query_parser._create_mode_results(query_items)
+                       for query_parser, query_items in zip(query_parsers, items)]
+        return {OutputConsts.RESULTS: results}
+
+    def _create_query_parsers(self):
+        """This method creates a FileParser for every query. The queries are dictionaries with the mode and
+        its arguments (the same keys as the FileParser's arguments), the rest of the arguments are shared"""
+        shared_arguments = {ArgsConsts.FILE_PATH: self.file_path, ArgsConsts.METRICS: self.metrics,
+                            ArgsConsts.SCAN_CACHE: self.scan_cache, ArgsConsts.PAYLOADS: self.payloads,
+                            ArgsConsts.AUTOMATON_CACHE_DIR: self.automaton_cache_dir}
+        return [FileParser(**dict(shared_arguments, **query)) for query in self.queries]
+
+    def _create_query_plan(self, query_parsers):
+        """This method creates the QueryPlan of the queries' consumers"""
+        return QueryPlan(self.file_path, [query_parser.create_consumer() for query_parser in query_parsers],
+                         create_reader=self._create_reader, size=self._input_size())
+
+    @property
+    def compressed(self):
+        """Whether the file is compressed (gzip, bz2 or xz)"""
+        if self._compressed is None:
+            self._compressed = self.file_path is not None and CompressedInput.detect(self.file_path) is not None
+        return self._compressed
+
+    @property
+    def streamed(self):
+        """Whether the input is always scanned serially as a stream by a ChunkedReader: A compressed file, a buffer
+        or a binary stream. It's never sharded, indexed or mapped, and the workers decompress the members of a
+        gzip file instead"""
+        return self.file_path is None or self.compressed
+
+    def _input_size(self):
+        """This method returns the number of bytes of the progress bar: The file's or the buffer's size (the size of
+        a stream is unknown, so it's None)"""
+        if self.buffer is not None:
+            return memoryview(self.buffer).nbytes
+        if self.stream is not None:
+            return None
+        return os.stat(self.file_path).st_size
+
+    def _create_reader(self, progress, overlap=0):
+        """This method creates the ChunkedReader of the serial scans. In case there is a scan cache, the file
+        is read from its cached mmap (unless it's compressed)"""
+        buffer = self.buffer
+        if buffer is None and self.scan_cache is not None and not self.streamed:
+            buffer = self.scan_cache.mapping(self.file_path)
+        on_chunk = self.byte_histogram.add if self.byte_histogram is not None else None
+        return ChunkedReader(self.file_path, self.chunk_size, overlap, progress, self.metrics, buffer,
+                             self.cancel_event, on_chunk, self.workers, self.stream)
+
+    def _complete_byte_histogram(self):
+        """This method returns the histogram of the file's bytes. The scans that read the file with a
+        ChunkedReader count its bytes on the way, the others (sharded, indexed or partial) read it once more.
+        A streamed input is always read by a ChunkedReader"""
+        if not self.streamed and self.byte_histogram.total != os.stat(self.file_path).st_size:
+            self.byte_histogram.reset()
+            for _ in self._create_reader(None).iter_windows():
+                pass
+        return self.byte_histogram.counts
+
+    def _create_mode_results(self, items):
+        """This method converts all of the items of the mode's consumer into the mode's results"""
+        if self.aggregated:
+            return self._create_aggregate_results(items[0])
+        if self.mode == UIConsts.BASIC_MODE:
+            results = BasicRunResults.from_runs(items)
+        elif self.mode == UIConsts.CUSTOM_MODE:
+            results = self._create_custom_results(items[0])
+        elif self.payloads:  # Regex Mode
+            results = [payload for _, payload in items]
+        else:
+            results = list(items)
+        self.metrics.add(MetricsConsts.RESULTS, len(results))
+        return {ArgsConsts.MODE: self.mode, OutputConsts.RESULTS: results}
 
     def _handle_basic_mode(self):
         """This method parses the file and looks for repeating bytes sequences that
-        are greater than the threshold argument"""
-        results = []
-        file_size = os.stat(self.file_path).st_size
-        with open(self.file_path, mode='rb') as f:
-            sequence_length, location = 0, 1
-            byte = f.read(1)
-            while byte:
-                previous_byte = byte
-                byte = f.read(1)
-                location += 1
-                if previous_byte == byte:
-                    sequence_length += 1
-                else:
-                    if sequence_length >= self.threshold:
-                        results.append(self._create_basic_result_record(previous_byte, location - 1, sequence_length))
-                    sequence_length = 0
-                ProgressBarUtil.make_progress(location, file_size)
+        are greater than the threshold argument. The results are a BasicRunResults, a compact sequence
+        of the records"""
+        with self.metrics.phase(MetricsConsts.SCAN_PHASE):
+            if self.aggregated:
+                return self._create_aggregate_results(self._aggregate(self._iter_basic_runs()))
+            results = BasicRunResults.from_runs(self._iter_basic_runs())
+        self.metrics.add(MetricsConsts.RESULTS, len(results))
         return {ArgsConsts.MODE: self.mode, OutputConsts.RESULTS: results}
 
-    @staticmethod
-    def _create_basic_result_record(byte, end_location_idx, sequence_length):
-        """This method creates the result dictionary in the expected structure with
-         the expected arguments for the basic mode"""
-        sequence_range = (end_location_idx-sequence_length, end_location_idx)
-        result = {OutputConsts.RANGE: sequence_range, OutputConsts.SIZE: sequence_length, OutputConsts.REP_BYTE: byte}
-        return result
+    def _create_aggregate_results(self, aggregate):
+        """This method converts the aggregate into the mode's results: The top runs as basic mode records, from
+        the longest, or the payloads' counts from the most common (with a flag in case they are approximate)"""
+        if isinstance(aggregate, TopRuns):
+            results = {ArgsConsts.MODE: self.mode, OutputConsts.RESULTS: BasicRunResults.from_runs(aggregate.runs())}
+        else:
+            results = {ArgsConsts.MODE: self.mode, OutputConsts.APPROXIMATE: aggregate.approximate,
+                       OutputConsts.RESULTS: [{OutputConsts.PAYLOAD: payload, OutputConsts.COUNT: count,
+                                               OutputConsts.OVERCOUNT: overcount}
+                                              for payload, count, overcount in aggregate.most_common()]}
+        self.metrics.add(MetricsConsts.RESULTS, len(results[OutputConsts.RESULTS]))
+        return results
+
+    def _iter_basic_runs(self):
+        """This method yields the (start, length, byte_value) runs that are greater than the threshold.
+        In case the index is used, the runs are taken from the file's RunLengthIndex, or the index is built
+        during the scan so the next queries on the file won't scan it again"""
+        if not self.use_index or self.streamed:
+            yield from self._scan_basic_runs(self.threshold)
+            return
+        if self.threshold >= RunLengthIndex.MIN_THRESHOLD:
+            index = RunLengthIndex.load(self.file_path, self.index_cache)
+            if index is not None:
+                with index:
+                    yield from index.query(self.threshold)
+                return
+        runs = self._scan_basic_runs(min(self.threshold, RunLengthIndex.MIN_THRESHOLD))
+        yield from RunLengthIndex.index_runs(runs, self.file_path, self.index_cache, self.threshold)
+
+    def _scan_basic_runs(self, threshold):
+        """This method scans the file and yields the runs that are greater than the threshold.
+        The file is read in large blocks and the runs are located by the RunLengthEngine, which carries runs
+        that cross a block boundary (or by the ShardedScanner in case there are several workers)"""
+        if self.workers > 1 and not self.streamed:
+            yield from ShardedScanner(self.file_path, self.workers, self.shard_size).scan_basic(threshold)
+            return
+        engine = RunLengthEngine(threshold)
+        with ProgressBarUtil.track(self._input_size()) as progress:
+            for _, block, _ in self._create_reader(progress).iter_windows():
+                yield from engine.feed(block)
+        yield from engine.finish()
 
     def _prepare_args_for_regex_mode(self):
-        """This method gets the expected regex structure from the user and returns a tuple with
-        the requested prefix and the requested bytes length to find.
-        There's a special case in case the user enters an Hex prefix (E.g: '\x00XXX), since the
-        raw input gets it an a string and parses it in a different way. So this method checks for
-        that and returns a prefix_bytes in a str type in this case, else it returns a byte.
-        E.g: If the input will be: '\x00XXX' the return value will be ('00', 3).\
-        In case the input will be: 'C123XX' the return value will be (b'C123', 2) """
-        for index in range(len(self.regex_pattern)-1, -1, -1):
-            if self.regex_pattern[index] != ArgsConsts.REGEX_SYMBOL:
-                last_byte_prefix = index + 1
-                prefix_bytes = self.regex_pattern[:last_byte_prefix]
-                additional_bytes_length = len(self.regex_pattern[last_byte_prefix:])
-                if prefix_bytes.startswith('\\x'):
-                    prefix_bytes = prefix_bytes.strip('\\x')
-                else:
-                    prefix_bytes = prefix_bytes.encode()
-                return prefix_bytes, additional_bytes_length, type(prefix_bytes)
-
-    def _handle_regex_mode(self, requested_prefix, additional_bytes_length, comparator_type=bytes):
+        """This method compiles the regex pattern that was received from the user into a BytesPattern.
+        The pattern can contain a prefix of several bytes, hex bytes (E.g: '\x00') and 'X' symbols anywhere.
+        E.g: The pattern '\x00XXX' matches 4 bytes sequences that start with b'\x00' and the pattern
+        'C1X3X' matches 5 bytes sequences like b'C1?3?'"""
+        with self.metrics.phase(MetricsConsts.SETUP_PHASE):
+            if self.scan_cache is not None:
+                return self.scan_cache.bytes_pattern(self.regex_pattern)
+            return BytesPattern(self.regex_pattern)
+
+    def _handle_regex_mode(self, bytes_pattern):
         """
-        This method looks for all of the bytes that started with the prefix that was
-        received by the user and saves all of the bytes sequence that starts with the requested prefix and
-        that in the requested length.
-        :param requested_prefix: The bytes prefix that we should look after
-        :param additional_bytes_length: The additional bytes length that we should save in case we found
-        the @param requested_prefix.
-        :param comparator_type: There is a challenging situation if the user enters a prefix that starts with a "/".
-        In this case we will compare strings and not bytes in order to support this.
+        This method looks for all of the bytes sequences that match the compiled regex pattern. The matches
+        can overlap, and a match at the end of the file is truncated in case the file ends before its
+        trailing 'X' symbols.
+        :param bytes_pattern: The compiled BytesPattern
         :return: A dictionary with the results: The mode and all the of the bytes array that fits the arguments
+        (or the (offset, length) of all of the matches in case `payloads` is False)
         """
-        results = []
-        with open(self.file_path, mode='rb') as f:
-            bytes_stream = f.read()
-        for i in range(len(bytes_stream)-1):
-            current_byte = bytes_stream[i: i+1].hex() if comparator_type == str else bytes_stream[i: i+1]
-            if current_byte == requested_prefix:
-                results.append(bytes_stream[i: i + 1 + additional_bytes_length])
-            ProgressBarUtil.make_progress(i, len(bytes_stream)-1)
+        with self.metrics.phase(MetricsConsts.SCAN_PHASE):
+            if self.aggregated:
+                return self._create_aggregate_results(self._aggregate(self._iter_regex_matches(bytes_pattern)))
+            matches = self._iter_regex_matches(bytes_pattern)
+            results = [payload for _, payload in matches] if self.payloads else list(matches)
+        self.metrics.add(MetricsConsts.RESULTS, len(results))
         return {ArgsConsts.MODE: self.mode, OutputConsts.RESULTS: results}
 
+    def _iter_regex_matches(self, bytes_pattern):
+        """This method yields the (offset, payload) of every match. The file is read in chunks by a ChunkedReader
+        whose overlap is the pattern's length minus one, so a match that crosses a chunk boundary is found exactly
+        once and the memory doesn't depend on the file's size. Only the payload of the current match is copied, and
+        in case `payloads` is False (and the payloads aren't aggregated) the (offset, length) of the match is yielded
+        instead, without any copy.
+        In case the index is used, only the candidates from the file's BytePositionIndex are checked (the
+        index is built first in case it's missing)"""
+        if (self.workers > 1 or self.use_index) and not self.streamed:
+            yield from self._iter_mapped_regex_matches(bytes_pattern)
+            return
+        payloads = self.payloads or self.aggregated
+        with ProgressBarUtil.track(self._input_size()) as progress:
+            reader = self._create_reader(progress, bytes_pattern.length - 1)
+            for window_offset, window, final in reader.iter_windows():
+                end = len(window) if final else len(window) - reader.overlap  # The rest is in the next window
+                for offset, length in bytes_pattern.iter_matches(window, 0, end):
+                    yield window_offset + offset, bytes(window[offset: offset + length]) if payloads else length
+
+    def _iter_mapped_regex_matches(self, bytes_pattern):
+        """This method yields the (offset, payload) (or (offset, length)) of every match of an indexed or sharded
+        scan, which read the file over an mmap"""
+        payloads = self.payloads or self.aggregated
+        file_size = os.stat(self.file_path).st_size
+        if not file_size:  # An empty file can't be mapped
+            return
+        with open(self.file_path, mode='rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as bytes_stream:
+            index = BytePositionIndex.load_or_build(self.file_path, self.index_cache) if self.use_index else None
+            if index is not None:  # Missing in case the file was changed while it was indexed or it's too large
+                with index:
+                    for offset, length in index.iter_matches(bytes_pattern, bytes_stream):
+                        yield offset, bytes_stream[offset: offset + length] if payloads else length
+                return
+            if self.workers > 1:
+                matches = ShardedScanner(self.file_path, self.workers, self.shard_size).scan_regex(self.regex_pattern)
+            else:
+                matches = bytes_pattern.iter_matches(bytes_stream)
+            for offset, length in matches:
+                yield offset, bytes_stream[offset: offset + length] if payloads else length
+
     def _handle_custom_mode(self):
-        """This method finds all of the appearances of the required hex strings in the file.
-        First, it converts the hex string into a bytes array and than counts the number of time that it
-        could be found in the file"""
+        """This method finds all of the appearances of the required hex strings in the file"""
+        with self.metrics.phase(MetricsConsts.SCAN_PHASE):
+            counts = self._count_custom_keys()
+        with self.metrics.phase(MetricsConsts.RESULTS_PHASE):
+            results = self._create_custom_results(counts)
+        self.metrics.add(MetricsConsts.RESULTS, len(results))
+        return {ArgsConsts.MODE: self.mode, OutputConsts.RESULTS: results}
+
+    def _create_custom_results(self, counts):
+        """This method maps the strings of the mapper to the counts of their keys"""
         results = dict()
-        with open(self.file_path, mode='rb') as f:
-            bytes_stream = f.read()
         for hex_string, regular_expression in self.mapper.items():
-            bytes_exp = bytes.fromhex(hex_string)
-            counter, location = -1, 0
-            while location != -1:
-                location = bytes_stream.find(bytes_exp, location + 1)
-                counter += 1
-            results[regular_expression] = counter
-        return {ArgsConsts.MODE: self.mode, OutputConsts.RESULTS: results}
+            results[regular_expression] = counts[bytes.fromhex(hex_string)]
+        return results
+
+    def _count_custom_keys(self):
+        """This method returns a dictionary with the number of appearances of every key (as bytes).
+        All of the hex strings are compiled into a single Aho-Corasick automaton (or loaded from the automaton
+        cache directory), which counts all of them, including overlapping appearances, in one pass.
+        The file is read in chunks by a ChunkedReader. The automaton's state carries the last bytes of a chunk
+        (up to the longest key minus one) into the next one, so it doesn't need an overlap between the chunks"""
+        automaton = self._load_automaton()
+        if self.workers > 1 and not self.streamed:
+            return ShardedScanner(self.file_path, self.workers, self.shard_size).scan_custom(automaton)
+        scanner = automaton.scanner()
+        with ProgressBarUtil.track(self._input_size()) as progress:
+            for _, window, _ in self._create_reader(progress).iter_windows():
+                scanner.feed(window)
+        return scanner.pattern_counts()
+
+    def _load_automaton(self):
+        """This method returns the automaton of the mapper's keys, from the scan cache in case there is one"""
+        with self.metrics.phase(MetricsConsts.SETUP_PHASE):
+            if self.scan_cache is not None:
+                return self.scan_cache.automaton(self.mapper, self.automaton_cache_dir)
+            return AhoCorasickAutomaton.from_mapper(self.mapper, self.automaton_cache_dir)
@@ -0,0 +1,159 @@
+from constants import ArgsConsts, UIConsts, EngineConsts, IncrementalConsts, Logs
+from run_length_engine import RunLengthEngine
+from aho_corasick import AhoCorasickAutomaton, AutomatonScanner
+from regex_engine import BytesPattern, PatternStream
+from file_parser import FileParser
+from functools import partial
+import hashlib
+import json
+import os
+
+
+class IncrementalScanner:
+    """This class scans a file that is still being appended to (E.g: a capture file) incrementally.
+    After every scan it saves a small checkpoint: the offset that was reached and the state of the mode's engine
+    at that offset (the open run of the basic mode, the carried tail of the regex mode or the automaton's state and
+    counts of the custom mode), so the next scan reads only the bytes that were appended since. The results of the
+    scans together are the same as the results of a full scan of the file.
+    The checkpoint also holds a fingerprint of the last scanned bytes, in case the file was truncated or replaced
+    it's scanned again from the beginning (and `restarted` is set)."""
+
+    def __init__(self, **kwargs):
+        """
+        :param kwargs: The FileParser arguments, and the directory of the checkpoints (ArgsConsts.CHECKPOINT_DIR).
+        """
+        self.file_parser = FileParser(**kwargs)
+        self.automaton = None
+        if self.file_parser.mode == UIConsts.CUSTOM_MODE:
+            self.automaton = AhoCorasickAutomaton.from_mapper(self.file_parser.mapper,
+                                                              self.file_parser.automaton_cache_dir)
+        self.checkpoint_dir = kwargs.get(ArgsConsts.CHECKPOINT_DIR) or IncrementalConsts.DEFAULT_CHECKPOINT_DIR
+        self.query = self._query()
+        self.checkpoint_path = self._checkpoint_path()
+        self.restarted = False
+        self.last_size = None
+
+    def scan(self, final=False):
+        """
+        This method scans the bytes that were appended since the last scan and yields the new records (in the
+        same format as FileParser.iter_records). The custom mode yields the counts of the whole file.
+        :param final: The results at the end of the file may still change (a run that will grow, a match that
+        isn't complete yet), so they are carried in the checkpoint and are not reported. A final scan reports
+        them as well, it should be used once the file is complete.
+        """
+        if self.file_parser.compressed:  # Its appended bytes aren't the appended uncompressed bytes
+            raise ValueError(Logs.COMPRESSED_INCREMENTAL_LOG)
+        checkpoint = self._load_checkpoint()
+        offset = checkpoint[IncrementalConsts.OFFSET] if checkpoint else 0
+        with open(self.file_parser.file_path, mode='rb') as f:
+            f.seek(offset)
+            blocks = iter(partial(f.read, EngineConsts.BLOCK_SIZE), b'')
+            if self.file_parser.mode == UIConsts.BASIC_MODE:
+                yield from self._scan_basic(checkpoint, offset, blocks, final)
+            elif self.file_parser.mode == UIConsts.CUSTOM_MODE:
+                yield from self._scan_custom(checkpoint, offset, blocks)
+            else:  # Regex Mode
+                yield from self._scan_regex(checkpoint, offset, blocks, final)
+
+    def poll(self):
+        """This method scans the file in case its size was changed since the last poll, so the cost of a poll
+        depends only on the size of the new data. It yields the new records"""
+        size = os.stat(self.file_parser.file_path).st_size
+        if size != self.last_size:
+            yield from self.scan()
+            self.last_size = size
+
+    def _scan_basic(self, checkpoint, offset, blocks, final):
+        """This method continues the RunLengthEngine from the checkpoint's open run"""
+        open_run = checkpoint.get(IncrementalConsts.OPEN_RUN) if checkpoint else None
+        engine = RunLengthEngine(self.file_parser.threshold, open_run=tuple(open_run) if open_run else None,
+                                 position=offset)
+        for block in blocks:
+            for run in engine.feed(block):
+                yield self.file_parser.create_basic_record(run)
+        self._save_checkpoint(engine.position, {IncrementalConsts.OPEN_RUN: engine.open_run})
+        if final:
+            for run in engine.finish():
+                yield self.file_parser.create_basic_record(run)
+
+    def _scan_regex(self, checkpoint, offset, blocks, final):
+        """This method continues the PatternStream from the checkpoint's tail"""
+        tail = bytes.fromhex(checkpoint[IncrementalConsts.TAIL]) if checkpoint else b''
+        stream = PatternStream(BytesPattern(self.file_parser.regex_pattern), tail, offset)
+        for block in blocks:
+            for offset, payload in stream.feed(block):
+                yield self.file_parser.create_regex_record(offset, payload)
+        self._save_checkpoint(stream.position, {IncrementalConsts.TAIL: stream.tail.hex()})
+        if final:
+            for offset, payload in stream.finish():
+                yield self.file_parser.create_regex_record(offset, payload)
+
+    def _scan_custom(self, checkpoint, offset, blocks):
+        """This method continues the automaton from the checkpoint's state and counts"""
+        if checkpoint:
+            scanner = AutomatonScanner(self.automaton, checkpoint[IncrementalConsts.STATE],
+                                       checkpoint[IncrementalConsts.COUNTS])
+        else:
+            scanner = self.automaton.scanner()
+        for block in blocks:
+            scanner.feed(block)
+            offset += len(block)
+        self._save_checkpoint(offset, {IncrementalConsts.STATE: scanner.state,
+                                       IncrementalConsts.COUNTS: scanner.counts})
+        yield from self.file_parser.create_custom_records(scanner.pattern_counts())
+
+    def _query(self):
+        """This method returns the arguments that the checkpoint's state depends on. The automaton's state is a
+        number that is valid only for the same automaton, so the custom mode depends on its patterns' order"""
+        patterns_digest = None
+        if self.automaton is not None:
+            patterns_digest = hashlib.sha256(b'\n'.join(pattern.hex().encode() for pattern in self.automaton.patterns))
+        return {ArgsConsts.MODE: self.file_parser.mode, ArgsConsts.THRESHOLD: self.file_parser.threshold,
+                ArgsConsts.REGEX_PATTERN: self.file_parser.regex_pattern,
+                IncrementalConsts.PATTERNS_DIGEST: patterns_digest.hexdigest() if patterns_digest else None}
+
+    def _checkpoint_path(self):
+        """This method returns the path of the checkpoint of the file and the query"""
+        key = json.dumps([os.path.realpath(self.file_parser.file_path), self.query], sort_keys=True)
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.checkpoint_dir, digest + IncrementalConsts.FILE_EXTENSION)
+
+    def _load_checkpoint(self):
+        """This method returns the checkpoint of the previous scan, or None in case the file should be scanned from
+        the beginning: There is no (valid) checkpoint, or the file was truncated or replaced since"""
+        self.restarted = False
+        try:
+            with open(self.checkpoint_path) as f:
+                checkpoint = json.load(f)
+            offset = checkpoint[IncrementalConsts.OFFSET]
+        except FileNotFoundError:
+            return None
+        except (ValueError, KeyError, TypeError, OSError):  # A corrupted checkpoint
+            return None
+        if checkpoint.get(IncrementalConsts.QUERY) != self.query:
+            return None
+        if self.automaton is not None and IncrementalConsts.COUNTS not in checkpoint:  # An older checkpoint format
+            return None
+        if offset > os.stat(self.file_parser.file_path).st_size or \
+                checkpoint.get(IncrementalConsts.FINGERPRINT) != self._fingerprint(offset):
+            self.restarted = True
+            return None
+        return checkpoint
+
+    def _save_checkpoint(self, offset, state):
+        """This method writes the checkpoint atomically, so a crashed scan leaves the previous checkpoint"""
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        checkpoint = dict(state, **{IncrementalConsts.QUERY: self.query, IncrementalConsts.OFFSET: offset,
+                                    IncrementalConsts.FINGERPRINT: self._fingerprint(offset)})
+        temp_path = self.checkpoint_path + IncrementalConsts.TEMP_SUFFIX
+        with open(temp_path, mode='w') as f:
+            json.dump(checkpoint, f)
+        os.replace(temp_path, self.checkpoint_path)
+
+    def _fingerprint(self, offset):
+        """This method hashes the last scanned bytes (up to FINGERPRINT_SIZE bytes before the offset), which
+        changes in case the file was truncated or rewritten"""
+        start = max(0, offset - IncrementalConsts.FINGERPRINT_SIZE)
+        with open(self.file_parser.file_path, mode='rb') as f:
+            f.seek(start)
+            return hashlib.sha256(f.read(offset - start)).hexdigest()
@@ -0,0 +1,147 @@
+from constants import IndexConsts
+import tempfile
+import hashlib
+import json
+import os
+
+
+class IndexCache:
+    """This class manages a directory of on-disk indexes of scanned files.
+    Every index file belongs to a (file path, index kind) pair and starts with a json header that records the
+    indexed file's size, mtime and content fingerprint. An index is used only if all of them still match the
+    file, otherwise it's deleted and built again. The directory's total size is bounded: when it grows beyond
+    the limit, the least recently used indexes are evicted."""
+
+    def __init__(self, cache_dir=None, max_size=None):
+        self.cache_dir = cache_dir or IndexConsts.DEFAULT_CACHE_DIR
+        self.max_size = max_size or IndexConsts.DEFAULT_CACHE_SIZE
+
+    def index_path(self, file_path, kind):
+        """This method returns the path of the index of the given kind for the file"""
+        digest = hashlib.sha256("{}\n{}".format(os.path.realpath(file_path), kind).encode()).hexdigest()
+        return os.path.join(self.cache_dir, digest + IndexConsts.FILE_EXTENSION)
+
+    @staticmethod
+    def file_signature(file_path):
+        """This method returns the values that identify the current content of the file: Its path, size,
+        mtime and a fingerprint. The fingerprint hashes a few sampled blocks (the beginning, the middle and
+        the end of the file), so checking an index doesn't require reading the whole file"""
+        stat = os.stat(file_path)
+        fingerprint = hashlib.sha256(str(stat.st_size).encode())
+        with open(file_path, mode='rb') as f:
+            for offset in sorted({0, max(0, stat.st_size // 2 - IndexConsts.FINGERPRINT_BLOCK_SIZE // 2),
+                                  max(0, stat.st_size - IndexConsts.FINGERPRINT_BLOCK_SIZE)}):
+                f.seek(offset)
+                fingerprint.update(f.read(IndexConsts.FINGERPRINT_BLOCK_SIZE))
+        return {IndexConsts.PATH: os.path.realpath(file_path), IndexConsts.SIZE: stat.st_size,
+                IndexConsts.MTIME: stat.st_mtime_ns, IndexConsts.FINGERPRINT: fingerprint.hexdigest()}
+
+    def lookup(self, file_path, kind):
+        """
+        This method finds a valid index of the file.
+        :return: A tuple of (index path, header, payload offset) or None in case there is no valid index.
+        The payload (the index's arrays) starts at the payload offset, which is aligned to 8 bytes.
+        """
+        index_path = self.index_path(file_path, kind)
+        try:
+            with open(index_path, mode='rb') as f:
+                if f.read(len(IndexConsts.MAGIC)) != IndexConsts.MAGIC:
+                    raise ValueError(index_path)
+                header_length = int.from_bytes(f.read(IndexConsts.HEADER_LENGTH_SIZE), 'little')
+                header = json.loads(f.read(header_length))
+        except FileNotFoundError:
+            return None
+        except (ValueError, OSError):  # A corrupted index
+            self._remove(index_path)
+            return None
+        if header.get(IndexConsts.KIND) != kind or header.get(IndexConsts.VERSION) != IndexConsts.FORMAT_VERSION \
+                or header.get(IndexConsts.SIGNATURE) != self.file_signature(file_path):
+            self._remove(index_path)  # The file was changed since it was indexed
+            return None
+        os.utime(index_path)  # The mtime of an index is its last use time, for the eviction
+        return index_path, header, self._payload_offset(header_length)
+
+    def store(self, file_path, kind, signature, header, arrays):
+        """
+        This method writes an index of the file and evicts old indexes in case the cache is too big.
+        :param signature: The file's signature (see file_signature) from the time the file was scanned
+        :param header: Index specific json values
+        :param arrays: A list of array.array objects that are written one after the other as the payload
+        :return: The path of the index or None in case it's larger than the whole cache (see store_streamed)
+        """
+        def write_payload(f):
+            for values in arrays:
+                values.tofile(f)
+            return True
+        return self.store_streamed(file_path, kind, signature, header,
+                                   sum(len(values) * values.itemsize for values in arrays), write_payload)
+
+    def store_streamed(self, file_path, kind, signature, header, payload_size, write_payload):
+        """
+        This method writes an index of the file whose payload is written by the caller, so it doesn't have to be in
+        memory, and evicts old indexes in case the cache is too big. An index that is larger than the whole cache
+        isn't written at all, since it would be evicted right away.
+        :param payload_size: The size of the payload in bytes
+        :param write_payload: A function that gets the index file, already sized and positioned at the payload's
+        start, and writes the payload (it may seek within the payload). It returns False in order to drop the
+        index instead of publishing it (E.g: in case the file was changed while it was read)
+        :return: The path of the index or None in case it's too large or dropped
+        """
+        header = json.dumps(dict(header, **{IndexConsts.KIND: kind, IndexConsts.VERSION: IndexConsts.FORMAT_VERSION,
+                                           IndexConsts.SIGNATURE: signature})).encode()
+        payload_offset = self._payload_offset(len(header))
+        if payload_offset + payload_size > self.max_size:
+            return None
+        os.makedirs(self.cache_dir, exist_ok=True)
+        index_path = self.index_path(file_path, kind)
+        padding = payload_offset - len(IndexConsts.MAGIC) - IndexConsts.HEADER_LENGTH_SIZE
+        file_descriptor, temp_path = tempfile.mkstemp(suffix=IndexConsts.TEMP_SUFFIX, dir=self.cache_dir)
+        try:  # Every writer has a temporary file of its own, the index is published only once it's complete
+            with open(file_descriptor, mode='wb') as f:
+                f.write(IndexConsts.MAGIC)
+                f.write((len(header)).to_bytes(IndexConsts.HEADER_LENGTH_SIZE, 'little'))
+                f.write(header.ljust(padding))
+                f.truncate(payload_offset + payload_size)
+                is_complete = write_payload(f)
+        except BaseException:
+            self._remove(temp_path)
+            raise
+        if not is_complete:
+            self._remove(temp_path)
+            return None
+        os.replace(temp_path, index_path)
+        self._evict(keep=index_path)
+        return index_path
+
+    def _evict(self, keep):
+        """This method removes the least recently used indexes until the cache is smaller than its limit. The
+        index to keep (the newest one) is removed too in case it's larger than the limit by itself"""
+        entries = []
+        for file_name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, file_name)
+            if file_name.endswith(IndexConsts.FILE_EXTENSION) and path != keep:
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:  # Removed by another process
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, path))
+        keep_size = os.stat(keep).st_size
+        total_size = sum(size for _, size, _ in entries) + keep_size
+        for _, size, path in sorted(entries) + [(None, keep_size, keep)]:
+            if total_size <= self.max_size:
+                break
+            self._remove(path)
+            total_size -= size
+
+    @staticmethod
+    def _payload_offset(header_length):
+        """The payload starts after the magic, the header length and the header, aligned to 8 bytes"""
+        offset = len(IndexConsts.MAGIC) + IndexConsts.HEADER_LENGTH_SIZE + header_length
+        return offset + (-offset % IndexConsts.PAYLOAD_ALIGNMENT)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,153 @@
+from constants import MetricsConsts
+from contextlib import nullcontext, contextmanager
+import tracemalloc
+import cProfile
+import pstats
+import json
+import time
+import os
+
+
+class ScanMetrics:
+    """This class is an opt-in instrumentation of a scan (FileParser's `metrics` argument).
+    It records the wall and CPU time of every phase (setup, read, scan, results and output), counters (bytes read,
+    results) and optionally the peak of the python allocations (tracemalloc) and a cProfile profile. The phases
+    are measured at block granularity and the results' count only when it's enabled, so a disabled instance
+    (DISABLED, the default of FileParser) costs nothing more than a few calls per block.
+    Please note that the phases are nested: The scan includes the read and the results that happen during it,
+    and the total includes everything."""
+
+    def __init__(self, enabled=True, trace_memory=False, profile=False):
+        self.enabled = enabled
+        self.trace_memory = trace_memory and enabled
+        self.profile = profile and enabled
+        self.phases = dict()
+        self.counters = dict()
+        self.peak_memory = None
+        self.profiler = cProfile.Profile() if self.profile else None
+
+    def phase(self, name):
+        """This method returns a context manager that adds its wall and CPU time to the phase"""
+        return _Phase(self, name) if self.enabled else _DISABLED_PHASE
+
+    def add(self, name, value=1):
+        """This method adds the value to the counter"""
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def counted(self, name, items):
+        """This method returns the items as is and counts them into the counter in case it's enabled"""
+        if not self.enabled:
+            return items
+        return self._count_items(name, items)
+
+    @contextmanager
+    def session(self):
+        """This context manager measures a whole scan: Its total time, and the peak memory and the profile in case
+        they were requested"""
+        if not self.enabled:
+            yield self
+            return
+        started_tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        elif self.trace_memory:
+            tracemalloc.reset_peak()
+        if self.profiler is not None:
+            self.profiler.enable()
+        try:
+            with self.phase(MetricsConsts.TOTAL_PHASE):
+                yield self
+        finally:
+            if self.profiler is not None:
+                self.profiler.disable()
+            if self.trace_memory:
+                self.peak_memory = max(self.peak_memory or 0, tracemalloc.get_traced_memory()[1])
+                if started_tracing:
+                    tracemalloc.stop()
+
+    def merge(self, metrics):
+        """This method adds the metrics of another scan (a dictionary from to_dict) to this one"""
+        for name, phase in metrics[MetricsConsts.PHASES].items():
+            totals = self.phases.setdefault(name, dict.fromkeys(MetricsConsts.PHASE_FIELDS, 0))
+            for field in MetricsConsts.PHASE_FIELDS:
+                totals[field] += phase[field]
+        for name, value in metrics[MetricsConsts.COUNTERS].items():
+            self.counters[name] = self.counters.get(name, 0) + value
+        if metrics[MetricsConsts.PEAK_MEMORY] is not None:
+            self.peak_memory = max(self.peak_memory or 0, metrics[MetricsConsts.PEAK_MEMORY])
+
+    def to_dict(self):
+        """This method returns the metrics as a json serializable dictionary"""
+        return {MetricsConsts.PHASES: self.phases, MetricsConsts.COUNTERS: self.counters,
+                MetricsConsts.PEAK_MEMORY: self.peak_memory}
+
+    def to_prometheus(self):
+        """This method returns the metrics in the Prometheus text exposition format (for a textfile collector)"""
+        lines = []
+        for field, metric_type, description in MetricsConsts.PROMETHEUS_PHASE_METRICS:
+            name = MetricsConsts.PROMETHEUS_PREFIX + MetricsConsts.PROMETHEUS_PHASE_NAME.format(field)
+            lines += ["# HELP {} {}".format(name, description), "# TYPE {} {}".format(name, metric_type)]
+            lines += ['{}{{phase="{}"}} {}'.format(name, phase, values[field])
+                      for phase, values in sorted(self.phases.items())]
+        for counter, value in sorted(self.counters.items()):
+            name = MetricsConsts.PROMETHEUS_PREFIX + counter + MetricsConsts.PROMETHEUS_COUNTER_SUFFIX
+            lines += ["# TYPE {} counter".format(name), "{} {}".format(name, value)]
+        if self.peak_memory is not None:
+            name = MetricsConsts.PROMETHEUS_PREFIX + MetricsConsts.PEAK_MEMORY
+            lines += ["# TYPE {} gauge".format(name), "{} {}".format(name, self.peak_memory)]
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """This method writes the metrics into the path: A Prometheus textfile in case its extension is .prom,
+        otherwise a json document. The file is replaced atomically, since collectors may read it at any time"""
+        content = self.to_prometheus() if path.endswith(MetricsConsts.PROMETHEUS_EXTENSION) \
+            else json.dumps(self.to_dict(), indent=2)
+        temp_path = path + MetricsConsts.TEMP_SUFFIX
+        with open(temp_path, mode='w') as f:
+            f.write(content)
+        os.replace(temp_path, path)
+
+    def dump_profile(self, path, other_profiles=()):
+        """This method writes the cProfile statistics (readable with pstats or snakeviz) into the path, together
+        with the statistics files of other scans (E.g: the batch mode's workers)"""
+        paths = [profile_path for profile_path in other_profiles if os.path.isfile(profile_path)]
+        if self.profiler is not None and self.profiler.getstats():
+            stats = pstats.Stats(self.profiler)
+            stats.add(*paths)
+        elif paths:
+            stats = pstats.Stats(*paths)
+        else:
+            return
+        stats.dump_stats(path)
+
+    def _record(self, name, wall_time, cpu_time):
+        phase = self.phases.setdefault(name, dict.fromkeys(MetricsConsts.PHASE_FIELDS, 0))
+        phase[MetricsConsts.WALL_TIME] += wall_time
+        phase[MetricsConsts.CPU_TIME] += cpu_time
+        phase[MetricsConsts.CALLS] += 1
+
+    def _count_items(self, name, items):
+        self.counters.setdefault(name, 0)
+        for item in items:
+            self.counters[name] = self.counters.get(name, 0) + 1
+            yield item
+
+
+class _Phase:
+    """A context manager that measures a single call of a phase"""
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.wall_start, self.cpu_start = time.perf_counter(), time.process_time()
+        return self
+
+    def __exit__(self, *args):
+        self.metrics._record(self.name, time.perf_counter() - self.wall_start, time.process_time() - self.cpu_start)
+
+
+_DISABLED_PHASE = nullcontext()
+ScanMetrics.DISABLED = ScanMetrics(enabled=False)
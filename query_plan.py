@@ -0,0 +1,48 @@
+from chunked_reader import ChunkedReader
+from utils import ProgressBarUtil
+import os
+
+
+class QueryPlan:
+    """This class answers several queries about the same file in a single read of it.
+    Every query is a streaming consumer: a pair of (feed, finish) functions, where feed(block) returns the items
+    that were found in the next block of the file and finish() returns the rest of the items once the file ended
+    (the engines carry their state across the blocks, see FileParser.create_consumer). The file is read once in
+    large blocks and every block goes through all of the consumers, so the I/O doesn't grow with the number of
+    queries."""
+
+    def __init__(self, file_path, consumers, metrics=None, create_reader=None, size=None):
+        """
+        :param create_reader: A function that gets a ProgressReporter and returns the ChunkedReader of the file
+        (E.g: over a cached mmap), the file is read in blocks of the default size by default
+        :param size: The number of bytes of the progress bar, the file's size by default (there is no default without
+        a file, so the size is unknown)
+        """
+        self.file_path = file_path
+        self.consumers = consumers
+        self.metrics = metrics
+        self.create_reader = create_reader or self._create_reader
+        self.size = size
+
+    def iter_items(self):
+        """This method reads the file and yields the items of all of the queries as they are found.
+        :rtype: Tuples of (the query's index, item)"""
+        size = self.size if self.size is not None or self.file_path is None else os.stat(self.file_path).st_size
+        with ProgressBarUtil.track(size) as progress:
+            for _, block, _ in self.create_reader(progress).iter_windows():
+                for query_index, (feed, _) in enumerate(self.consumers):
+                    for item in feed(block):
+                        yield query_index, item
+        for query_index, (_, finish) in enumerate(self.consumers):
+            for item in finish():
+                yield query_index, item
+
+    def _create_reader(self, progress):
+        return ChunkedReader(self.file_path, progress=progress, metrics=self.metrics)
+
+    def run(self):
+        """This method reads the file and returns a list with the items of every query"""
+        results = [[] for _ in self.consumers]
+        for query_index, item in self.iter_items():
+            results[query_index].append(item)
+        return results
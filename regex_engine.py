@@ -0,0 +1,143 @@
+from constants import ArgsConsts, RegexConsts
+import re
+
+
+class BytesPattern:
+    """This class compiles the regex mode's pattern once into a python `re` pattern over bytes.
+    The pattern is made of literal characters, `\\xNN` hex escapes and `X` wildcards (any byte) that
+    can appear anywhere, E.g: 'C1X\\x00XX'. The search itself runs in C, and only the matches cost
+    python code. Like the original regex mode, the matches may overlap and a match at the end of the
+    data is truncated when there are not enough bytes for its trailing wildcards."""
+
+    def __init__(self, pattern_string):
+        self.pattern_string = pattern_string
+        self.tokens = self.tokenize(pattern_string)
+        self.length = len(self.tokens)
+        self.leading_wildcards = self._count_wildcards(self.tokens)
+        self.trailing_wildcards = self._count_wildcards(reversed(self.tokens))
+        if self.leading_wildcards == self.length:
+            raise ValueError("The pattern '{}' doesn't contain any bytes".format(pattern_string))
+        self.literal_prefix = bytes(self._literal_prefix(self.tokens[self.leading_wildcards:]))
+        self.search_regex = re.compile(self._regex_body(self.tokens[self.leading_wildcards:]), re.DOTALL)
+
+    @staticmethod
+    def tokenize(pattern_string):
+        """This method splits the pattern into a list of byte values, where None stands for a wildcard.
+        A `\\xNN` sequence is a single byte (so a literal 'X' can be written as \\x58), any other character
+        is encoded as is"""
+        tokens, index = [], 0
+        while index < len(pattern_string):
+            escape = RegexConsts.HEX_ESCAPE_REGEX.match(pattern_string, index)
+            if escape:
+                tokens.append(int(escape.group(1), 16))
+                index = escape.end()
+                continue
+            character = pattern_string[index]
+            if character == ArgsConsts.REGEX_SYMBOL:
+                tokens.append(None)
+            else:
+                tokens.extend(character.encode())
+            index += 1
+        return tokens
+
+    def iter_matches(self, buffer, start=0, end=None, limit=None):
+        """
+        This method yields all of the matches that start between `start` and `end`.
+        :param buffer: Any bytes-like object (bytes, memoryview, mmap etc)
+        :param limit: The index where the data ends. The matches may read bytes up to this index, so a match
+        is truncated only if it reaches it. By default it's the end of the buffer.
+        :rtype: Tuples of (offset, length)
+        """
+        limit = len(buffer) if limit is None else limit
+        end = limit if end is None else end
+        search = self.search_regex.search
+        match = search(buffer, start + self.leading_wildcards, limit)
+        while match is not None:
+            offset = match.start() - self.leading_wildcards
+            if offset >= end:
+                return
+            yield offset, match.end() - offset
+            match = search(buffer, match.start() + 1, limit)
+
+    def match_at(self, buffer, literal_position, limit=None):
+        """This method checks a single candidate, where literal_position is the position of the pattern's first
+        literal byte (the match itself starts `leading_wildcards` bytes before it). Only the candidate's bytes
+        are read, which is what makes the indexed queries cheap.
+        :return: A tuple of (offset, length) or None in case it doesn't match"""
+        offset = literal_position - self.leading_wildcards
+        if offset < 0:
+            return None
+        match = self.search_regex.match(buffer, literal_position, len(buffer) if limit is None else limit)
+        return (offset, match.end() - offset) if match is not None else None
+
+    @staticmethod
+    def _count_wildcards(tokens):
+        """This method counts the wildcards at the beginning of the tokens"""
+        count = 0
+        for token in tokens:
+            if token is not None:
+                break
+            count += 1
+        return count
+
+    @staticmethod
+    def _literal_prefix(tokens):
+        """This method returns the byte values at the beginning of the tokens, up to the first wildcard"""
+        prefix = []
+        for token in tokens:
+            if token is None:
+                break
+            prefix.append(token)
+        return prefix
+
+    def _regex_body(self, tokens):
+        """This method converts the tokens into a regex. The trailing wildcards are optional (`.{0,n}`) so a
+        match at the end of the data is truncated, exactly like the original slicing of the payload"""
+        body, index = [], 0
+        trailing_start = len(tokens) - self.trailing_wildcards
+        while index < trailing_start:
+            if tokens[index] is None:
+                count = self._count_wildcards(tokens[index:trailing_start])
+                body.append(b'.{%d}' % count)
+                index += count
+            else:
+                literal = bytes(self._literal_prefix(tokens[index:]))
+                body.append(re.escape(literal))
+                index += len(literal)
+        if self.trailing_wildcards:
+            body.append(b'.{0,%d}' % self.trailing_wildcards)
+        return b''.join(body)
+
+
+class PatternStream:
+    """This class finds the matches of a BytesPattern in a bytes stream that is fed to it block after block.
+    A match is reported only once all of its bytes arrived, so the last `length - 1` bytes of the stream are
+    carried to the next block (the tail), and the results don't depend on the block size."""
+
+    def __init__(self, bytes_pattern, tail=b'', position=0):
+        """
+        :param tail: The carried bytes from a previous scan, the engine continues right after them.
+        :param position: The offset of the first byte that will be fed (the tail ends right before it).
+        """
+        self.bytes_pattern = bytes_pattern
+        self.tail = bytes(tail)
+        self.position = position
+
+    def feed(self, block):
+        """This method scans the next block of the stream and yields the (offset, payload) of the matches that
+        are complete. The matches that may still grow into the next block stay in the tail"""
+        data = self.tail + bytes(block)
+        base = self.position - len(self.tail)
+        self.position += len(block)
+        end = max(0, len(data) - self.bytes_pattern.length + 1)  # The matches that start before it are complete
+        for offset, length in self.bytes_pattern.iter_matches(data, 0, end):
+            yield base + offset, data[offset: offset + length]
+        self.tail = data[end:]
+
+    def finish(self):
+        """This method closes the stream and yields the matches in the tail (truncated, in case the stream ended
+        before their trailing wildcards)"""
+        base = self.position - len(self.tail)
+        for offset, length in self.bytes_pattern.iter_matches(self.tail):
+            yield base + offset, self.tail[offset: offset + length]
+        self.tail = b''
@@ -0,0 +1,77 @@
+from constants import OutputConsts, ArgsConsts, MetricsConsts
+from instrumentation import ScanMetrics
+from contextlib import nullcontext, contextmanager
+import threading
+import json
+import time
+
+
+class NDJSONWriter:
+    """This class streams records to an output stream as NDJSON (a json document per line).
+    The lines are buffered and written in chunks, and the buffer is flushed at least every FLUSH_INTERVAL
+    seconds (by a background thread while a file's records are written, since they may be sparse), so the first
+    results show up while the scan is still running. In case several processes share
+    the same output, a lock makes sure that the chunks (and therefore the lines) don't interleave."""
+
+    def __init__(self, stream, lock=None, buffer_size=OutputConsts.WRITE_BUFFER_SIZE, metrics=None):
+        """
+        :param metrics: ScanMetrics that measure the time of the writes (the output phase)
+        """
+        self.stream = stream
+        self.lock = lock if lock is not None else nullcontext()
+        self.buffer_size = buffer_size
+        self.lines = []
+        self.buffered_size = 0
+        self.last_flush_time = time.monotonic()
+        self.metrics = metrics or ScanMetrics.DISABLED
+        self.buffer_lock = threading.Lock()
+
+    def write(self, record):
+        """This method adds a record to the output"""
+        line = json.dumps(record, separators=OutputConsts.JSON_SEPARATORS)
+        with self.buffer_lock:
+            self.lines.append(line)
+            self.buffered_size += len(line) + 1
+        if self.buffered_size >= self.buffer_size or \
+                time.monotonic() - self.last_flush_time >= OutputConsts.FLUSH_INTERVAL:
+            self.flush()
+
+    def write_file_records(self, file_path, mode, records):
+        """This method writes the records of a scanned file. Every line gets the file path and the mode,
+        so the output of several files can be mixed.
+        :return: The number of records that were written"""
+        count = 0
+        with self._flushing_periodically():
+            for record in records:
+                self.write(dict({OutputConsts.FILE: file_path, ArgsConsts.MODE: mode}, **record))
+                count += 1
+        self.flush()
+        return count
+
+    def flush(self):
+        """This method writes all of the buffered lines to the output stream"""
+        with self.buffer_lock:
+            if self.lines:
+                with self.metrics.phase(MetricsConsts.OUTPUT_PHASE), self.lock:
+                    self.stream.write('\n'.join(self.lines) + '\n')
+                    self.stream.flush()
+                self.lines, self.buffered_size = [], 0
+            self.last_flush_time = time.monotonic()
+
+    @contextmanager
+    def _flushing_periodically(self):
+        """This context manager flushes the buffer from a background thread in case it wasn't flushed for
+        FLUSH_INTERVAL seconds, E.g: while the scan reads a long part of the file without any results"""
+        stopped = threading.Event()
+
+        def flush_when_due():
+            while not stopped.wait(OutputConsts.FLUSH_INTERVAL):
+                if time.monotonic() - self.last_flush_time >= OutputConsts.FLUSH_INTERVAL:
+                    self.flush()
+        flusher = threading.Thread(target=flush_when_due, daemon=True)
+        flusher.start()
+        try:
+            yield
+        finally:
+            stopped.set()
+            flusher.join()
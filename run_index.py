@@ -0,0 +1,104 @@
+from constants import IndexConsts
+from bisect import bisect_left
+from array import array
+import mmap
+
+try:
+    import numpy
+except ImportError:  # NumPy is optional, it only speeds up the sorting
+    numpy = None
+
+
+class RunLengthIndex:
+    """This class is a persistent index of the runs (repeating bytes sequences) of a file, so repeated basic mode
+    queries with different thresholds don't scan the file again.
+    The index is built during a normal basic mode scan and stored in an IndexCache. It holds compact parallel
+    arrays of all of the runs' (length, start, byte) sorted by length, so a threshold query is a binary search
+    for the first long enough run and a read of the index's tail. The file itself isn't touched (besides the
+    validation of the index's fingerprint).
+    Runs of a single byte are not indexed (there are about as many of them as bytes in the file), so the
+    index answers thresholds of MIN_THRESHOLD and above."""
+    KIND = 'runs'
+    MIN_THRESHOLD = IndexConsts.MIN_INDEXED_RUN_LENGTH - 1
+
+    def __init__(self, index_path, header, payload_offset):
+        self.runs_count = header[IndexConsts.RUNS_COUNT]
+        with open(index_path, mode='rb') as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self.buffer)
+        lengths_end = payload_offset + IndexConsts.OFFSET_SIZE * self.runs_count
+        starts_end = lengths_end + IndexConsts.OFFSET_SIZE * self.runs_count
+        self.lengths = view[payload_offset: lengths_end].cast(IndexConsts.OFFSET_TYPE)
+        self.starts = view[lengths_end: starts_end].cast(IndexConsts.OFFSET_TYPE)
+        self.values = view[starts_end: starts_end + self.runs_count]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @classmethod
+    def load(cls, file_path, cache):
+        """This method returns the valid index of the file from the cache or None in case there isn't any"""
+        found = cache.lookup(file_path, cls.KIND)
+        return cls(*found) if found is not None else None
+
+    def query(self, threshold):
+        """This method yields the (start, length, byte_value) runs that are greater than the threshold (the size of
+        a run doesn't count its first byte, like in the basic mode), in the file's order. Only the order of the
+        runs is held in memory (a number per run), they are read from the index in batches"""
+        first_index = bisect_left(self.lengths, threshold + 1)
+        if numpy is not None:
+            order = numpy.argsort(numpy.frombuffer(self.starts, dtype=numpy.uint64)[first_index:], kind='stable')
+            order += first_index
+            starts = numpy.frombuffer(self.starts, dtype=numpy.uint64)
+            lengths = numpy.frombuffer(self.lengths, dtype=numpy.uint64)
+            values = numpy.frombuffer(self.values, dtype=numpy.uint8)
+            for batch_start in range(0, len(order), IndexConsts.QUERY_BATCH_SIZE):
+                batch = order[batch_start: batch_start + IndexConsts.QUERY_BATCH_SIZE]
+                yield from zip(starts[batch].tolist(), lengths[batch].tolist(), values[batch].tolist())
+            return
+        order = array(IndexConsts.OFFSET_TYPE, sorted(range(first_index, self.runs_count),
+                                                      key=self.starts.__getitem__))
+        for index in order:
+            yield self.starts[index], self.lengths[index], self.values[index]
+
+    def close(self):
+        """This method releases the index's memory map"""
+        for view in (self.lengths, self.starts, self.values):
+            view.release()
+        self.buffer.close()
+
+    @classmethod
+    def index_runs(cls, runs, file_path, cache, threshold):
+        """
+        This method builds the file's index from a full scan of its runs.
+        It passes through the runs that are greater than the threshold and stores the index once the scan is over.
+        :param runs: All of the file's runs that are longer than a single byte, from a serial or sharded scan
+        """
+        signature = cache.file_signature(file_path)
+        lengths, starts, values = array(IndexConsts.OFFSET_TYPE), array(IndexConsts.OFFSET_TYPE), array('B')
+        for run in runs:
+            if run[1] >= IndexConsts.MIN_INDEXED_RUN_LENGTH:
+                starts.append(run[0])
+                lengths.append(run[1])
+                values.append(run[2])
+            if run[1] > threshold:
+                yield run
+        if cache.file_signature(file_path) == signature:  # The file didn't change during the scan
+            cache.store(file_path, cls.KIND, signature, {IndexConsts.RUNS_COUNT: len(lengths)},
+                        cls._sort_by_length(lengths, starts, values))
+
+    @staticmethod
+    def _sort_by_length(lengths, starts, values):
+        """This method sorts the parallel arrays by the runs' length (a stable sort, so equal lengths stay
+        in the file's order)"""
+        if numpy is not None:
+            order = numpy.argsort(numpy.frombuffer(lengths, dtype=numpy.uint64), kind='stable')
+            return [array(typecode, numpy.frombuffer(column, dtype=dtype)[order].tobytes())
+                    for column, typecode, dtype in ((lengths, IndexConsts.OFFSET_TYPE, numpy.uint64),
+                                                    (starts, IndexConsts.OFFSET_TYPE, numpy.uint64),
+                                                    (values, 'B', numpy.uint8))]
+        order = sorted(range(len(lengths)), key=lengths.__getitem__)
+        return [array(column.typecode, (column[index] for index in order)) for column in (lengths, starts, values)]
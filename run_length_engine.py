@@ -0,0 +1,139 @@
+from constants import EngineConsts
+import re
+
+try:
+    import numpy
+except ImportError:  # NumPy is optional, the pure bytes implementation is used without it
+    numpy = None
+
+
+class RunLengthEngine:
+    """This class finds repeating bytes sequences (runs) in a bytes stream that is fed to it block
+    after block. A run that crosses a block boundary stays open until a different byte shows up, so
+    the results don't depend on the block size.
+    Every run is represented as a (start, length, byte_value) tuple, E.g: (1007, 31, 0) means that the
+    byte b'\x00' appears 31 times in a row starting at offset 1007."""
+    RUN_REGEXES = [re.compile(re.escape(byte) + b'*') for byte in EngineConsts.SINGLE_BYTES]  # By the byte value
+    ZEROS_REGEX = re.compile(rb'\x00*')
+
+    def __init__(self, threshold, use_numpy=None, open_run=None, position=0):
+        """
+        :param threshold: The minimal size of a run to report. Like in the original basic mode, the size
+        of a run doesn't count its first byte, so only runs with length > threshold are reported.
+        :param use_numpy: Force (True) or disable (False) the NumPy implementation. By default NumPy is used
+        only if it's installed.
+        :param open_run: A run that is still open from a previous scan, the engine continues right after it.
+        :param position: The offset of the first byte that will be fed, in case there is no open run.
+        """
+        self.threshold = threshold
+        self.min_run_length = threshold + 1
+        self.use_numpy = numpy is not None if use_numpy is None else bool(use_numpy and numpy is not None)
+        self.open_run = open_run
+        self.position = open_run[0] + open_run[1] if open_run else position
+
+    def feed(self, block):
+        """This method scans the next block of the stream and yields all of the runs that were completed
+        in it and that are long enough. The last run of the block stays open until the next block."""
+        block_length = len(block)
+        if not block_length:
+            return
+        first_byte = block[0]
+        leading_length = self.run_length(block)
+        if self.open_run is not None and self.open_run[2] == first_byte:
+            run_start, run_length = self.open_run[0], self.open_run[1] + leading_length
+        else:
+            if self.open_run is not None and self.open_run[1] >= self.min_run_length:
+                yield self.open_run
+            run_start, run_length = self.position, leading_length
+        if leading_length == block_length:  # The whole block is a single run
+            self.open_run = (run_start, run_length, first_byte)
+            self.position += block_length
+            return
+        if run_length >= self.min_run_length:
+            yield run_start, run_length, first_byte
+        trailing_length = self._trailing_run_length(block)
+        trailing_start = block_length - trailing_length
+        yield from self._find_runs(block, leading_length, trailing_start)
+        self.open_run = (self.position + trailing_start, trailing_length, block[block_length - 1])
+        self.position += block_length
+
+    def finish(self):
+        """This method closes the stream and yields the last run in case it's long enough"""
+        if self.open_run is not None and self.open_run[1] >= self.min_run_length:
+            yield self.open_run
+        self.open_run = None
+
+    @classmethod
+    def run_length(cls, buffer, start=0, end=None):
+        """This method returns the length of the run that starts at `start` (and ends at `end` at most). The regex
+        of the run's byte repeats a single literal, so it runs in linear time over the buffer itself (E.g: a
+        memoryview or an mmap) without copying it or keeping any state per byte"""
+        end = len(buffer) if end is None else end
+        return cls.RUN_REGEXES[buffer[start]].match(buffer, start, end).end() - start
+
+    def _find_runs(self, block, begin, end):
+        """This method yields the relevant runs between begin and end. The caller guarantees that the
+        runs in this section are complete (the bytes around it are different)"""
+        if begin >= end:
+            return
+        if self.use_numpy:
+            yield from self._find_runs_numpy(block, begin, end)
+        elif self.threshold:
+            yield from self._find_long_runs(block, begin, end)
+        else:  # Every run is relevant
+            base, run_start = self.position, begin
+            while run_start < end:
+                run_length = self.run_length(block, run_start, end)
+                yield base + run_start, run_length, block[run_start]
+                run_start += run_length
+
+    def _find_long_runs(self, block, begin, end):
+        """This method finds the long runs without NumPy. It XORs the section with itself shifted by one
+        byte (as big integers), so every pair of equal neighbours becomes a zero byte, and than looks for
+        long enough zero sequences with bytes.find"""
+        section = bytes(block[begin:end])
+        section_length = len(section)
+        if section_length <= self.threshold:
+            return
+        neighbours = (int.from_bytes(section[:-1], 'big') ^ int.from_bytes(section[1:], 'big'))
+        neighbours = neighbours.to_bytes(section_length - 1, 'big')
+        zeros = EngineConsts.ZERO_BYTE * self.threshold
+        base = self.position + begin
+        location = neighbours.find(zeros)
+        while location != -1:
+            zeros_end = self.ZEROS_REGEX.match(neighbours, location + self.threshold).end()
+            yield base + location, zeros_end - location + 1, section[location]
+            location = neighbours.find(zeros, zeros_end)
+
+    def _find_runs_numpy(self, block, begin, end):
+        """This method finds the runs' boundaries with vectorized comparisons"""
+        values = numpy.frombuffer(block, dtype=numpy.uint8, count=end - begin, offset=begin)
+        if self.threshold:  # Only the pairs of equal neighbours can be a part of a relevant run
+            equal_pairs = numpy.flatnonzero(values[1:] == values[:-1])
+            if not equal_pairs.size:
+                return
+            groups = numpy.concatenate(([0], numpy.flatnonzero(numpy.diff(equal_pairs) != 1) + 1))
+            lengths = numpy.diff(numpy.append(groups, equal_pairs.size)) + 1
+            relevant = lengths >= self.min_run_length
+            starts = equal_pairs[groups[relevant]]
+        else:
+            starts = numpy.concatenate(([0], numpy.flatnonzero(values[1:] != values[:-1]) + 1))
+            lengths = numpy.diff(numpy.append(starts, values.size))
+            relevant = lengths >= self.min_run_length
+            starts = starts[relevant]
+        yield from zip((starts + (self.position + begin)).tolist(), lengths[relevant].tolist(),
+                       values[starts].tolist())
+
+    @staticmethod
+    def _trailing_run_length(block):
+        """This method returns the length of the run at the end of the block. It strips the last byte
+        from a growing tail of the block, so only the run itself is copied"""
+        block_length = len(block)
+        last_byte = bytes(block[block_length - 1:])
+        window = EngineConsts.TAIL_WINDOW
+        while True:
+            tail = bytes(block[max(0, block_length - window):])
+            run_length = len(tail) - len(tail.rstrip(last_byte))
+            if run_length < len(tail) or len(tail) == block_length:
+                return run_length
+            window *= 4
@@ -0,0 +1,106 @@
+from constants import OutputConsts, EngineConsts
+from collections.abc import Sequence
+from array import array
+
+try:
+    import numpy
+except ImportError:  # NumPy is optional, the filters and the sort fall back to pure python
+    numpy = None
+
+
+class BasicRunResults(Sequence):
+    """This class holds the basic mode's results in three parallel compact columns: The runs' starts, lengths and
+    byte values (about 17 bytes per run instead of a dictionary, a tuple and a bytes object).
+    It's a read-only sequence of the legacy records: The record of a run ({'range': (start, end), 'size': size,
+    'repeating_byte': byte}) is created only when it's accessed, and it's equal to a list of the same records.
+    The columns are `array`s, or NumPy arrays after a filter or a sort that were done with NumPy."""
+    START_TYPE = 'Q'
+    LENGTH_TYPE = 'Q'
+    BYTE_VALUE_TYPE = 'B'
+
+    def __init__(self, starts=None, lengths=None, byte_values=None):
+        self.starts = starts if starts is not None else array(self.START_TYPE)
+        self.lengths = lengths if lengths is not None else array(self.LENGTH_TYPE)
+        self.byte_values = byte_values if byte_values is not None else array(self.BYTE_VALUE_TYPE)
+
+    @classmethod
+    def from_runs(cls, runs):
+        """This method collects the (start, length, byte_value) runs of the RunLengthEngine"""
+        results = cls()
+        append_start, append_length, append_byte_value = \
+            results.starts.append, results.lengths.append, results.byte_values.append
+        for start, length, byte_value in runs:
+            append_start(start)
+            append_length(length)
+            append_byte_value(byte_value)
+        return results
+
+    @staticmethod
+    def create_record(start, length, byte_value):
+        """This method creates the basic mode's record of a run.
+        The original byte-by-byte implementation didn't count the first byte of a sequence, so the record's
+        range starts one byte after the run and its size is the run's length minus one"""
+        start, length = int(start), int(length)
+        return {OutputConsts.RANGE: (start + 1, start + length), OutputConsts.SIZE: length - 1,
+                OutputConsts.REP_BYTE: EngineConsts.SINGLE_BYTES[int(byte_value)]}
+
+    def run(self, index):
+        """This method returns the (start, length, byte_value) run of the index"""
+        return int(self.starts[index]), int(self.lengths[index]), int(self.byte_values[index])
+
+    def filter(self, min_size=None, max_size=None, repeating_byte=None):
+        """This method returns the results whose size is between min_size and max_size (inclusive) and whose
+        byte is repeating_byte (a single bytes object), in case they were given"""
+        if numpy is not None:
+            lengths = self._column(self.lengths, numpy.uint64)
+            mask = numpy.ones(len(self), dtype=bool)
+            if min_size is not None:
+                mask &= lengths >= max(min_size + 1, 0)
+            if max_size is not None:
+                mask &= lengths <= max(max_size + 1, 0)
+            if repeating_byte is not None:
+                mask &= self._column(self.byte_values, numpy.uint8) == repeating_byte[0]
+            return self._take(mask)
+        return self._take([index for index in range(len(self)) if
+                           (min_size is None or self.lengths[index] >= min_size + 1) and
+                           (max_size is None or self.lengths[index] <= max_size + 1) and
+                           (repeating_byte is None or self.byte_values[index] == repeating_byte[0])])
+
+    def sort_by_size(self, descending=True):
+        """This method returns the results sorted by their size, the runs of the same size keep the file's order"""
+        if numpy is not None:
+            lengths = self._column(self.lengths, numpy.uint64).astype(numpy.int64)
+            return self._take(numpy.argsort(-lengths if descending else lengths, kind='stable'))
+        return self._take(sorted(range(len(self)), key=self.lengths.__getitem__, reverse=descending))
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return BasicRunResults(self.starts[index], self.lengths[index], self.byte_values[index])
+        return self.create_record(self.starts[index], self.lengths[index], self.byte_values[index])
+
+    def __eq__(self, other):
+        if not isinstance(other, Sequence) or isinstance(other, (str, bytes)):
+            return NotImplemented
+        return len(self) == len(other) and all(record == other_record for record, other_record in zip(self, other))
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def _take(self, selection):
+        """This method returns the results of the selected indexes (or of a NumPy boolean mask)"""
+        if numpy is not None:
+            return BasicRunResults(self._column(self.starts, numpy.uint64)[selection],
+                                   self._column(self.lengths, numpy.uint64)[selection],
+                                   self._column(self.byte_values, numpy.uint8)[selection])
+        return BasicRunResults(array(self.START_TYPE, (self.starts[index] for index in selection)),
+                               array(self.LENGTH_TYPE, (self.lengths[index] for index in selection)),
+                               array(self.BYTE_VALUE_TYPE, (self.byte_values[index] for index in selection)))
+
+    @staticmethod
+    def _column(values, dtype):
+        return numpy.frombuffer(values, dtype=dtype) if isinstance(values, array) else values
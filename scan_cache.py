@@ -0,0 +1,74 @@
+from constants import ServiceConsts
+from aho_corasick import AhoCorasickAutomaton
+from regex_engine import BytesPattern
+from collections import OrderedDict
+import mmap
+import os
+
+
+class ScanCache:
+    """This class keeps the setup of scans warm between the queries of a long-running process (see ScanService):
+    Read-only mmaps of the scanned files and the compiled regex patterns and automatons. Both are bounded LRU
+    caches. A cached mmap is used only while the file's size, mtime and inode are unchanged, otherwise the file
+    is mapped again. FileParser uses it through its `scan_cache` argument."""
+
+    def __init__(self, max_mappings=ServiceConsts.MAPPINGS_CACHE_SIZE,
+                 max_patterns=ServiceConsts.PATTERNS_CACHE_SIZE):
+        self.max_mappings = max_mappings
+        self.max_patterns = max_patterns
+        self.mappings = OrderedDict()  # The real path -> (signature, mmap)
+        self.patterns = OrderedDict()  # The pattern string or the mapper's keys -> BytesPattern or automaton
+
+    def mapping(self, file_path):
+        """This method returns a read-only mmap of the file, or None in case the file is empty (it can't be
+        mapped). Please note that the mmap is shared by all of the scans of the file, it mustn't be closed"""
+        path = os.path.realpath(file_path)
+        stat = os.stat(path)
+        signature = (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+        cached = self.mappings.get(path)
+        if cached is not None and cached[0] == signature:
+            self.mappings.move_to_end(path)
+            return cached[1]
+        if cached is not None:
+            self._close(self.mappings.pop(path)[1])
+        if not stat.st_size:
+            return None
+        with open(path, mode='rb') as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.mappings[path] = (signature, mapping)
+        while len(self.mappings) > self.max_mappings:
+            self._close(self.mappings.popitem(last=False)[1][1])
+        return mapping
+
+    def bytes_pattern(self, pattern_string):
+        """This method returns the compiled BytesPattern of the regex mode's pattern"""
+        return self._get_or_create(pattern_string, BytesPattern, pattern_string)
+
+    def automaton(self, mapper, cache_dir=None):
+        """This method returns the AhoCorasickAutomaton of the custom mode's mapper. The automaton depends only
+        on the mapper's keys and their order, so mappers that differ only by their names share it"""
+        return self._get_or_create(tuple(mapper), AhoCorasickAutomaton.from_mapper, mapper, cache_dir)
+
+    def clear(self):
+        """This method closes all of the mmaps and drops the compiled patterns"""
+        while self.mappings:
+            self._close(self.mappings.popitem()[1][1])
+        self.patterns.clear()
+
+    def _get_or_create(self, key, create, *args):
+        key = (create.__name__, key)
+        value = self.patterns.get(key)
+        if value is not None:
+            self.patterns.move_to_end(key)
+            return value
+        value = self.patterns[key] = create(*args)
+        while len(self.patterns) > self.max_patterns:
+            self.patterns.popitem(last=False)
+        return value
+
+    @staticmethod
+    def _close(mapping):
+        try:
+            mapping.close()
+        except BufferError:  # A view of it is still alive, it's closed once it's garbage collected
+            pass
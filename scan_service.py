@@ -0,0 +1,396 @@
+from constants import ArgsConsts, UIConsts, ServiceConsts, Logs
+from chunked_reader import ScanCancelledError
+from file_parser import FileParser
+from scan_cache import ScanCache
+from utils import ValidationUtil, ProgressBarUtil
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from collections import OrderedDict
+from urllib.parse import urlsplit, parse_qs
+import multiprocessing
+import argparse
+import asyncio
+import hmac
+import signal
+import stat
+import json
+import uuid
+import sys
+import os
+
+_worker_state = dict()  # The cancel flags and the ScanCache of the current worker process (see _init_service_worker)
+
+
+class ScanJob:
+    """This class holds a job of the ScanService: Its FileParser arguments, status and records"""
+
+    def __init__(self, job_id, arguments):
+        self.id = job_id
+        self.arguments = arguments
+        self.status = ServiceConsts.QUEUED
+        self.records = None
+        self.records_size = 0  # The size of the records in json
+        self.error = None
+        self.slot = None  # The job's cancel flag while it's running
+        self.task = None
+
+    def to_dict(self, with_records=True):
+        """This method returns the job as a json serializable dictionary"""
+        job = {ServiceConsts.ID: self.id, ServiceConsts.STATUS: self.status}
+        if self.error is not None:
+            job[ServiceConsts.ERROR] = self.error
+        if with_records and self.records is not None:
+            job[ServiceConsts.RECORDS] = self.records
+        return job
+
+
+class ScanService:
+    """This class is a long-running scan service, so many small queries don't pay for the interpreter's startup
+    and a cold setup every time. It listens on a Unix socket or a localhost HTTP port and accepts jobs in the
+    same shape as the FileParser's arguments (a json object):
+    - POST /jobs submits a job and returns its id (add `?wait=1` in order to wait for its records)
+    - GET /jobs/<id> returns the job's status and records (`?wait=1` waits until it's finished)
+    - DELETE /jobs/<id> cancels the job
+    - GET /jobs lists the jobs
+    The jobs run in a pool of worker processes, at most `max_jobs` at once (the rest wait in a queue of up to
+    `max_queued_jobs`). Every worker keeps a ScanCache, so repeated queries reuse its mmaps and compiled patterns.
+    A running job is cancelled through a shared flag that the scan checks before every chunk (the sharded and
+    indexed scans check it only when they start). In case a worker process dies (E.g: it was killed for its
+    memory), the pool is replaced and its jobs are retried once.
+    The jobs can scan only the files under the `root` directory. In case there is a `token`, every request must
+    have it (`Authorization: Bearer <token>`), and requests from web pages (with an Origin header) are refused."""
+
+    def __init__(self, workers=None, max_jobs=None, max_queued_jobs=ServiceConsts.DEFAULT_QUEUED_JOBS,
+                 cache_size=ServiceConsts.MAPPINGS_CACHE_SIZE, root=None, token=None):
+        self.workers = workers or os.cpu_count()
+        self.max_jobs = max_jobs or self.workers
+        self.max_queued_jobs = max_queued_jobs
+        self.cache_size = cache_size
+        self.root = os.path.realpath(root or os.getcwd())
+        self.token = token
+        self.jobs = OrderedDict()
+        self.executor = None
+        self.semaphore = None
+        self.cancel_flags = None
+        self.free_slots = None
+
+    async def serve(self, socket_path=None, host=ServiceConsts.DEFAULT_HOST, port=ServiceConsts.DEFAULT_PORT):
+        """This method serves the jobs until it's cancelled (E.g: by CTRL + C or SIGTERM)"""
+        ValidationUtil.interactive = False
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+        self.semaphore = asyncio.Semaphore(self.max_jobs)
+        self.cancel_flags = multiprocessing.RawArray('b', self.max_jobs)
+        self.free_slots = list(range(self.max_jobs))
+        self.executor = self._create_executor()
+        try:
+            if socket_path is not None:
+                if os.path.exists(socket_path) and stat.S_ISSOCK(os.stat(socket_path).st_mode):
+                    os.remove(socket_path)  # A stale socket of a previous run
+                server = await asyncio.start_unix_server(self._handle_connection, socket_path)
+                os.chmod(socket_path, ServiceConsts.SOCKET_PERMISSIONS)
+                address = socket_path
+            else:
+                server = await asyncio.start_server(self._handle_connection, host, port)
+                address = "http://{}:{}".format(host, server.sockets[0].getsockname()[1])
+            print(Logs.SERVICE_LISTENING_LOG.format(address), file=sys.stderr, flush=True)
+            async with server:
+                await server.serve_forever()
+        finally:
+            for slot in range(self.max_jobs):
+                self.cancel_flags[slot] = 1
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            if socket_path is not None and os.path.exists(socket_path):
+                os.remove(socket_path)
+
+    def submit(self, arguments):
+        """
+        This method validates the arguments of a job and schedules it.
+        :return: A tuple of (the job or None, the HTTP status code, an error or None)
+        """
+        error = self.validate_arguments(arguments)
+        if error is not None:
+            return None, 400, error
+        if sum(job.status == ServiceConsts.QUEUED for job in self.jobs.values()) >= self.max_queued_jobs:
+            return None, 503, Logs.TOO_MANY_JOBS_LOG
+        job = ScanJob(uuid.uuid4().hex, arguments)
+        self.jobs[job.id] = job
+        job.task = asyncio.ensure_future(self._run_job(job))
+        return job, 202, None
+
+    def cancel(self, job):
+        """This method cancels a queued job at once, a running job stops before its next chunk.
+        :return: Whether the job wasn't finished yet"""
+        if job.status in ServiceConsts.FINISHED_STATUSES:
+            return False
+        if job.status == ServiceConsts.QUEUED:
+            job.task.cancel()
+        else:
+            self.cancel_flags[job.slot] = 1
+        return True
+
+    def validate_arguments(self, arguments):
+        """This method validates the arguments of a job with the same rules as the other modes (and converts
+        the threshold to a number). The paths must be under the root directory, they are replaced by their real
+        paths (so a symbolic link can't be changed to point outside of it later). The workers, shard size and
+        chunk size are bounded, so a client can't start too many processes or allocate huge buffers.
+        It returns the error or None in case they are valid"""
+        if not isinstance(arguments, dict):
+            return Logs.UNKNOWN_ARGUMENTS_LOG.format(arguments)
+        unknown_arguments = set(arguments) - set(ServiceConsts.JOB_ARGUMENTS)
+        if unknown_arguments:
+            return Logs.UNKNOWN_ARGUMENTS_LOG.format(sorted(unknown_arguments))
+        for argument in ServiceConsts.PATH_ARGUMENTS:
+            path = arguments.get(argument)
+            if path is None:
+                continue
+            if not isinstance(path, str):
+                return Logs.UNKNOWN_ARGUMENTS_LOG.format(path)
+            real_path = os.path.realpath(path)
+            if os.path.commonpath([self.root, real_path]) != self.root:
+                return Logs.PATH_OUTSIDE_ROOT_LOG.format(path)
+            arguments[argument] = real_path
+        for argument, max_value in ServiceConsts.BOUNDED_ARGUMENTS.items():  # The processes and buffers of a job
+            value = arguments.get(argument)
+            if value is not None and (not isinstance(value, int) or isinstance(value, bool) or
+                                      not 1 <= value <= max_value):
+                return Logs.ARGUMENT_OUT_OF_RANGE_LOG.format(argument, max_value)
+        ValidationUtil.last_error = None
+        if not ValidationUtil.validate_file_path(arguments.get(ArgsConsts.FILE_PATH)):
+            return ValidationUtil.last_error or Logs.MISSING_FILE_LOG.format(None)
+        queries = arguments.get(ArgsConsts.QUERIES)
+        if queries is not None and not isinstance(queries, list):
+            return Logs.UNKNOWN_ARGUMENTS_LOG.format(queries)
+        for query in queries or ():  # The queries share the rest of the job's arguments
+            unknown_arguments = set(query) - set(ServiceConsts.QUERY_ARGUMENTS) if isinstance(query, dict) else None
+            if unknown_arguments:
+                return Logs.UNKNOWN_ARGUMENTS_LOG.format(sorted(unknown_arguments))
+        for query in queries if queries is not None else [arguments]:
+            error = self._validate_query(query)
+            if error is not None:
+                return error
+        return None
+
+    @staticmethod
+    def _validate_query(query):
+        if not isinstance(query, dict):
+            return Logs.UNKNOWN_ARGUMENTS_LOG.format(query)
+        mode = query.get(ArgsConsts.MODE)
+        ValidationUtil.last_error = None
+        if mode == UIConsts.BASIC_MODE:
+            threshold = query.get(ArgsConsts.THRESHOLD)
+            is_valid = ValidationUtil.validate_threshold(None if threshold is None else str(threshold))
+            if is_valid:
+                query[ArgsConsts.THRESHOLD] = int(threshold)
+            argument = ArgsConsts.THRESHOLD
+        elif mode == UIConsts.REGEX_MODE:
+            regex_pattern = query.get(ArgsConsts.REGEX_PATTERN)
+            is_valid = ValidationUtil.validate_regex_pattern(
+                regex_pattern if isinstance(regex_pattern, str) else None)
+            argument = ArgsConsts.REGEX_PATTERN
+        elif mode == UIConsts.CUSTOM_MODE:
+            mapper = query.get(ArgsConsts.MAPPER)
+            is_valid = isinstance(mapper, dict) and \
+                ValidationUtil.validate_mapper(json.dumps(dict.fromkeys(mapper, '')))
+            argument = ArgsConsts.MAPPER
+        else:
+            return Logs.INVALID_MODE_LOG.format(UIConsts.MODE_OPTIONS)
+        for mode_argument, supported_mode in ((ArgsConsts.TOP_RUNS, UIConsts.BASIC_MODE),
+                                              (ArgsConsts.PAYLOAD_COUNTS, UIConsts.REGEX_MODE)):
+            if query.get(mode_argument) is not None and mode != supported_mode:
+                return Logs.UNSUPPORTED_MODE_ARGUMENT_LOG.format(mode_argument, supported_mode)
+        if not is_valid:
+            return ValidationUtil.last_error or Logs.MISSING_MODE_ARGUMENT_LOG.format(mode, argument)
+        return None
+
+    async def _run_job(self, job):
+        """This method runs the job in the pool once there is a free place for it"""
+        try:
+            async with self.semaphore:
+                job.slot = self.free_slots.pop()
+                self.cancel_flags[job.slot] = 0
+                job.status = ServiceConsts.RUNNING
+                try:
+                    job.records, job.records_size = await self._run_in_pool(job)
+                    job.status = ServiceConsts.DONE
+                finally:
+                    self.free_slots.append(job.slot)
+                    job.slot = None
+        except (ScanCancelledError, asyncio.CancelledError):
+            job.status = ServiceConsts.CANCELLED
+        except Exception as err:
+            job.status, job.error = ServiceConsts.FAILED, str(err)
+        self._forget_finished_jobs()
+
+    async def _run_in_pool(self, job):
+        """This method runs the job's scan in a worker process. In case the pool is broken (one of its workers
+        died), the first job that finds it out replaces the pool, and the job is retried on the new pool"""
+        for attempt in range(ServiceConsts.POOL_ATTEMPTS):
+            executor = self.executor
+            try:
+                return await asyncio.get_running_loop().run_in_executor(executor, _run_scan, job.arguments, job.slot)
+            except BrokenProcessPool:
+                if executor is self.executor:
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    self.executor = self._create_executor()
+                if attempt + 1 == ServiceConsts.POOL_ATTEMPTS:
+                    raise
+
+    def _create_executor(self):
+        """The workers are started by a fork server where it's available, since a worker that is forked from the
+        service itself inherits its open connections (and their clients never see them closed)"""
+        start_method = ServiceConsts.WORKERS_START_METHOD \
+            if ServiceConsts.WORKERS_START_METHOD in multiprocessing.get_all_start_methods() else None
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context(start_method),
+                                   initializer=_init_service_worker, initargs=(self.cancel_flags, self.cache_size))
+
+    def _forget_finished_jobs(self):
+        """This method keeps only the last MAX_FINISHED_JOBS finished jobs, and only as many of them as their
+        records fit in MAX_FINISHED_RECORDS_SIZE"""
+        finished_jobs = [job for job in self.jobs.values() if job.status in ServiceConsts.FINISHED_STATUSES]
+        records_size = sum(job.records_size for job in finished_jobs)
+        for index, job in enumerate(finished_jobs):
+            if len(finished_jobs) - index <= ServiceConsts.MAX_FINISHED_JOBS and \
+                    records_size <= ServiceConsts.MAX_FINISHED_RECORDS_SIZE:
+                break
+            del self.jobs[job.id]
+            records_size -= job.records_size
+
+    async def _handle_connection(self, reader, writer):
+        """This method answers a single HTTP request on the connection"""
+        try:
+            status, body = await self._handle_request(reader)
+        except (ValueError, asyncio.IncompleteReadError, asyncio.LimitOverrunError) as err:
+            status, body = 400, {ServiceConsts.ERROR: str(err)}
+        payload = json.dumps(body, separators=(',', ':')).encode()
+        headers = "HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n" \
+                  "Connection: close\r\n\r\n"
+        try:
+            writer.write(headers.format(status, ServiceConsts.HTTP_REASONS[status], len(payload)).encode() + payload)
+            await writer.drain()
+            writer.close()
+            await writer.wait_closed()
+        except ConnectionError:  # The client didn't wait for the response
+            pass
+
+    async def _handle_request(self, reader):
+        """This method parses an HTTP request and routes it.
+        :return: A tuple of (the status code, a json serializable body)"""
+        request_line = (await reader.readline()).decode('latin-1').split()
+        if len(request_line) != 3:
+            raise ValueError("Invalid request line")
+        method, target = request_line[0], request_line[1]
+        headers = dict()
+        while True:
+            line = (await reader.readline()).decode('latin-1')
+            if not line.strip():
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if 'origin' in headers:
+            return 403, {ServiceConsts.ERROR: Logs.BROWSER_REQUEST_LOG}
+        if self.token is not None and not hmac.compare_digest(
+                headers.get('authorization', '').encode('latin-1'),
+                (ServiceConsts.TOKEN_SCHEME + self.token).encode('latin-1', errors='replace')):
+            return 401, {ServiceConsts.ERROR: Logs.UNAUTHORIZED_LOG}
+        content_length = int(headers.get('content-length', 0))
+        if content_length > ServiceConsts.MAX_REQUEST_SIZE:
+            return 413, {ServiceConsts.ERROR: ServiceConsts.HTTP_REASONS[413]}
+        body = json.loads(await reader.readexactly(content_length)) if content_length else None
+        url = urlsplit(target)
+        wait = parse_qs(url.query).get(ServiceConsts.WAIT, ['0'])[0] not in ('0', 'false')
+        path = url.path.rstrip('/')
+        if path == ServiceConsts.JOBS_PATH:
+            if method == 'POST':
+                job, status, error = self.submit(body)
+                if job is None:
+                    return status, {ServiceConsts.ERROR: error}
+                return await self._job_response(job, wait, status)
+            if method == 'GET':
+                return 200, [job.to_dict(with_records=False) for job in self.jobs.values()]
+            return 405, {ServiceConsts.ERROR: ServiceConsts.HTTP_REASONS[405]}
+        job_id = path[len(ServiceConsts.JOBS_PATH) + 1:] if path.startswith(ServiceConsts.JOBS_PATH + '/') else None
+        job = self.jobs.get(job_id)
+        if job is None:
+            return 404, {ServiceConsts.ERROR: Logs.UNKNOWN_JOB_LOG.format(job_id or url.path)}
+        if method == 'GET':
+            return await self._job_response(job, wait)
+        if method == 'DELETE':
+            if not self.cancel(job):
+                return 409, {ServiceConsts.ERROR: Logs.JOB_FINISHED_LOG.format(job.id)}
+            return await self._job_response(job, wait)
+        return 405, {ServiceConsts.ERROR: ServiceConsts.HTTP_REASONS[405]}
+
+    @staticmethod
+    async def _job_response(job, wait, status=200):
+        if wait:
+            await asyncio.wait({job.task})
+            status = 200
+        return status, job.to_dict()
+
+
+class _CancelFlag:
+    """The cancel event of a job in a worker process: A slot of the service's shared flags array"""
+
+    def __init__(self, flags, slot):
+        self.flags = flags
+        self.slot = slot
+
+    def is_set(self):
+        return bool(self.flags[self.slot])
+
+
+def _init_service_worker(cancel_flags, cache_size):
+    """This function prepares a worker process of the service: Its warm ScanCache and the jobs' cancel flags"""
+    ProgressBarUtil.enabled = False
+    _worker_state[ServiceConsts.FLAGS] = cancel_flags
+    _worker_state[ServiceConsts.CACHE] = ScanCache(cache_size)
+
+
+def _run_scan(arguments, slot):
+    """This function runs a job in a worker process. A job whose records are larger than MAX_JOB_RECORDS_SIZE
+    (in json) fails as soon as they are, so a single job can't hold the service's memory.
+    :return: A tuple of (the json serializable records of the job (like FileParser.iter_records), their size)"""
+    arguments = dict(arguments, **{ArgsConsts.SCAN_CACHE: _worker_state[ServiceConsts.CACHE],
+                                   ArgsConsts.CANCEL_EVENT: _CancelFlag(_worker_state[ServiceConsts.FLAGS], slot)})
+    records, records_size = [], 0
+    for record in FileParser(**arguments).iter_records():
+        records_size += len(json.dumps(record, separators=(',', ':')))
+        if records_size > ServiceConsts.MAX_JOB_RECORDS_SIZE:
+            raise ValueError(Logs.TOO_MANY_RECORDS_LOG.format(ServiceConsts.MAX_JOB_RECORDS_SIZE))
+        records.append(record)
+    return records, records_size
+
+
+def main(argv=None):
+    """This function runs the scan service from the command line until it's interrupted"""
+    parser = argparse.ArgumentParser(description=ServiceConsts.DESCRIPTION)
+    parser.add_argument('--socket', help="A Unix socket to listen on (instead of the HTTP port)")
+    parser.add_argument('--host', default=ServiceConsts.DEFAULT_HOST, help="The HTTP host (localhost by default)")
+    parser.add_argument('--port', type=int, default=ServiceConsts.DEFAULT_PORT, help="The HTTP port")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Number of worker processes")
+    parser.add_argument('--max-jobs', type=int, help="Number of jobs that run at once (the workers by default)")
+    parser.add_argument('--max-queued-jobs', type=int, default=ServiceConsts.DEFAULT_QUEUED_JOBS,
+                        help="Number of jobs that can wait for a worker, more jobs are rejected")
+    parser.add_argument('--cache-size', type=int, default=ServiceConsts.MAPPINGS_CACHE_SIZE,
+                        help="Number of files that every worker keeps mapped")
+    parser.add_argument('--root', default=os.getcwd(),
+                        help="The directory of the files that the jobs can scan (the current directory by default)")
+    parser.add_argument('--token', default=os.environ.get(ServiceConsts.TOKEN_ENVIRONMENT_VARIABLE),
+                        help="A token that every request must have as `Authorization: Bearer <token>` (the {} "
+                             "environment variable by default)".format(ServiceConsts.TOKEN_ENVIRONMENT_VARIABLE))
+    namespace = parser.parse_args(argv)
+    if namespace.workers < 1 or (namespace.max_jobs is not None and namespace.max_jobs < 1):
+        parser.error(Logs.INVALID_JOBS_LOG)
+    service = ScanService(namespace.workers, namespace.max_jobs, namespace.max_queued_jobs, namespace.cache_size,
+                          namespace.root, namespace.token)
+    try:
+        asyncio.run(service.serve(namespace.socket, namespace.host, namespace.port))
+    except KeyboardInterrupt:
+        return 130
+    except asyncio.CancelledError:  # SIGTERM
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
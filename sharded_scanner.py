@@ -0,0 +1,137 @@
+from constants import EngineConsts, ShardConsts, UIConsts
+from run_length_engine import RunLengthEngine
+from aho_corasick import AutomatonScanner
+from regex_engine import BytesPattern
+from utils import ProgressBarUtil
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+import mmap
+import os
+
+_worker_state = dict()  # The mmap and the engine of the current worker process (see _init_worker)
+
+
+class ShardedScanner:
+    """This class scans a file on several cores. The file is split into byte ranges (shards), every shard
+    is scanned by a worker process over its own read-only mmap of the file (the pages are shared by the OS)
+    and the partial results are merged in the shards' order:
+    - Basic mode: the runs at the edges of the shards are stitched, so a run that spans several shards is
+    reported once, exactly like in a serial scan.
+    - Regex mode: a shard reports the matches that start in it, and it may read the following bytes in order
+    to complete a match that straddles its end.
+    - Custom mode: a shard warms the automaton up on the bytes right before it, so a key that straddles
+    its start is counted by it (and only by it)."""
+
+    def __init__(self, file_path, workers=None, shard_size=None):
+        self.file_path = file_path
+        self.file_size = os.stat(file_path).st_size
+        self.workers = workers or os.cpu_count()
+        self.shard_size = shard_size or ShardConsts.DEFAULT_SHARD_SIZE
+
+    def shards(self):
+        """This method returns the list of (start, end) byte ranges to scan"""
+        return [(start, min(start + self.shard_size, self.file_size))
+                for start in range(0, self.file_size, self.shard_size)]
+
+    def scan_basic(self, threshold):
+        """This method yields all of the runs of the file that are longer than the threshold, in order"""
+        min_run_length = threshold + 1
+        carried_run = None
+        for head_run, runs, tail_run in self._run(UIConsts.BASIC_MODE, threshold, _scan_basic_shard):
+            if carried_run is not None and carried_run[2] == head_run[2]:  # The run continues in this shard
+                carried_run = (carried_run[0], carried_run[1] + head_run[1], carried_run[2])
+            else:
+                if carried_run is not None and carried_run[1] >= min_run_length:
+                    yield carried_run
+                carried_run = head_run
+            if tail_run is None:  # The whole shard is a single run, it may continue in the next shard
+                continue
+            if carried_run[1] >= min_run_length:
+                yield carried_run
+            yield from runs
+            carried_run = tail_run
+        if carried_run is not None and carried_run[1] >= min_run_length:
+            yield carried_run
+
+    def scan_regex(self, regex_pattern):
+        """This method yields the (offset, length) of all of the matches of the regex pattern, in order"""
+        for matches in self._run(UIConsts.REGEX_MODE, regex_pattern, _scan_regex_shard):
+            yield from matches
+
+    def scan_custom(self, automaton):
+        """This method returns a dictionary with the number of appearances of every pattern of the automaton"""
+        counts = [0] * len(automaton.patterns)
+        for shard_counts in self._run(UIConsts.CUSTOM_MODE, automaton, _scan_custom_shard):
+            counts = [count + shard_count for count, shard_count in zip(counts, shard_counts)]
+        return AutomatonScanner(automaton, counts=counts).pattern_counts()
+
+    def _run(self, mode, argument, shard_function):
+        """This method scans the shards in a process pool and yields the partial results in the shards' order.
+        Only a few shards per worker are submitted ahead, so the results that wait to be merged are bounded"""
+        shards = self.shards()
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(shards)) or 1, initializer=_init_worker,
+                                 initargs=(self.file_path, mode, argument)) as executor, \
+                ProgressBarUtil.track(self.file_size) as progress:
+            futures = deque()
+            for shard in shards:
+                futures.append((shard, executor.submit(shard_function, shard)))
+                if len(futures) >= self.workers * ShardConsts.SHARDS_AHEAD_PER_WORKER:
+                    yield self._shard_result(futures.popleft(), progress)
+            while futures:
+                yield self._shard_result(futures.popleft(), progress)
+
+    @staticmethod
+    def _shard_result(submitted_shard, progress):
+        """This method waits for the result of a submitted shard"""
+        (start, end), future = submitted_shard
+        result = future.result()
+        progress.advance(end - start)
+        return result
+
+
+def _init_worker(file_path, mode, argument):
+    """This function prepares a worker process: It maps the file and creates the engine of the mode"""
+    with open(file_path, mode='rb') as f:
+        _worker_state[ShardConsts.BUFFER] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if mode == UIConsts.REGEX_MODE:
+        argument = BytesPattern(argument)
+    _worker_state[ShardConsts.ENGINE_ARGUMENT] = argument
+
+
+def _scan_basic_shard(shard):
+    """This function scans a shard in the basic mode.
+    :return: A tuple of (head run, complete runs, tail run). The head and tail runs are returned regardless
+    of the threshold since they may continue in the neighbour shards. In case the whole shard is a single run,
+    the tail run is None."""
+    start, end = shard
+    buffer, threshold = _worker_state[ShardConsts.BUFFER], _worker_state[ShardConsts.ENGINE_ARGUMENT]
+    head_length = RunLengthEngine.run_length(buffer, start, end)
+    head_run = (start, head_length, buffer[start])
+    if start + head_length == end:
+        return head_run, [], None
+    engine = RunLengthEngine(threshold, position=start + head_length)
+    runs, view = [], memoryview(buffer)
+    for block_start in range(start + head_length, end, EngineConsts.BLOCK_SIZE):
+        runs.extend(engine.feed(view[block_start: min(block_start + EngineConsts.BLOCK_SIZE, end)]))
+    return head_run, runs, engine.open_run
+
+
+def _scan_regex_shard(shard):
+    """This function returns the list of the matches that start in the shard"""
+    start, end = shard
+    buffer, bytes_pattern = _worker_state[ShardConsts.BUFFER], _worker_state[ShardConsts.ENGINE_ARGUMENT]
+    limit = min(len(buffer), end + bytes_pattern.length - 1)
+    return list(bytes_pattern.iter_matches(buffer, start, end, limit))
+
+
+def _scan_custom_shard(shard):
+    """This function counts the automaton's matches that end in the shard.
+    :return: The scanner's counts (by the patterns' order), they are summed by the caller"""
+    start, end = shard
+    buffer, automaton = _worker_state[ShardConsts.BUFFER], _worker_state[ShardConsts.ENGINE_ARGUMENT]
+    view = memoryview(buffer)
+    scanner = AutomatonScanner(automaton)
+    scanner.feed(view[max(0, start - automaton.max_pattern_length + 1): start])
+    scanner.reset_counts()
+    scanner.feed(view[start: end])
+    return scanner.counts
@@ -0,0 +1,79 @@
+from aho_corasick import AhoCorasickAutomaton, AutomatonScanner
+from constants import AutomatonConsts
+from itertools import product
+import unittest
+import tempfile
+import random
+import os
+
+
+class AutomatonScannerTest(unittest.TestCase):
+    BLOCK_SIZES = [1, 2, 3, 5, 8, 64]
+
+    @staticmethod
+    def _reference_counts(patterns, content):
+        """This method counts the (overlapping) appearances of every pattern by comparing it at every offset"""
+        return {pattern: sum(content.startswith(pattern, offset) for offset in range(len(content)))
+                for pattern in patterns}
+
+    @staticmethod
+    def _random_content(alphabet, size, seed):
+        rng = random.Random(seed)
+        return bytes(rng.choice(alphabet) for _ in range(size))
+
+    def _assert_same_counts(self, automaton, content):
+        """This method feeds the content in blocks of every size, as bytes and as memoryview slices"""
+        expected_counts = self._reference_counts(automaton.patterns, content)
+        for block_size in self.BLOCK_SIZES + [max(1, len(content))]:
+            for as_view in [False, True]:
+                with self.subTest(block_size=block_size, as_view=as_view):
+                    scanner, view = automaton.scanner(), memoryview(content) if as_view else content
+                    for start in range(0, len(content), block_size):
+                        scanner.feed(view[start: start + block_size])
+                    self.assertEqual(scanner.pattern_counts(), expected_counts)
+
+    def test_find_path(self):
+        """A small patterns set is counted by `find` loops, and the matches that cross the boundaries by the state"""
+        automaton = AhoCorasickAutomaton([b'AB', b'BAB', b'ABABA', b'B', b'CAAB', b'AAAAAAA'])
+        self.assertIsNotNone(automaton.state_prefixes)
+        self._assert_same_counts(automaton, self._random_content(b'ABC', 1500, 1))
+        self._assert_same_counts(automaton, b'A' * 40 + b'BABABAB' + b'CAAB' * 5)
+
+    def test_table_path_with_skips(self):
+        """Many patterns that start with a few byte values are counted by the table, which skips the other bytes"""
+        patterns = [bytes(pattern) for length in [2, 3] for pattern in product(b'ABC', repeat=length)]
+        automaton = AhoCorasickAutomaton(patterns + [b'ABCABCA'])
+        self.assertGreater(len(automaton.patterns), AutomatonConsts.MAX_FIND_PATTERNS)
+        self.assertIsNotNone(automaton.start_bytes_regex)
+        self._assert_same_counts(automaton, self._random_content(b'ABCDEFGH', 1500, 2))
+
+    def test_table_path(self):
+        alphabet = bytes(range(AutomatonConsts.MAX_SKIPPABLE_START_BYTES + 4))
+        automaton = AhoCorasickAutomaton([bytes([first, second]) for first in alphabet for second in alphabet[:2]] +
+                                         [b'\x00\x01\x00\x01\x00'])
+        self.assertIsNone(automaton.start_bytes_regex)
+        self.assertIsNone(automaton.state_prefixes)
+        self._assert_same_counts(automaton, self._random_content(alphabet[:4], 1500, 3))
+
+    def test_continued_scan(self):
+        """A scanner that continues from another one's state and counts (the checkpoints) gets the same counts"""
+        automaton = AhoCorasickAutomaton([b'AB', b'BAB', b'ABABA'])
+        content = self._random_content(b'AB', 200, 4)
+        scanner = automaton.scanner()
+        scanner.feed(content[:101])
+        continued_scanner = AutomatonScanner(automaton, scanner.state, scanner.counts)
+        continued_scanner.feed(content[101:])
+        self.assertEqual(continued_scanner.pattern_counts(), self._reference_counts(automaton.patterns, content))
+
+    def test_saved_automaton(self):
+        automaton = AhoCorasickAutomaton([b'AB', b'BAB', b'ABABA'])
+        with tempfile.TemporaryDirectory() as cache_dir:
+            path = os.path.join(cache_dir, 'automaton' + AutomatonConsts.FILE_EXTENSION)
+            automaton.save(path)
+            loaded_automaton = AhoCorasickAutomaton.load(path)
+        self.assertEqual(loaded_automaton.patterns, automaton.patterns)
+        self._assert_same_counts(loaded_automaton, self._random_content(b'AB', 300, 5))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+from chunked_reader import ChunkedReader
+from file_parser import FileParser
+from constants import ArgsConsts, UIConsts, OutputConsts
+import unittest
+import tempfile
+import random
+import io
+import os
+
+
+class ChunkedReaderTest(unittest.TestCase):
+    CHUNK_SIZES = [1, 2, 3, 5, 8]
+
+    def setUp(self):
+        rng = random.Random(3)
+        self.content = bytes(rng.choice(b'AAB') for _ in range(500))
+        file_descriptor, self.file_path = tempfile.mkstemp()
+        with open(file_descriptor, mode='wb') as f:
+            f.write(self.content)
+
+    def tearDown(self):
+        os.remove(self.file_path)
+
+    def _inputs(self):
+        """This method returns the arguments of a FileParser for every kind of input: A file, a buffer and a stream"""
+        return {'file': {ArgsConsts.FILE_PATH: self.file_path}, 'buffer': {ArgsConsts.BUFFER: self.content},
+                'stream': {ArgsConsts.STREAM: io.BytesIO(self.content)}}
+
+    def test_windows(self):
+        """Every window starts with the overlap of the previous one, and together they hold the whole content"""
+        for chunk_size in self.CHUNK_SIZES:
+            for overlap in [0, 1, 3]:
+                for input_name, arguments in self._inputs().items():
+                    with self.subTest(chunk_size=chunk_size, overlap=overlap, input=input_name):
+                        reader = ChunkedReader(arguments.get(ArgsConsts.FILE_PATH), chunk_size, overlap,
+                                               buffer=arguments.get(ArgsConsts.BUFFER),
+                                               stream=arguments.get(ArgsConsts.STREAM))
+                        content, finals = b'', []
+                        for offset, window, final in reader.iter_windows():
+                            self.assertEqual(bytes(window), self.content[offset: offset + len(window)])
+                            self.assertLessEqual(len(window), chunk_size + overlap)
+                            content = content[:offset] + bytes(window)
+                            finals.append(final)
+                        self.assertEqual(content, self.content)
+                        self.assertEqual(finals[-1:], [True])
+                        self.assertNotIn(True, finals[:-1])
+
+    def test_regex_mode(self):
+        """A match that crosses a chunk boundary is found exactly once"""
+        pattern_string = 'ABXAX'
+        expected_matches = [(offset, min(5, len(self.content) - offset)) for offset in range(len(self.content) - 3)
+                            if self.content[offset: offset + 2] == b'AB' and self.content[offset + 3] == ord('A')]
+        for chunk_size in self.CHUNK_SIZES:
+            for input_name, arguments in self._inputs().items():
+                with self.subTest(chunk_size=chunk_size, input=input_name):
+                    results = FileParser(**dict(arguments, **{ArgsConsts.MODE: UIConsts.REGEX_MODE,
+                                                              ArgsConsts.REGEX_PATTERN: pattern_string,
+                                                              ArgsConsts.CHUNK_SIZE: chunk_size,
+                                                              ArgsConsts.PAYLOADS: False})).parse_file_and_calculate()
+                    self.assertEqual(results[OutputConsts.RESULTS], expected_matches)
+
+    def test_custom_mode(self):
+        """An appearance that crosses a chunk boundary is counted exactly once"""
+        mapper = {b'AB'.hex(): 'AB', b'BAAB'.hex(): 'BAAB', b'AAAA'.hex(): 'AAAA'}
+        expected_counts = {name: sum(self.content.startswith(bytes.fromhex(key), offset)
+                                     for offset in range(len(self.content))) for key, name in mapper.items()}
+        for chunk_size in self.CHUNK_SIZES:
+            for input_name, arguments in self._inputs().items():
+                with self.subTest(chunk_size=chunk_size, input=input_name):
+                    results = FileParser(**dict(arguments, **{ArgsConsts.MODE: UIConsts.CUSTOM_MODE,
+                                                              ArgsConsts.MAPPER: mapper,
+                                                              ArgsConsts.CHUNK_SIZE: chunk_size})
+                                         ).parse_file_and_calculate()
+                    self.assertEqual(results[OutputConsts.RESULTS], expected_counts)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+from regex_engine import BytesPattern, PatternStream
+import unittest
+import random
+
+
+class PatternStreamTest(unittest.TestCase):
+    BLOCK_SIZES = [1, 2, 3, 5, 8, 64]
+    PATTERNS = ['AB', 'ABA', 'AXB', 'XXAB', 'ABXX', 'XAXBX', 'A\\x42XA', 'AAAA']
+
+    @staticmethod
+    def _reference_matches(pattern_string, content):
+        """This method compares the pattern's tokens at every offset of the content. A match may be truncated by the
+        end of the content only in its trailing wildcards"""
+        tokens = BytesPattern.tokenize(pattern_string)
+        required_length = len(tokens)
+        while tokens[required_length - 1] is None:
+            required_length -= 1
+        matches = []
+        for offset in range(len(content) - required_length + 1):
+            if all(token is None or content[offset + index] == token
+                   for index, token in enumerate(tokens[:required_length])):
+                matches.append((offset, content[offset: offset + len(tokens)]))
+        return matches
+
+    @staticmethod
+    def _scan(bytes_pattern, content, block_size):
+        stream, matches = PatternStream(bytes_pattern), []
+        for start in range(0, len(content), block_size):
+            matches.extend(stream.feed(memoryview(content)[start: start + block_size]))
+        return matches + list(stream.finish())
+
+    def _assert_same_matches(self, content):
+        for pattern_string in self.PATTERNS:
+            expected_matches = self._reference_matches(pattern_string, content)
+            bytes_pattern = BytesPattern(pattern_string)
+            with self.subTest(pattern=pattern_string):
+                self.assertEqual([(offset, content[offset: offset + length]) for offset, length in
+                                  bytes_pattern.iter_matches(content)], expected_matches)
+            for block_size in self.BLOCK_SIZES:
+                with self.subTest(pattern=pattern_string, block_size=block_size):
+                    self.assertEqual(self._scan(bytes_pattern, content, block_size), expected_matches)
+
+    def test_random_content(self):
+        """Overlapping matches that cross the blocks' boundaries are found once, with their full payloads"""
+        rng = random.Random(11)
+        self._assert_same_matches(bytes(rng.choice(b'AAB') for _ in range(600)))
+
+    def test_truncated_matches(self):
+        """A match at the end of the stream is truncated in its trailing wildcards only"""
+        self._assert_same_matches(b'BAAAABAB')
+        self._assert_same_matches(b'AB')
+        self._assert_same_matches(b'A')
+
+    def test_continued_stream(self):
+        """A stream that continues from another one's tail (the checkpoints) finds the same matches"""
+        bytes_pattern, content = BytesPattern('ABXX'), b'BABABBABAB'
+        stream = PatternStream(bytes_pattern)
+        matches = list(stream.feed(content[:5]))
+        continued_stream = PatternStream(bytes_pattern, stream.tail, stream.position)
+        matches += list(continued_stream.feed(content[5:])) + list(continued_stream.finish())
+        self.assertEqual(matches, self._reference_matches('ABXX', content))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+from run_length_engine import RunLengthEngine, numpy
+from itertools import groupby
+import unittest
+import random
+
+
+class RunLengthEngineTest(unittest.TestCase):
+    BLOCK_SIZES = [1, 2, 3, 5, 8, 64]
+
+    @staticmethod
+    def _reference_runs(content, threshold):
+        """This method returns the runs of the content by a plain loop over its bytes"""
+        runs, start = [], 0
+        for byte_value, group in groupby(content):
+            length = len(list(group))
+            if length > threshold:
+                runs.append((start, length, byte_value))
+            start += length
+        return runs
+
+    @staticmethod
+    def _scan(content, threshold, block_size, use_numpy):
+        """This method feeds the content to the engine in blocks (memoryview slices, like the ChunkedReader's)"""
+        engine, view, runs = RunLengthEngine(threshold, use_numpy), memoryview(content), []
+        for start in range(0, len(content), block_size):
+            runs.extend(engine.feed(view[start: start + block_size]))
+        return runs + list(engine.finish())
+
+    def _assert_same_runs(self, content, threshold):
+        expected_runs = self._reference_runs(content, threshold)
+        for use_numpy in [False, True] if numpy is not None else [False]:
+            for block_size in self.BLOCK_SIZES + [max(1, len(content))]:
+                with self.subTest(use_numpy=use_numpy, block_size=block_size):
+                    self.assertEqual(self._scan(content, threshold, block_size, use_numpy), expected_runs)
+
+    def test_runs_across_blocks(self):
+        """Runs that start, end or fill whole blocks are reported once, with their full length"""
+        content = b'\x00' * 17 + b'\x01\x02\x02\x02' + b'\xff' * 9 + b'\x03' + b'\x00' * 4 + b'\x04' * 23
+        for threshold in [0, 2, 3, 8, 16]:
+            self._assert_same_runs(content, threshold)
+
+    def test_random_content(self):
+        rng = random.Random(7)
+        content = bytes(rng.choice(b'\x00\x00\x00\x01\x02') for _ in range(2000))
+        for threshold in [0, 1, 3]:
+            self._assert_same_runs(content, threshold)
+
+    def test_single_run(self):
+        self._assert_same_runs(b'\x07' * 100, 10)
+        self._assert_same_runs(b'\x07', 0)
+        self._assert_same_runs(b'', 0)
+
+    def test_continued_run(self):
+        """An engine that continues an open run (the incremental scans) finds the same runs as a single engine"""
+        content = b'\x01\x01\x05' + b'\x06' * 12 + b'\x07'
+        engine = RunLengthEngine(3)
+        first_runs = list(engine.feed(content[:8]))
+        continued_engine = RunLengthEngine(3, open_run=engine.open_run)
+        runs = first_runs + list(continued_engine.feed(content[8:])) + list(continued_engine.finish())
+        self.assertEqual(runs, self._reference_runs(content, 3))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+from run_length_engine import RunLengthEngine
+from sharded_scanner import ShardedScanner
+import unittest
+import tempfile
+import os
+
+
+class ShardedScannerTest(unittest.TestCase):
+    SHARD_SIZE = 1024 * 1024
+
+    def setUp(self):
+        file_descriptor, self.file_path = tempfile.mkstemp()
+        os.close(file_descriptor)
+
+    def tearDown(self):
+        os.remove(self.file_path)
+
+    def _scan(self, content, threshold):
+        """This method returns the runs of a sharded scan and of a serial scan of the content"""
+        with open(self.file_path, mode='wb') as f:
+            f.write(content)
+        sharded_runs = list(ShardedScanner(self.file_path, 2, self.SHARD_SIZE).scan_basic(threshold))
+        engine = RunLengthEngine(threshold)
+        serial_runs = list(engine.feed(content)) + list(engine.finish())
+        return sharded_runs, serial_runs
+
+    def test_shard_of_a_single_run(self):
+        """A run that fills whole shards is stitched into a single run, and its head run is found in linear time"""
+        content = b'\x01\x02' + bytes(3 * self.SHARD_SIZE) + b'\x03' + b'\xff' * (self.SHARD_SIZE + 5)
+        sharded_runs, serial_runs = self._scan(content, 0)
+        self.assertEqual(sharded_runs, serial_runs)
+        self.assertIn((2, 3 * self.SHARD_SIZE, 0), sharded_runs)
+        self.assertEqual(sharded_runs[-1], (3 * self.SHARD_SIZE + 3, self.SHARD_SIZE + 5, 0xff))
+
+    def test_file_of_a_single_run(self):
+        content = bytes(4 * self.SHARD_SIZE)
+        sharded_runs, serial_runs = self._scan(content, 10)
+        self.assertEqual(sharded_runs, [(0, len(content), 0)])
+        self.assertEqual(sharded_runs, serial_runs)
+
+    def test_run_length(self):
+        buffer = memoryview(b'\x07' * 100 + b'\x00' * 50)
+        self.assertEqual(RunLengthEngine.run_length(buffer), 100)
+        self.assertEqual(RunLengthEngine.run_length(buffer, 100), 50)
+        self.assertEqual(RunLengthEngine.run_length(buffer, 10, 60), 50)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,8 @@
-from constants import COLORS, Logs, ArgsConsts, UIConsts
-from time import sleep
+from constants import COLORS, Logs, UIConsts
+from regex_engine import BytesPattern
+from compressed_input import CompressedInput
+from time import sleep, monotonic
+import threading
 import json
 import sys
 import os
@@ -32,38 +35,48 @@ class PrintUtils:
 
 class ValidationUtil(object):
     """This class contain all of the arguments' validators"""
+    interactive = True  # The batch mode turns it off, so the validators don't print or pause
+    last_error = None
 
     @classmethod
     def _handle_invalid_arguments(cls, log_to_print):
-        """This method handle cases of invalid arguments. Print the log, pauses the script
-        and returns False"""
-        print(PrintUtils.warning_format(log_to_print))
-        sleep(2)
+        """This method handle cases of invalid arguments. Saves the log as the last error and in the
+        interactive mode it prints the log and pauses the script. It always returns False"""
+        cls.last_error = log_to_print
+        if cls.interactive:
+            print(PrintUtils.warning_format(log_to_print))
+            sleep(2)
         return False
 
     @classmethod
     def validate_regex_pattern(cls, regex_pattern):
         """This method validates the regex pattern that was received from the user.
-        It should be in the expected structure 'relevant-bytes-prefixXXXX'. E.g: \x01XX"""
+        It's a sequence of bytes and 'X' symbols (any byte) in any order, E.g: \x01XX or AXB\x00X"""
         if regex_pattern is None:
             return False
         if len(regex_pattern) < 2:
             return cls._handle_invalid_arguments(Logs.SHORT_REGEX_PATTERN_ERROR)
-        elif regex_pattern[-1] != ArgsConsts.REGEX_SYMBOL:
-            return cls._handle_invalid_arguments(Logs.REGEX_INVALID_SUFFIX_ERROR)
-        elif ''.join(set(regex_pattern)) == ArgsConsts.REGEX_SYMBOL:
+        elif all(token is None for token in BytesPattern.tokenize(regex_pattern)):
             return cls._handle_invalid_arguments(Logs.INVALID_REGEX_STRUCTURE_ERROR)
         return True
 
     @classmethod
     def validate_file_path(cls, file_path):
-        """This method validates the file path that was retrieved from the user"""
+        """This method validates the file path that was retrieved from the user. A compressed file (gzip, bz2 or
+        xz) is valid in case its first bytes can be decompressed and it isn't empty once it's decompressed"""
         if file_path is None:
             return False
         elif not os.path.isfile(file_path):
             return cls._handle_invalid_arguments(Logs.MISSING_FILE_LOG.format(file_path))
         elif os.stat(file_path).st_size == 0:
             return cls._handle_invalid_arguments(Logs.EMPTY_FILE_LOG.format(file_path))
+        elif CompressedInput.detect(file_path) is not None:
+            try:
+                with CompressedInput(file_path) as compressed_input:
+                    if not compressed_input.readinto(bytearray(1)):
+                        return cls._handle_invalid_arguments(Logs.EMPTY_FILE_LOG.format(file_path))
+            except CompressedInput.ERRORS as err:
+                return cls._handle_invalid_arguments(Logs.INVALID_COMPRESSED_FILE_LOG.format(file_path, err))
         return True
 
     @classmethod
@@ -107,7 +120,8 @@ class ValidationUtil(object):
         invalid_hex_values = []
         for key in dict_to_check:
             try:
-                bytes.fromhex(key)
+                if not bytes.fromhex(key):
+                    invalid_hex_values.append(key)
             except ValueError:
                 invalid_hex_values.append(key)
         if len(invalid_hex_values) > 0:
@@ -119,13 +133,79 @@ class ProgressBarUtil:
     """This class responsible on progress bar during the calculations"""
     MAX_NUMBER_OF_SYMBOL = 50
     PROGRESS_SYMBOL = '='
+    REFRESH_INTERVAL = 0.25
+    INDETERMINATE_SYMBOLS = 10
+    BYTES_PER_MB = 1024 * 1024
+    enabled = True  # The batch mode turns it off since its output is parsed by other programs
+
+    @classmethod
+    def track(cls, total_bytes):
+        """This method returns a ProgressReporter for a scan of total_bytes bytes (use it as a context manager),
+        total_bytes is None in case the size is unknown. The bar is shown only if it's enabled and the stdout is a
+        terminal, otherwise the reporter only counts"""
+        return ProgressReporter(total_bytes, cls.enabled and sys.stdout.isatty())
+
+    @classmethod
+    def format_progress(cls, position, total_bytes, elapsed_time):
+        """This method returns the progress bar line with the throughput and the estimated time left. In case the
+        total is unknown (None, E.g: a stream) the bar is indeterminate and shows the bytes read instead"""
+        speed = position / elapsed_time if elapsed_time > 0 else 0
+        if total_bytes is None:
+            return "\r[%-50s] %.1f MB read %.1f MB/s  " % (cls._indeterminate_bar(elapsed_time),
+                                                           position / cls.BYTES_PER_MB, speed / cls.BYTES_PER_MB)
+        current_chunk = min(position * cls.MAX_NUMBER_OF_SYMBOL // total_bytes, cls.MAX_NUMBER_OF_SYMBOL) \
+            if total_bytes else cls.MAX_NUMBER_OF_SYMBOL
+        eta = "%ds" % ((total_bytes - position) / speed) if speed else "?"
+        return "\r[%-50s] %d%% %.1f MB/s ETA %s  " % (cls.PROGRESS_SYMBOL * current_chunk, 2 * current_chunk,
+                                                        speed / cls.BYTES_PER_MB, eta)
 
     @classmethod
-    def make_progress(cls, current_index, max_index):
-        """This module responsible on the progress bar print"""
-        chunk_size = int(max_index / cls.MAX_NUMBER_OF_SYMBOL)
-        if chunk_size and current_index % chunk_size == 0:
-            current_chunk = (current_index//chunk_size)
-            sys.stdout.write('\r')
-            sys.stdout.write("[%-50s] %d%%" % (cls.PROGRESS_SYMBOL * current_chunk, min(2 * current_chunk, 100)))
-            sys.stdout.flush()
+    def _indeterminate_bar(cls, elapsed_time):
+        """This method returns the bar of an unknown total: a block of symbols that moves back and forth"""
+        steps = cls.MAX_NUMBER_OF_SYMBOL - cls.INDETERMINATE_SYMBOLS
+        step = int(elapsed_time / cls.REFRESH_INTERVAL) % (2 * steps)
+        return ' ' * min(step, 2 * steps - step) + cls.PROGRESS_SYMBOL * cls.INDETERMINATE_SYMBOLS
+
+
+class ProgressReporter:
+    """This class reports the progress of a scan without slowing it down. The engines only advance a bytes
+    counter once per block, and a background thread draws the bar every REFRESH_INTERVAL seconds"""
+
+    def __init__(self, total_bytes, visible=True):
+        self.total_bytes = total_bytes
+        self.visible = visible
+        self.position = 0
+        self.start_time = monotonic()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        if self.visible:
+            self._thread = threading.Thread(target=self._report, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def advance(self, bytes_count):
+        """This method adds the bytes that were scanned to the counter"""
+        self.position += bytes_count
+
+    def stop(self):
+        """This method stops the background thread and draws the final state of the bar"""
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._thread.join()
+        self._thread = None
+        self._draw()
+
+    def _report(self):
+        while not self._stopped.wait(ProgressBarUtil.REFRESH_INTERVAL):
+            self._draw()
+
+    def _draw(self):
+        sys.stdout.write(ProgressBarUtil.format_progress(self.position, self.total_bytes,
+                                                         monotonic() - self.start_time))
+        sys.stdout.flush()